@@ -0,0 +1,171 @@
+"""
+平台数据层（dalian_core）基准测试：在不同数据规模下无界面运行，测量数据加载、地图构建、点击定位与 CAS 查询的耗时，
+结果以 JSON 行追加到 benchmarks/results.jsonl，并与同一规模的上一次结果对比。
+
+    python benchmarks/bench_app.py                      # 默认 small、medium 两档
+    python benchmarks/bench_app.py --tiers large --repeat 5
+"""
+import argparse
+import json
+import os
+import platform
+import shutil
+import statistics
+import subprocess
+import sys
+import time
+from datetime import datetime
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+ROOT = os.path.dirname(HERE)
+sys.path.insert(0, ROOT)
+sys.path.insert(0, HERE)
+
+import numpy as np  # noqa: E402
+import pandas as pd  # noqa: E402
+
+import dalian_core as core  # noqa: E402
+from synthetic import write_workbooks  # noqa: E402
+
+TIERS = {
+    "small": dict(sites=250, params=80, compounds=2000),
+    "medium": dict(sites=5000, params=80, compounds=20000),
+    "large": dict(sites=50000, params=80, compounds=100000),
+}
+RESULTS_FILE = os.path.join(HERE, "results.jsonl")
+DATA_DIR = os.path.join(HERE, "data")
+N_CLICKS = 1000
+N_LOOKUPS = 1000
+
+
+def measure(func, repeat):
+    """重复执行 func，返回各次耗时（毫秒）的最小值、中位数与最后一次的返回值"""
+    times, result = [], None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = func()
+        times.append((time.perf_counter() - start) * 1000)
+    return {"min_ms": round(min(times), 3), "median_ms": round(statistics.median(times), 3)}, result
+
+
+def git_commit():
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], cwd=ROOT, capture_output=True,
+                              text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def load_concentration(path):
+    return core.get_dataset("concentration", path, core.read_concentration_cached)
+
+
+def load_cas(path):
+    return core.get_dataset("cas", path, core.parse_cas_workbook)
+
+
+def run_tier(name, config, repeat, seed):
+    conc_path, tox_path = write_workbooks(DATA_DIR, config["sites"], config["params"], config["compounds"], seed=seed)
+    cache_dir = os.path.join(os.path.dirname(os.path.abspath(conc_path)), core.CACHE_DIR)
+    results = {}
+
+    def cold_concentration():
+        core.invalidate_dataset("concentration")
+        shutil.rmtree(cache_dir, ignore_errors=True)
+        return load_concentration(conc_path).frame
+
+    def sidecar_concentration():
+        core.invalidate_dataset("concentration")
+        return load_concentration(conc_path).frame
+
+    def cold_cas():
+        core.invalidate_dataset("cas")
+        return load_cas(tox_path).frame
+
+    results["load_concentration_data[excel]"], _ = measure(cold_concentration, repeat)
+    results["load_concentration_data[sidecar]"], _ = measure(sidecar_concentration, repeat)
+    results["load_concentration_data[shared]"], df = measure(lambda: load_concentration(conc_path).frame, repeat)
+    results["load_cas_data[excel]"], _ = measure(cold_cas, repeat)
+    results["load_cas_data[shared]"], cas_df = measure(lambda: load_cas(tox_path).frame, repeat)
+
+    conc_dataset = load_concentration(conc_path)
+    cas_dataset = load_cas(tox_path)
+    param = conc_dataset.meta["all_param_cols"][0]
+    results["create_map_with_markers"], folium_map = measure(lambda: core.create_map_with_markers(df, param), repeat)
+    results["map_html_render"], html = measure(lambda: folium_map.get_root().render(), repeat)
+    results["map_html_render"]["html_bytes"] = len(html.encode("utf-8"))
+    results["map_html_render"]["markers"] = core.count_markers(folium_map)
+
+    rng = np.random.default_rng(seed)
+    lats, lngs = df['纬度'].to_numpy(dtype=float), df['经度'].to_numpy(dtype=float)
+    picks = rng.integers(0, len(df), N_CLICKS)
+    clicks = np.column_stack([lats[picks], lngs[picks]]) + rng.normal(0, 1e-4, (N_CLICKS, 2))
+    results["site_index_build"], index = measure(lambda: core.SiteIndex(lats, lngs), repeat)
+    results["click_resolution"], _ = measure(
+        lambda: [index.nearest(lat, lng, max_distance=core.CLICK_TOLERANCE) for lat, lng in clicks], repeat)
+    results["click_resolution"]["per_click_us"] = round(results["click_resolution"]["min_ms"] * 1000 / N_CLICKS, 3)
+
+    queries = cas_df['CAS'].sample(N_LOOKUPS, replace=True, random_state=seed).tolist()
+    results["cas_index_build"], cas_idx = measure(lambda: core.CasIndex(cas_df['CAS']), repeat)
+    results["cas_lookup"], _ = measure(lambda: [cas_idx.lookup(q) for q in queries], repeat)
+    results["cas_lookup"]["per_lookup_us"] = round(results["cas_lookup"]["min_ms"] * 1000 / N_LOOKUPS, 3)
+    results["cas_batch_lookup"], _ = measure(lambda: core.batch_cas_lookup(cas_dataset, queries), repeat)
+
+    return {
+        "time": datetime.now().isoformat(timespec="seconds"),
+        "commit": git_commit(),
+        "python": platform.python_version(),
+        "pandas": pd.__version__,
+        "numpy": np.__version__,
+        "tier": name,
+        "config": dict(config, rows=len(df), compounds_loaded=len(cas_df)),
+        "repeat": repeat,
+        "results": results,
+    }
+
+
+def previous_record(tier):
+    if not os.path.exists(RESULTS_FILE):
+        return None
+    last = None
+    with open(RESULTS_FILE, encoding="utf-8") as f:
+        for line in f:
+            record = json.loads(line)
+            if record.get("tier") == tier:
+                last = record
+    return last
+
+
+def report(record, previous):
+    print(f"\n== {record['tier']} ({record['config']['rows']} 行, {record['config']['params']} 参数, "
+          f"{record['config']['compounds_loaded']} 条毒性记录) ==")
+    for bench, values in record["results"].items():
+        line = f"{bench:36s} {values['median_ms']:12.3f} ms"
+        if previous and bench in previous["results"]:
+            before = previous["results"][bench]["median_ms"]
+            if before:
+                line += f"   {(values['median_ms'] - before) / before * 100:+7.1f}% vs {previous['commit'] or '上次'}"
+        print(line)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="dalian_core 基准测试")
+    parser.add_argument("--tiers", default="small,medium", help=f"逗号分隔，可选：{', '.join(TIERS)}")
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--no-record", action="store_true", help="只打印结果，不写入 results.jsonl")
+    args = parser.parse_args()
+
+    for tier in args.tiers.split(","):
+        tier = tier.strip()
+        if tier not in TIERS:
+            parser.error(f"未知规模：{tier}")
+        record = run_tier(tier, TIERS[tier], args.repeat, args.seed)
+        report(record, previous_record(tier))
+        if not args.no_record:
+            with open(RESULTS_FILE, "a", encoding="utf-8") as f:
+                f.write(json.dumps(record, ensure_ascii=False) + "\n")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,103 @@
+"""
+合成数据生成：按 浓度点位数据.xlsx 与 毒性数据.xlsx（MM-GCN预测毒性数据集）的结构写出任意规模的工作簿，
+供基准测试使用。
+
+    python benchmarks/synthetic.py --sites 5000 --params 80 --compounds 20000 --out benchmarks/data
+"""
+import argparse
+import os
+
+import numpy as np
+import pandas as pd
+
+# 大连近岸海域范围
+LAT_RANGE = (38.7, 40.1)
+LNG_RANGE = (121.0, 123.6)
+CATEGORIES = ['海水养殖区', '近岸海域海水', '污水处理厂', '工厂化养殖', '河流入海口']
+HYDROLOGY_COLS = ['水深', '水温℃', '盐度', 'pH', '溶解氧mg/L']
+TOXICITY_SHEET = "MM-GCN预测毒性数据集"
+
+
+def param_names(n_params):
+    return [f"化合物{i:04d}" for i in range(n_params)]
+
+
+def cas_number(i):
+    """生成带正确校验位的 CAS 号"""
+    body = f"{1000 + i * 7}{i % 100:02d}"
+    check = sum((k + 1) * int(d) for k, d in enumerate(reversed(body))) % 10
+    return f"{body[:-2]}-{body[-2:]}-{check}"
+
+
+def concentration_frame(n_sites, n_params, samples_per_site=1, seed=0):
+    """浓度表：基础列 + 水文列 + n_params 个参数列；约 60% 未检出（空值），少量为 "ND" 文本"""
+    rng = np.random.default_rng(seed)
+    n_rows = n_sites * samples_per_site
+    site_ids = np.repeat(np.arange(n_sites), samples_per_site)
+    site_lat = rng.uniform(*LAT_RANGE, n_sites)
+    site_lng = rng.uniform(*LNG_RANGE, n_sites)
+    dates = pd.date_range("2018-01-01", periods=max(samples_per_site, 1) * 30, freq="7D")
+    data = {
+        '序号': np.arange(1, n_rows + 1),
+        '分类': np.asarray(CATEGORIES)[rng.integers(0, len(CATEGORIES), n_rows)],
+        '点位': [f"S{i:05d}" for i in site_ids],
+        '采样时间': dates[rng.integers(0, len(dates), n_rows)].strftime("%Y.%m.%d"),
+        '水深': rng.uniform(1, 30, n_rows).round(1),
+        '经度': site_lng[site_ids],
+        '纬度': site_lat[site_ids],
+        '水温℃': rng.uniform(2, 26, n_rows).round(1),
+        '盐度': rng.uniform(25, 33, n_rows).round(2),
+        'pH': rng.uniform(7.6, 8.4, n_rows).round(2),
+        '溶解氧mg/L': rng.uniform(4, 9, n_rows).round(2),
+    }
+    for name in param_names(n_params):
+        values = rng.lognormal(mean=0.0, sigma=1.5, size=n_rows).round(4).astype(object)
+        values[rng.random(n_rows) < 0.6] = np.nan
+        values[rng.random(n_rows) < 0.02] = "ND"
+        data[name] = values
+    return pd.DataFrame(data)
+
+
+def toxicity_frame(n_compounds, n_params, seed=0):
+    """毒性表：首行为标题、第二行为表头（与原工作簿一致，读取时首行被提升为表头）；前 n_params 个物质与浓度参数同名"""
+    rng = np.random.default_rng(seed + 1)
+    names = param_names(n_params) + [f"物质{i:06d}" for i in range(max(n_compounds - n_params, 0))]
+    names = names[:n_compounds]
+    header = ['序号', '化合物名称', 'CAS', 'SMILES', 'PNEC (μg/L)', 'AD 检验', 'KS 检验', 'JB 检验']
+    rows = [
+        [i + 1, name, cas_number(i), "C" * (5 + i % 20), float(rng.lognormal(0.0, 2.0)),
+         bool(rng.random() < 0.8), bool(rng.random() < 0.5), bool(rng.random() < 0.5)]
+        for i, name in enumerate(names)
+    ]
+    return pd.DataFrame([header] + rows, columns=["MM-GCN预测毒性数据"] + [""] * (len(header) - 1))
+
+
+def write_workbooks(out_dir, n_sites, n_params, n_compounds, samples_per_site=1, seed=0):
+    """写出一组工作簿，返回 (浓度文件路径, 毒性文件路径)；同名文件已存在时直接复用"""
+    os.makedirs(out_dir, exist_ok=True)
+    tag = f"{n_sites}x{samples_per_site}_{n_params}p_{n_compounds}c_s{seed}"
+    conc_path = os.path.join(out_dir, f"浓度点位数据_{tag}.xlsx")
+    tox_path = os.path.join(out_dir, f"毒性数据_{tag}.xlsx")
+    if not os.path.exists(conc_path):
+        concentration_frame(n_sites, n_params, samples_per_site, seed).to_excel(conc_path, index=False)
+    if not os.path.exists(tox_path):
+        with pd.ExcelWriter(tox_path) as writer:
+            toxicity_frame(n_compounds, n_params, seed).to_excel(writer, sheet_name=TOXICITY_SHEET, index=False)
+    return conc_path, tox_path
+
+
+def main():
+    parser = argparse.ArgumentParser(description="生成合成浓度/毒性工作簿")
+    parser.add_argument("--sites", type=int, default=1000)
+    parser.add_argument("--samples-per-site", type=int, default=1)
+    parser.add_argument("--params", type=int, default=80)
+    parser.add_argument("--compounds", type=int, default=5000)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--out", default=os.path.join(os.path.dirname(__file__), "data"))
+    args = parser.parse_args()
+    for path in write_workbooks(args.out, args.sites, args.params, args.compounds, args.samples_per_site, args.seed):
+        print(path)
+
+
+if __name__ == "__main__":
+    main()
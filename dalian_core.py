@@ -0,0 +1,2227 @@
+"""
+平台的数据层：浓度/毒性工作簿的读取与旁路缓存、进程级共享数据集及其派生索引、风险商与统计、视图导出、
+本地分析库、插值浓度面、底图瓦片缓存与地图图层。导入时不产生任何页面输出，
+由 streamlit_app.py 与 ingest.py、seed_tiles.py、benchmarks/bench_app.py 等命令行工具共用。
+"""
+import streamlit as st
+import pandas as pd
+import os
+import warnings
+import numpy as np
+import base64
+import io
+import json
+import re
+import bisect
+import hashlib
+import sqlite3
+import urllib.parse
+import urllib.request
+import threading
+import types
+import time
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import closing, contextmanager
+from datetime import datetime
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from dataclasses import dataclass, field
+import pyarrow as pa
+import pyarrow.feather as feather
+import pyarrow.parquet as pq
+from PIL import Image, ImageDraw
+
+# -------------------------
+# 性能计时
+# -------------------------
+# 每次重跑在独立线程中执行，计时记录按线程保存；后台线程中的计时不计入任何一次重跑
+PERF_LOG_FILE = os.environ.get("DALIAN_PERF_LOG", "perf_log.jsonl")
+_perf = threading.local()
+
+
+def perf_begin():
+    _perf.record = {"start": time.perf_counter(), "phases": {}, "metrics": {}}
+
+
+def perf_active():
+    """当前线程是否有进行中的计时记录"""
+    return getattr(_perf, "record", None) is not None
+
+
+def perf_metric(name, value):
+    record = getattr(_perf, "record", None)
+    if record is not None:
+        record["metrics"][name] = value
+
+
+@contextmanager
+def timed(phase):
+    """累计某一阶段的耗时（毫秒）到本次重跑的记录中"""
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        record = getattr(_perf, "record", None)
+        if record is not None:
+            record["phases"][phase] = record["phases"].get(phase, 0.0) + (time.perf_counter() - start) * 1000
+
+
+def perf_end(page, log=False):
+    """结束本次重跑的计时，按需以 JSON 行追加到日志文件"""
+    record = _perf.__dict__.pop("record", None)
+    if record is None:
+        return None
+    entry = {
+        "time": datetime.now().isoformat(timespec="milliseconds"),
+        "page": page,
+        "total_ms": round((time.perf_counter() - record["start"]) * 1000, 2),
+        "phases": {name: round(ms, 2) for name, ms in record["phases"].items()},
+        "metrics": record["metrics"],
+    }
+    if log:
+        try:
+            with open(PERF_LOG_FILE, "a", encoding="utf-8") as f:
+                f.write(json.dumps(entry, ensure_ascii=False) + "\n")
+        except OSError:
+            pass
+    return entry
+
+
+# -------------------------
+# 共享辅助函数
+# -------------------------
+# 地图初始视野与尺寸
+MAP_DEFAULT_CENTER = [39.618, 122.228]
+MAP_DEFAULT_ZOOM = 8
+MAP_WIDTH, MAP_HEIGHT = 1200, 800
+
+
+def file_exists(file_path):
+    return os.path.exists(file_path)
+
+
+# 浓度数据旁路缓存：解析一次 Excel 后写入 Arrow(Feather) 文件，后续按源文件签名直接内存映射读取，
+# 浮点列不经复制直接作为 numpy 数组使用
+CACHE_DIR = ".dalian_cache"
+CACHE_FORMAT_VERSION = 3
+BASE_COLS = ['分类', '序号', '点位', '采样时间', '经度', '纬度']
+EXCLUDE_COLS = ['水深', '水温℃', '盐度', 'ph', '溶解氧mg/l']
+CATEGORY_COLS = ['分类', '点位']
+DATE_COL = '采样日期'  # 由 采样时间 解析出的日期列（仅有年份的记为当年 1 月 1 日）
+
+
+class DataSchemaError(ValueError):
+    """源文件结构不符合要求（如缺少基础列）"""
+
+
+def file_signature(file_path):
+    """源文件签名：绝对路径、大小与修改时间，任一变化即视为新版本"""
+    stat = os.stat(file_path)
+    return os.path.abspath(file_path), stat.st_size, stat.st_mtime_ns
+
+
+def sidecar_path(file_path, signature):
+    key = hashlib.sha1(repr((CACHE_FORMAT_VERSION, signature)).encode("utf-8")).hexdigest()[:16]
+    cache_dir = os.path.join(os.path.dirname(signature[0]), CACHE_DIR)
+    return os.path.join(cache_dir, f"{os.path.basename(file_path)}.{key}.arrow")
+
+
+def _arrow_safe(df):
+    # 混合类型的 object 列（如数字与 "ND" 混排）无法直接写入 Arrow，统一转为字符串并保留空值
+    df = df.copy()
+    for col in df.columns:
+        if df[col].dtype == object and pd.api.types.infer_dtype(df[col], skipna=True) not in ("string", "empty"):
+            df[col] = df[col].map(lambda v: v if pd.isna(v) else str(v))
+    return df
+
+
+def write_sidecar(path, df, meta):
+    table = pa.Table.from_pandas(df, preserve_index=False)
+    # 浮点列的 NaN 按数值写入而不转为 null：没有有效位图的列读取时可零复制映射为 numpy 数组
+    for i, column in enumerate(table.schema):
+        if pa.types.is_floating(column.type):
+            table = table.set_column(i, column, pa.array(df[column.name].to_numpy(), from_pandas=False))
+    metadata = dict(table.schema.metadata or {})
+    metadata[b"dalian_meta"] = json.dumps(meta, ensure_ascii=False).encode("utf-8")
+    table = table.replace_schema_metadata(metadata)
+    cache_dir = os.path.dirname(path)
+    os.makedirs(cache_dir, exist_ok=True)
+    tmp_path = f"{path}.{os.getpid()}.tmp"
+    feather.write_feather(table, tmp_path, compression="uncompressed")
+    os.replace(tmp_path, path)
+    # 清理同一源文件的旧版本缓存
+    prefix = os.path.basename(path).rsplit(".", 2)[0] + "."
+    for name in os.listdir(cache_dir):
+        if name.startswith(prefix) and name.endswith(".arrow") and name != os.path.basename(path):
+            try:
+                os.remove(os.path.join(cache_dir, name))
+            except OSError:
+                pass
+
+
+def read_sidecar(path):
+    table = feather.read_table(path, memory_map=True)
+    meta = json.loads(table.schema.metadata[b"dalian_meta"].decode("utf-8"))
+    # split_blocks 使每列单独成块，浮点列直接引用映射的文件内容（只读），不合并复制为二维块
+    return table.to_pandas(split_blocks=True), meta
+
+
+def widen_float(values):
+    """float32 → float64，取能还原为同一 float32 的最短十进制值，避免 0.1234 变成 0.12340000271797180 写入页面。
+    按有效数字从 1 位到 9 位（float32 至多需要 9 位）逐次向量化舍入，每轮只处理尚未还原的元素"""
+    values = np.asarray(values)
+    if values.dtype != np.float32:
+        return values.astype(float)
+    narrow = values.ravel()
+    wide = narrow.astype(float)
+    pending = np.flatnonzero(np.isfinite(wide) & (wide != 0))
+    exponent = np.floor(np.log10(np.abs(wide[pending])))
+    for digits in range(1, 10):
+        if not len(pending):
+            break
+        # 只乘除精确的 10 的整数次幂，舍入结果即最接近该十进制数的 float64
+        shift = digits - 1 - exponent
+        up, down = 10.0 ** np.maximum(shift, 0), 10.0 ** np.maximum(-shift, 0)
+        candidate = np.round(wide[pending] * up / down) / up * down
+        restored = candidate.astype(np.float32) == narrow[pending]
+        wide[pending[restored]] = candidate[restored]
+        pending, exponent = pending[~restored], exponent[~restored]
+    return wide.reshape(values.shape)
+
+
+def param_columns(meta):
+    """参数在数据帧中的列名（小写）"""
+    return [param.lower() for param in meta["all_param_cols"]]
+
+
+def normalize_concentration(df, param_cols):
+    """把 openpyxl 读出的原始表一次性转为紧凑类型：分类/点位为分类编码，采样时间另解析出日期列，
+    经纬度与数值列为 float32，参数列合并为一个连续的 float32 块；数值列中的文本（"ND"、"<LOD" 等）
+    置为空值，原文按列记录在 text_cells 中，参数列据此构成检出限掩码"""
+    out = pd.DataFrame(index=df.index)
+    text_cells = {}
+
+    def to_float32(col):
+        raw = df[col]
+        values = pd.to_numeric(raw, errors='coerce')
+        text = raw[raw.notna() & values.isna()]
+        if not text.empty:
+            text_cells[col] = {"rows": text.index.tolist(), "text": text.astype(str).tolist()}
+        return values.to_numpy(dtype=np.float32)
+
+    for col in df.columns:
+        if col in param_cols:
+            continue
+        if col in CATEGORY_COLS:
+            out[col] = df[col].map(lambda v: v if pd.isna(v) else str(v).strip()).astype("category")
+        elif col == '采样时间':
+            # 采样时间混有年份整数（2018）与 "2025.10.24" 文本，保留原文用于显示，另存解析后的日期
+            text = df[col].map(lambda v: v if pd.isna(v) else str(v).strip())
+            out[col] = text.astype("category")
+            out[DATE_COL] = pd.to_datetime(text, format="mixed", errors='coerce')
+        elif col in ('经度', '纬度') or col in EXCLUDE_COLS:
+            out[col] = to_float32(col)
+        else:
+            out[col] = df[col]
+    matrix = np.empty((len(df), len(param_cols)), dtype=np.float32, order="F")
+    for j, col in enumerate(param_cols):
+        matrix[:, j] = to_float32(col)
+    out = pd.concat([out, pd.DataFrame(matrix, index=df.index, columns=param_cols)], axis=1)
+    return out, text_cells
+
+
+def parse_concentration_workbook(filepath, sheet=0):
+    """解析浓度 Excel：规范化列名、识别参数列、转换为紧凑类型并计算各参数取值范围"""
+    with timed("Excel 解析"):
+        df = pd.read_excel(filepath, sheet_name=sheet)
+    return prepare_concentration_frame(df)
+
+
+def prepare_concentration_frame(df):
+    """parse_concentration_workbook 中与读取方式无关的部分，入库时对已读出的工作表复用"""
+    with timed("列名规范化"):
+        df.columns = df.columns.astype(str).str.strip().str.replace('\n', '').str.lower()
+        excel_columns = df.columns.tolist()
+        missing_base_cols = [col for col in BASE_COLS if col not in df.columns]
+        if missing_base_cols:
+            raise DataSchemaError(f"Excel 缺少基础列（小写匹配后）：{', '.join(missing_base_cols)}")
+        df = df.dropna(subset=['经度', '纬度']).reset_index(drop=True)
+        param_cols = [col for col in df.columns if col not in BASE_COLS and col not in EXCLUDE_COLS]
+        param_cols_original = [col.capitalize() if col not in ['经度', '纬度'] else col for col in param_cols]
+    with timed("类型转换"):
+        df, text_cells = normalize_concentration(df, param_cols)
+
+    param_ranges = {}
+    with timed("参数范围计算"):
+        matrix = df[param_cols].to_numpy()
+        has_value = ~np.isnan(matrix).all(axis=0) if len(matrix) else np.zeros(len(param_cols), dtype=bool)
+        with np.errstate(invalid="ignore"), warnings.catch_warnings():
+            warnings.simplefilter("ignore", RuntimeWarning)
+            mins = widen_float(np.nanmin(matrix, axis=0)) if len(matrix) else []
+            maxs = widen_float(np.nanmax(matrix, axis=0)) if len(matrix) else []
+        for j, col in enumerate(param_cols_original):
+            if has_value[j]:
+                param_ranges[col] = {"min": float(mins[j]), "max": float(maxs[j])}
+            else:
+                param_ranges[col] = {"min": None, "max": None}
+    meta = {"excel_columns": excel_columns, "all_param_cols": param_cols_original, "param_ranges": param_ranges,
+            "text_cells": text_cells}
+    return df, meta
+
+
+def read_concentration_cached(filepath):
+    """优先读取与源文件签名匹配的旁路缓存，未命中时解析 Excel 并写入缓存"""
+    signature = file_signature(filepath)
+    path = sidecar_path(filepath, signature)
+    if os.path.exists(path):
+        try:
+            with timed("读取缓存"):
+                return read_sidecar(path)
+        except (OSError, KeyError, ValueError, pa.ArrowException):
+            pass
+    df, meta = parse_concentration_workbook(filepath)
+    # 缓存命中与未命中时返回相同的列类型
+    df = _arrow_safe(df)
+    try:
+        with timed("写入缓存"):
+            write_sidecar(path, df, meta)
+    except (OSError, pa.ArrowException):
+        # 缓存目录不可写时仍返回解析结果
+        pass
+    return df, meta
+
+
+CAS_HEADER_ROW = 2  # 毒性表首行为表标题，第二行为表头
+SHEET_READ_CAPACITY = 1024  # 工作表未记录尺寸时的初始预分配行数，不足时按倍数扩容
+
+
+def read_sheet_columns(filepath, sheet, header_row=1, columns=None):
+    """以 openpyxl 只读模式流式读取工作表：表头直接取自 header_row 行，只保留 columns 中的列
+    （默认全部有名称的列），各列单元格值逐行写入按行数预分配的数组，不构建整表的中间数据帧。
+    空单元格为 NaN，全空行跳过，列类型随后按内容推断（与 pandas.read_excel 一致）"""
+    import openpyxl
+
+    workbook = openpyxl.load_workbook(filepath, read_only=True, data_only=True)
+    try:
+        sheet_obj = workbook[sheet] if isinstance(sheet, str) else workbook.worksheets[sheet]
+        rows = sheet_obj.iter_rows(min_row=header_row, values_only=True)
+        positions = {}
+        for i, name in enumerate(next(rows, ())):
+            if name is None or str(name) in positions or (columns is not None and str(name) not in columns):
+                continue
+            positions[str(name)] = i
+        if not positions:
+            return pd.DataFrame()
+        picks = list(positions.values())
+        capacity = max((sheet_obj.max_row or 0) - header_row, 0) or SHEET_READ_CAPACITY
+        arrays = [np.full(capacity, np.nan, dtype=object) for _ in picks]
+        n = 0
+        for row in sheet_obj.iter_rows(min_row=header_row + 1, max_col=max(picks) + 1, values_only=True):
+            values = [row[i] if i < len(row) else None for i in picks]
+            if all(v is None for v in values):
+                continue
+            if n == capacity:
+                capacity *= 2
+                arrays = [np.concatenate([a, np.full(len(a), np.nan, dtype=object)]) for a in arrays]
+            for array, value in zip(arrays, values):
+                if value is not None:
+                    array[n] = value
+            n += 1
+    finally:
+        workbook.close()
+    return pd.DataFrame({name: array[:n] for name, array in zip(positions, arrays)}).infer_objects()
+
+
+def parse_cas_workbook(filepath, sheet="MM-GCN预测毒性数据集", columns=None):
+    """解析毒性 Excel：流式读取第二行表头下的各列（CAS 页显示全部有名称的列，可用 columns 投影），
+    CAS 列统一为字符串"""
+    if columns is not None:
+        columns = {*columns, 'CAS'}
+    with timed("毒性 Excel 解析"):
+        table = read_sheet_columns(filepath, sheet, header_row=CAS_HEADER_ROW, columns=columns)
+    if 'CAS' in table.columns:
+        table['CAS'] = table['CAS'].astype(str)
+    return table, {"sheet": sheet}
+
+
+def prepare_cas_frame(temp_data):
+    """已按首行为表头读入的毒性表（如导入本地库时）：第二行提升为表头，CAS 列统一为字符串"""
+    temp_data.columns = temp_data.iloc[0]
+    temp_data = temp_data.drop(temp_data.index[0]).reset_index(drop=True)
+    if 'CAS' in temp_data.columns:
+        temp_data['CAS'] = temp_data['CAS'].astype(str)
+    return temp_data
+
+
+# -------------------------
+# 进程级共享数据集注册表
+# -------------------------
+@dataclass(frozen=True)
+class Dataset:
+    """所有会话共享的只读数据集：数据帧、派生元数据及其源文件版本"""
+    frame: pd.DataFrame
+    meta: types.MappingProxyType
+    version: tuple
+    derived: dict = field(default_factory=dict, compare=False, repr=False)
+    lock: threading.RLock = field(default_factory=threading.RLock, compare=False, repr=False)
+
+
+def _freeze(obj):
+    if isinstance(obj, dict):
+        return types.MappingProxyType({k: _freeze(v) for k, v in obj.items()})
+    if isinstance(obj, list):
+        return tuple(_freeze(v) for v in obj)
+    return obj
+
+
+@st.cache_resource(show_spinner=False)
+def dataset_registry():
+    """进程内唯一的注册表，键为 (数据类型, 源文件绝对路径)；refreshing 记录正在后台重建的数据集，
+    failed 记录加载失败的源文件签名及异常"""
+    return {"lock": threading.Lock(), "locks": {}, "datasets": {}, "refreshing": {}, "failed": {}}
+
+
+def get_dataset(kind, filepath, loader):
+    """返回共享数据集；源文件签名变化时重新加载，同一数据集同时只加载一次。
+    已有旧版本且后台正在重建时直接返回旧版本，新版本就绪后下次访问即切换；
+    源文件当前版本加载失败过时（如文件尚未复制完整）继续返回旧版本，签名再次变化后才重试"""
+    signature = file_signature(filepath)
+    name = (kind, signature[0])
+    registry = dataset_registry()
+    dataset = registry["datasets"].get(name)
+    failed = registry["failed"].get(name)
+    if dataset is not None and (dataset.version == signature or registry["refreshing"].get(name)
+                                or (failed is not None and failed[0] == signature)):
+        return dataset
+    return build_dataset(kind, filepath, loader)
+
+
+def build_dataset(kind, filepath, loader, prepare=None):
+    """加载数据集并由 prepare 预先构建派生索引，全部完成后才替换注册表中的旧版本。
+    加载失败时记录失败的签名，同一签名不再重复解析：有旧版本时返回旧版本，否则重新抛出记录的异常"""
+    name = (kind, os.path.abspath(filepath))
+    registry = dataset_registry()
+    with registry["lock"]:
+        lock = registry["locks"].setdefault(name, threading.Lock())
+    with lock:
+        signature = file_signature(filepath)
+        dataset = registry["datasets"].get(name)
+        if dataset is not None and dataset.version == signature:
+            return dataset
+        failed = registry["failed"].get(name)
+        if failed is not None and failed[0] == signature:
+            if dataset is not None:
+                return dataset
+            raise failed[1]
+        try:
+            frame, meta = loader(filepath)
+            dataset = Dataset(frame=frame, meta=_freeze(meta), version=signature)
+            if prepare is not None:
+                prepare(dataset)
+        except Exception as e:
+            registry["failed"][name] = (signature, e)
+            raise
+        registry["failed"].pop(name, None)
+        registry["datasets"][name] = dataset
+        return dataset
+
+
+def begin_refresh(kind, filepath):
+    """登记数据集正在后台重建；登记期间 get_dataset 对已有旧版本的访问不再阻塞"""
+    name = (kind, os.path.abspath(filepath))
+    registry = dataset_registry()
+    with registry["lock"]:
+        registry["refreshing"][name] = registry["refreshing"].get(name, 0) + 1
+
+
+def end_refresh(kind, filepath):
+    name = (kind, os.path.abspath(filepath))
+    registry = dataset_registry()
+    with registry["lock"]:
+        registry["refreshing"][name] -= 1
+        if not registry["refreshing"][name]:
+            del registry["refreshing"][name]
+
+
+def failed_refresh(kind, filepath):
+    """源文件当前版本加载失败时返回记录的异常（此时 get_dataset 仍提供旧版本），否则返回 None"""
+    failed = dataset_registry()["failed"].get((kind, os.path.abspath(filepath)))
+    try:
+        if failed is None or failed[0] != file_signature(filepath):
+            return None
+    except OSError:
+        return None
+    return failed[1]
+
+
+def published_dataset(kind, filepath):
+    """注册表中当前的数据集（可能是旧版本），尚未加载过时返回 None"""
+    return dataset_registry()["datasets"].get((kind, os.path.abspath(filepath)))
+
+
+_NOT_BUILT = object()
+
+
+def dataset_derived(dataset, key, builder):
+    """按数据集版本缓存派生对象（索引、矩阵等），同一版本只构建一次；数据更新后随新版本自动重建"""
+    value = dataset.derived.get(key, _NOT_BUILT)
+    if value is not _NOT_BUILT:
+        return value
+    with dataset.lock:
+        if key not in dataset.derived:
+            dataset.derived[key] = builder()
+        return dataset.derived[key]
+
+
+def prune_derived(dataset, stale):
+    """丢弃 stale(key) 为真的派生对象，用于依赖其他数据集版本的缓存（如风险商随毒性数据更新）"""
+    with dataset.lock:
+        for key in [key for key in dataset.derived if stale(key)]:
+            del dataset.derived[key]
+
+
+def invalidate_dataset(kind=None):
+    """显式失效：丢弃指定类型（默认全部）的共享数据集及失败记录，下次访问时重新加载"""
+    registry = dataset_registry()
+    with registry["lock"]:
+        for table in (registry["datasets"], registry["failed"]):
+            for name in list(table):
+                if kind is None or name[0] == kind:
+                    table.pop(name, None)
+
+
+def concentration_matrix(dataset):
+    """样本×参数的 float32 浓度矩阵（列顺序同 all_param_cols），未检出或无数据为 NaN"""
+    return dataset_derived(dataset, "concentration_matrix",
+                           lambda: dataset.frame[param_columns(dataset.meta)].to_numpy(dtype=np.float32))
+
+
+def param_values(dataset, param):
+    """单个参数的 float64 浓度列（widen_float 后），按数据版本缓存，供每次平移缩放都会用到的聚合等热路径"""
+    return dataset_derived(dataset, ("param_values", param), lambda: widen_float(
+        concentration_matrix(dataset)[:, dataset.meta["all_param_cols"].index(param)]))
+
+
+def detection_mask(dataset):
+    """与浓度矩阵同形的布尔掩码：原表中该格为 "ND"、"<LOD" 等文本（低于检出限）时为 True"""
+    def build():
+        columns = param_columns(dataset.meta)
+        mask = np.zeros((len(dataset.frame), len(columns)), dtype=bool)
+        for j, col in enumerate(columns):
+            cells = dataset.meta["text_cells"].get(col)
+            if cells:
+                mask[list(cells["rows"]), j] = True
+        return mask
+    return dataset_derived(dataset, "detection_mask", build)
+
+
+def cell_text(dataset, col, row):
+    """数值列中某格的原始文本（如 "ND"），该格为数值或空值时返回 None"""
+    cells = dataset.meta["text_cells"].get(col)
+    if not cells:
+        return None
+    lookup = dataset_derived(dataset, ("cell_text", col), lambda: dict(zip(cells["rows"], cells["text"])))
+    return lookup.get(row)
+
+
+# -------------------------
+# 点位空间索引
+# -------------------------
+CLICK_TOLERANCE = 0.01  # 点击位置与点位的最大距离（度）
+
+
+def group_indices(inverse, n_groups):
+    """按分组编号把行号分桶：返回长度为 n_groups 的行号数组列表"""
+    order = np.argsort(inverse, kind="stable")
+    bounds = np.searchsorted(inverse[order], np.arange(n_groups + 1))
+    return [order[bounds[i]:bounds[i + 1]] for i in range(n_groups)]
+
+
+class SiteIndex:
+    """点位空间索引：按坐标合并同点位的多次采样，并用均匀网格哈希查询最近点位"""
+
+    def __init__(self, lats, lngs):
+        coords = np.column_stack([np.asarray(lats, dtype=float), np.asarray(lngs, dtype=float)]).round(6)
+        self.coords, inverse = np.unique(coords, axis=0, return_inverse=True)
+        self.site_rows = group_indices(inverse.ravel(), len(self.coords))
+        # 经度按纬度余弦缩放，使网格内距离近似为等距
+        self.lng_scale = float(np.cos(np.radians(self.coords[:, 0].mean()))) if len(self.coords) else 1.0
+        self.xy = self.coords * [1.0, self.lng_scale]
+        span = np.ptp(self.xy, axis=0).max() if len(self.xy) else 0.0
+        self.cell = max(span / max(np.sqrt(len(self.xy)), 1.0), 1e-4)
+        keys = np.floor(self.xy / self.cell).astype(np.int64)
+        cells, cell_inverse = np.unique(keys, axis=0, return_inverse=True)
+        self.grid = {tuple(cell): sites for cell, sites in
+                     zip(cells.tolist(), group_indices(cell_inverse.ravel(), len(cells)))}
+        self.key_min = keys.min(axis=0) if len(keys) else np.zeros(2, dtype=np.int64)
+        self.key_max = keys.max(axis=0) if len(keys) else np.zeros(2, dtype=np.int64)
+
+    def _ring(self, cx, cy, r):
+        if r == 0:
+            return [(cx, cy)]
+        cells = [(cx + i, cy + j) for i in (-r, r) for j in range(-r, r + 1)]
+        cells += [(cx + i, cy + j) for j in (-r, r) for i in range(-r + 1, r)]
+        return cells
+
+    def nearest(self, lat, lng, max_distance=None):
+        """返回距 (lat, lng) 最近的点位编号及距离（度）；超出 max_distance 或无点位时返回 (None, inf)"""
+        if not len(self.xy):
+            return None, float("inf")
+        x, y = lat, lng * self.lng_scale
+        cx, cy = int(np.floor(x / self.cell)), int(np.floor(y / self.cell))
+        max_ring = int(max(abs(cx - self.key_min[0]), abs(cx - self.key_max[0]),
+                           abs(cy - self.key_min[1]), abs(cy - self.key_max[1])))
+        best, best_dist = None, float("inf")
+        for r in range(max_ring + 1):
+            # 第 r 圈内的点位距离至少为 r-1 个网格，已找到的最近点不会被更外圈超越时即可停止
+            if best is not None and best_dist <= (r - 1) * self.cell:
+                break
+            if max_distance is not None and (r - 1) * self.cell > max_distance:
+                break
+            if (2 * r + 1) ** 2 > 4 * len(self.grid):
+                # 搜索范围已远超有效网格数（点位稀疏或点击位置远离点位），直接对全部点位向量化计算
+                dists = np.hypot(self.xy[:, 0] - x, self.xy[:, 1] - y)
+                i = int(np.argmin(dists))
+                best, best_dist = i, float(dists[i])
+                break
+            candidates = [self.grid[c] for c in self._ring(cx, cy, r) if c in self.grid]
+            if not candidates:
+                continue
+            sites = np.concatenate(candidates)
+            dists = np.hypot(self.xy[sites, 0] - x, self.xy[sites, 1] - y)
+            i = int(np.argmin(dists))
+            if dists[i] < best_dist:
+                best, best_dist = int(sites[i]), float(dists[i])
+        if best is None or (max_distance is not None and best_dist > max_distance):
+            return None, float("inf")
+        return best, best_dist
+
+    def rows_at(self, site):
+        """同一点位（坐标相同）的全部样本行号"""
+        return self.site_rows[site]
+
+
+def site_index(dataset):
+    return dataset_derived(dataset, "site_index",
+                           lambda: SiteIndex(widen_float(dataset.frame['纬度']), widen_float(dataset.frame['经度'])))
+
+
+# -------------------------
+# 分级聚合（按缩放级别）
+# -------------------------
+LOD_MIN_ZOOM, LOD_MAX_ZOOM = 3, 18
+LOD_CELL_PIXELS = 64  # 聚合网格在屏幕上的边长（像素）
+
+
+def view_bounds(center, zoom, width=MAP_WIDTH, height=MAP_HEIGHT):
+    """由地图中心、缩放级别与像素尺寸按 Web 墨卡托投影估算可视范围 (south, west, north, east)"""
+    lat, lng = center
+    scale = 256 * 2 ** zoom
+    y = (1 - np.log(np.tan(np.radians(lat)) + 1 / np.cos(np.radians(lat))) / np.pi) / 2 * scale
+
+    def unproject(py):
+        return float(np.degrees(np.arctan(np.sinh(np.pi * (1 - 2 * py / scale)))))
+
+    half_lng = width / 2 / scale * 360
+    return unproject(y + height / 2), lng - half_lng, unproject(y - height / 2), lng + half_lng
+
+
+def returned_bounds(map_data):
+    """st_folium 回传的可视范围 (south, west, north, east)；组件尚未回传时为 None"""
+    bounds = (map_data or {}).get("bounds") or {}
+    south_west, north_east = bounds.get("_southWest") or {}, bounds.get("_northEast") or {}
+    corners = (south_west.get("lat"), south_west.get("lng"), north_east.get("lat"), north_east.get("lng"))
+    return None if None in corners else corners
+
+
+def lod_grid(dataset, zoom):
+    """某一缩放级别下的点位分组：网格边长随级别逐级减半，各级网格相互嵌套；与参数无关，按数据版本缓存"""
+    def build():
+        lats = dataset.frame['纬度'].to_numpy(dtype=float)
+        lngs = dataset.frame['经度'].to_numpy(dtype=float)
+        cell_lng = 360.0 / (256 * 2 ** zoom) * LOD_CELL_PIXELS
+        cell_lat = cell_lng * np.cos(np.radians(MAP_DEFAULT_CENTER[0]))
+        keys = np.floor(np.column_stack([lats / cell_lat, lngs / cell_lng])).astype(np.int64)
+        _, inverse = np.unique(keys, axis=0, return_inverse=True)
+        inverse = inverse.ravel()
+        n = int(inverse.max()) + 1 if len(inverse) else 0
+        counts = np.bincount(inverse, minlength=n)
+        return {
+            "inverse": inverse,
+            "count": counts,
+            "lat": np.bincount(inverse, weights=lats, minlength=n) / np.maximum(counts, 1),
+            "lng": np.bincount(inverse, weights=lngs, minlength=n) / np.maximum(counts, 1),
+        }
+    zoom = int(min(max(zoom, LOD_MIN_ZOOM), LOD_MAX_ZOOM))
+    return dataset_derived(dataset, ("lod_grid", zoom), build)
+
+
+def lod_aggregates(dataset, zoom, param, threshold):
+    """某一缩放级别下各聚合单元对所选参数的样本数、有效数、均值、最大值与超标数；
+    与阈值无关的部分按数据版本缓存，超标数随输入的阈值每次重新计数"""
+    def build():
+        grid = lod_grid(dataset, zoom)
+        inverse, n = grid["inverse"], len(grid["count"])
+        valid = ~np.isnan(values)
+        n_valid = np.bincount(inverse, weights=valid, minlength=n)
+        sums = np.bincount(inverse, weights=np.where(valid, values, 0.0), minlength=n)
+        maxes = np.full(n, np.nan)
+        np.fmax.at(maxes, inverse, values)
+        with np.errstate(invalid="ignore", divide="ignore"):
+            mean = np.where(n_valid > 0, sums / n_valid, np.nan)
+        return dict(grid, n_valid=n_valid.astype(int), mean=mean, max=maxes)
+    zoom = int(min(max(zoom, LOD_MIN_ZOOM), LOD_MAX_ZOOM))
+    values = param_values(dataset, param)
+    aggregates = dataset_derived(dataset, ("lod_aggregates", zoom, param), build)
+    n = len(aggregates["count"])
+    exceed = np.zeros(n)
+    if threshold is not None:
+        exceed = np.bincount(aggregates["inverse"], weights=values > threshold, minlength=n)
+    return dict(aggregates, exceed=exceed.astype(int))
+
+
+def visible_aggregates(aggregates, bounds, pad=0.25):
+    """只保留落在（适当外扩的）可视范围内的聚合单元"""
+    south, west, north, east = bounds
+    dlat, dlng = (north - south) * pad, (east - west) * pad
+    mask = ((aggregates["lat"] >= south - dlat) & (aggregates["lat"] <= north + dlat) &
+            (aggregates["lng"] >= west - dlng) & (aggregates["lng"] <= east + dlng))
+    return {key: value[mask] for key, value in aggregates.items() if key != "inverse"}
+
+
+# -------------------------
+# 采样批次时间索引
+# -------------------------
+TIME_PLAYBACK_INTERVAL = 1.5  # 播放时每一期停留的秒数
+TIME_FREQS = {"按采样日期": None, "按月": "M", "按年": "Y"}
+
+
+class CampaignIndex:
+    """采样批次时间索引：按 采样时间 原文划分批次并按解析日期排序，预先切好各批次的行号及各参数的最小/最大值"""
+
+    def __init__(self, labels, dates, matrix):
+        labels = pd.Series(labels, dtype=object).reset_index(drop=True)
+        dates = pd.Series(pd.to_datetime(dates)).reset_index(drop=True)
+        dated = labels.notna().to_numpy() & dates.notna().to_numpy()
+        self.undated = np.flatnonzero(~dated)
+        if dated.any():
+            # 同一批次原文对应同一日期；批次按最早日期排序，同日期时按原文排序
+            first = pd.DataFrame({"label": labels[dated], "date": dates[dated]}).groupby("label")["date"].min()
+            first = first.reset_index().sort_values(["date", "label"])
+            self.labels = first["label"].tolist()
+            self.dates = first["date"].tolist()
+        else:
+            self.labels, self.dates = [], []
+        codes = pd.Categorical(labels.where(pd.Series(dated)), categories=self.labels).codes
+        self.rows = group_indices(codes[dated], len(self.labels))
+        self.rows = [np.flatnonzero(dated)[rows] for rows in self.rows]
+        matrix = np.asarray(matrix)
+        n_params = matrix.shape[1] if matrix.ndim == 2 else 0
+        self.param_min = np.full((len(self.labels), n_params), np.nan, dtype=matrix.dtype)
+        self.param_max = np.full((len(self.labels), n_params), np.nan, dtype=matrix.dtype)
+        if self.labels and n_params:
+            order = np.concatenate(self.rows)
+            starts = np.cumsum([0] + [len(rows) for rows in self.rows[:-1]])
+            sorted_matrix = matrix[order]
+            self.param_min = np.fmin.reduceat(sorted_matrix, starts, axis=0)
+            self.param_max = np.fmax.reduceat(sorted_matrix, starts, axis=0)
+
+    def __len__(self):
+        return len(self.labels)
+
+    def period(self, label):
+        """某一批次的序号；不存在时返回 None"""
+        try:
+            return self.labels.index(label)
+        except ValueError:
+            return None
+
+    def rows_in(self, period):
+        return self.rows[period]
+
+
+def period_labels(text, dates, freq=None):
+    """各样本所属时期：freq 为 None 时取 采样时间 原文（每次采样为一期），"M"/"Y" 时按月/年合并；
+    原文只有年份的样本在按月合并时仍单独成期，不归入 1 月"""
+    text = pd.Series(text, dtype=object).reset_index(drop=True)
+    if freq is None:
+        return text
+    dates = pd.Series(pd.to_datetime(dates)).reset_index(drop=True)
+    labels = dates.dt.strftime("%Y-%m" if freq == "M" else "%Y")
+    year_only = text.astype(str).str.fullmatch(r"\d{4}")
+    labels = labels.where(~year_only, dates.dt.strftime("%Y"))
+    return labels.where(dates.notna(), None)
+
+
+def campaign_index(dataset, freq=None):
+    def build():
+        frame = dataset.frame
+        missing = pd.Series([None] * len(frame), dtype=object)
+        text = frame['采样时间'] if '采样时间' in frame else missing
+        dates = frame[DATE_COL] if DATE_COL in frame else missing
+        return CampaignIndex(period_labels(text, dates, freq), dates, concentration_matrix(dataset))
+    return dataset_derived(dataset, ("campaign_index", freq), build)
+
+
+# -------------------------
+# CAS 号索引
+# -------------------------
+def normalize_cas(value):
+    """CAS 号规范化：去除空白与前导零并按 "数字-两位-校验位" 补全连字符，如 "0001912 249" → "1912-24-9"；无法识别时返回 None"""
+    text = re.sub(r"\s+", "", str(value)).replace("－", "-").replace("—", "-")
+    if not re.fullmatch(r"[\d-]+", text):
+        return None
+    digits = text.replace("-", "")
+    head = digits[:-3].lstrip("0")
+    if len(digits) < 5 or not head:
+        return None
+    return f"{head}-{digits[-3:-1]}-{digits[-1]}"
+
+
+def cas_checksum_valid(cas):
+    """CAS 校验位检查：除校验位外的各位数字自右向左依次乘以 1、2、3…，其和除以 10 的余数应等于校验位"""
+    key = normalize_cas(cas)
+    if key is None:
+        return False
+    digits = key.replace("-", "")
+    return sum(i * int(d) for i, d in enumerate(reversed(digits[:-1]), start=1)) % 10 == int(digits[-1])
+
+
+def normalize_cas_series(values):
+    """normalize_cas 的向量化版本，无法识别的值为 NaN"""
+    text = pd.Series(values).astype(str).str.replace(r"\s+", "", regex=True).str.replace("[－—]", "-", regex=True)
+    digits = text.str.replace("-", "", regex=False)
+    head = digits.str[:-3].str.lstrip("0")
+    keys = head + "-" + digits.str[-3:-1] + "-" + digits.str[-1]
+    valid = text.str.fullmatch(r"[\d-]+").fillna(False) & (digits.str.len() >= 5) & (head.str.len() > 0)
+    return keys.where(valid)
+
+
+class CasIndex:
+    """CAS 号索引：规范化 CAS → 行号的哈希表用于精确查询，排序后的纯数字键用于前缀补全"""
+
+    def __init__(self, cas_values):
+        # 与数据行对齐的规范化 CAS，批量查询时直接用于合并
+        self.normalized = normalize_cas_series(cas_values).reset_index(drop=True)
+        self.rows = {}
+        for i, key in enumerate(self.normalized.tolist()):
+            if isinstance(key, str):
+                self.rows.setdefault(key, []).append(i)
+        # 纯数字键与输入时是否带连字符无关，且保持与规范化 CAS 相同的前缀关系
+        pairs = sorted((key.replace("-", ""), key) for key in self.rows)
+        self.digit_keys = [digits for digits, _ in pairs]
+        self.keys = [key for _, key in pairs]
+
+    def lookup(self, cas):
+        """精确查询，返回全部匹配行号（同一 CAS 可能有多条记录）"""
+        key = normalize_cas(cas)
+        return self.rows.get(key, []) if key is not None else []
+
+    def complete(self, prefix, limit=8):
+        """前缀补全，返回按数字序排列的规范化 CAS 号"""
+        text = re.sub(r"\s+", "", str(prefix)).lstrip("0")
+        digits = re.sub(r"\D", "", text)
+        if not digits:
+            return []
+        start = bisect.bisect_left(self.digit_keys, digits)
+        stop = bisect.bisect_left(self.digit_keys, digits + "\x7f", lo=start)
+        if "-" not in text:
+            return self.keys[start:min(stop, start + limit)]
+        # 输入中带连字符时按分段位置进一步筛选，如 "1912-" 不应匹配 "191-22-1"
+        matches = []
+        for key in self.keys[start:stop]:
+            if key.startswith(text):
+                matches.append(key)
+                if len(matches) == limit:
+                    break
+        return matches
+
+
+def cas_index(dataset):
+    return dataset_derived(dataset, "cas_index", lambda: CasIndex(dataset.frame['CAS']))
+
+
+def parse_cas_list(text):
+    """拆分粘贴的 CAS 列表，支持换行、空格、逗号、分号等分隔"""
+    return [token for token in re.split(r"[\s,;，；、]+", text) if token]
+
+
+def split_cas_query(text):
+    """拆分查询框输入：只按逗号、分号、顿号与换行分隔，空格保留给单个 CAS 号内部（如 "0001912 249"）"""
+    return [token.strip() for token in re.split(r"[\n,;，；、]+", text) if token.strip()]
+
+
+def read_cas_upload(uploaded_file):
+    """读取上传的 CSV/XLSX：优先取名为 CAS 的列（不区分大小写），否则取第一列"""
+    if uploaded_file.name.lower().endswith(".csv"):
+        table = pd.read_csv(uploaded_file, dtype=str)
+    else:
+        table = pd.read_excel(uploaded_file, dtype=str)
+    if table.empty:
+        return []
+    cas_cols = [col for col in table.columns if str(col).strip().upper() == "CAS"]
+    column = table[cas_cols[0] if cas_cols else table.columns[0]]
+    return column.dropna().astype(str).str.strip().loc[lambda s: s != ""].tolist()
+
+
+def batch_cas_lookup(dataset, queries):
+    """批量查询：规范化后与毒性表一次向量化合并，同一 CAS 的多条记录全部保留，未命中的输入保留为空行"""
+    query_df = pd.DataFrame({"输入CAS": pd.Series(queries, dtype=str)})
+    query_df["规范化CAS"] = normalize_cas_series(query_df["输入CAS"]).to_numpy()
+    table = dataset.frame.assign(规范化CAS=cas_index(dataset).normalized.to_numpy())
+    table = table[table["规范化CAS"].notna()]
+    merged = query_df.merge(table, on="规范化CAS", how="left", indicator="匹配")
+    merged.insert(2, "是否命中", merged.pop("匹配") == "both")
+    return merged
+
+
+def frame_to_parquet_bytes(df):
+    buffer = pa.BufferOutputStream()
+    pq.write_table(pa.Table.from_pandas(_arrow_safe(df), preserve_index=False), buffer)
+    return buffer.getvalue().to_pybytes()
+
+
+# -------------------------
+# 风险商计算（RQ = 实测浓度 / PNEC）
+# -------------------------
+PARAM_CAS_MAP_FILE = "参数CAS对照.csv"  # 可选：列为 参数, CAS，用于名称无法直接匹配的参数
+RQ_ASSESSMENT_FACTOR = 5  # 毒性表只有 HC5 时，PNEC = HC5 / 评估因子
+# 浓度表的参数列通常不标注单位，此时按 CONCENTRATION_UNIT 计算 RQ；列名带单位（如 "西马津(μg/L)"）时以列名为准。
+# 单位设错会使 RQ 整体偏差 1000 倍的整数次幂，页面上会注明所用单位
+CONCENTRATION_UNIT = os.environ.get("DALIAN_CONCENTRATION_UNIT", "ng/L")
+UNIT_TO_NG_L = {"ng/l": 1.0, "μg/l": 1e3, "µg/l": 1e3, "ug/l": 1e3, "mg/l": 1e6, "g/l": 1e9}
+RQ_LEVELS = [0.01, 0.1, 1]
+RQ_LEVEL_COLORS = ['#2ca02c', '#ffd700', '#ff8c00', '#d62728']
+RQ_LEVEL_NAMES = ['极低风险', '低风险', '中风险', '高风险']
+
+
+def normalize_name(name):
+    return re.sub(r"\s+", "", str(name)).lower()
+
+
+def find_column(columns, hints):
+    """按关键字（不区分大小写）查找第一个匹配列"""
+    for col in columns:
+        lower = str(col).lower()
+        if lower != "cas" and any(hint in lower for hint in hints):
+            return col
+    return None
+
+
+def split_unit(column_name):
+    """拆出列名中标注的浓度单位：返回 (规范化名称, 单位)，如 "西马津(μg/L)" → ("西马津", "μg/l")，未标注时单位为 None"""
+    name = normalize_name(column_name)
+    for unit in sorted(UNIT_TO_NG_L, key=len, reverse=True):
+        if unit in name:
+            return re.sub(r"[(（\[【]?" + re.escape(unit) + r"[)）\]】]?", "", name, count=1), unit
+    return name, None
+
+
+def unit_factor(column_name):
+    """列名中标注的单位换算到 ng/L 的系数；未标注时按 CONCENTRATION_UNIT"""
+    return UNIT_TO_NG_L[split_unit(column_name)[1] or normalize_name(CONCENTRATION_UNIT)]
+
+
+def toxicity_reference(cas_dataset):
+    """从毒性表提取每个物质的 PNEC（已换算为 ng/L），分别以规范化 CAS 与规范化名称为键；同键多条记录取最小值"""
+    def build():
+        table = cas_dataset.frame
+        pnec_col = find_column(table.columns, ("pnec",))
+        if pnec_col is not None:
+            pnec = pd.to_numeric(table[pnec_col], errors='coerce') * unit_factor(pnec_col)
+        else:
+            hc5_col = find_column(table.columns, ("hc5",))
+            if hc5_col is None:
+                return {"by_cas": {}, "by_name": {}}
+            pnec = pd.to_numeric(table[hc5_col], errors='coerce') * unit_factor(hc5_col) / RQ_ASSESSMENT_FACTOR
+        pnec = pnec.reset_index(drop=True).where(lambda v: v > 0)
+        by_cas = pnec.groupby(cas_index(cas_dataset).normalized).min().dropna().to_dict()
+        name_col = find_column(table.columns, ("名称", "中文名", "化合物", "物质", "name"))
+        by_name = {}
+        if name_col is not None:
+            names = table[name_col].reset_index(drop=True).map(normalize_name)
+            by_name = pnec.groupby(names).min().dropna().to_dict()
+        return {"by_cas": by_cas, "by_name": by_name}
+    return dataset_derived(cas_dataset, "toxicity_reference", build)
+
+
+def read_param_cas_map(filepath=PARAM_CAS_MAP_FILE):
+    if not file_exists(filepath):
+        return {}
+    table = pd.read_csv(filepath, dtype=str)
+    return {normalize_name(param): cas for param, cas in zip(table.iloc[:, 0], table.iloc[:, 1])
+            if isinstance(param, str) and isinstance(cas, str)}
+
+
+def risk_quotients(conc_dataset, cas_dataset):
+    """点位×物质风险商矩阵：参数列先按对照表 CAS、再按名称匹配毒性记录，整体一次广播相除；按两份数据的版本缓存"""
+    map_version = file_signature(PARAM_CAS_MAP_FILE) if file_exists(PARAM_CAS_MAP_FILE) else None
+
+    def build():
+        reference = toxicity_reference(cas_dataset)
+        overrides = read_param_cas_map()
+        params, pnec, factors, unmatched = [], [], [], []
+        for param in conc_dataset.meta["all_param_cols"]:
+            name, _ = split_unit(param)
+            cas = overrides.get(name)
+            value = reference["by_cas"].get(normalize_cas(cas)) if cas else None
+            if value is None:
+                value = reference["by_name"].get(name)
+            if value is None:
+                unmatched.append(param)
+            else:
+                params.append(param)
+                pnec.append(value)
+                factors.append(unit_factor(param))
+        all_params = conc_dataset.meta["all_param_cols"]
+        conc = concentration_matrix(conc_dataset)[:, [all_params.index(p) for p in params]].astype(float)
+        conc *= np.asarray(factors, dtype=float)
+        pnec = np.asarray(pnec, dtype=float)
+        # 毒性数据或对照表更新后，旧版本的风险商及由其派生的统计表、CSV 不再使用，一并丢弃
+        prune_derived(conc_dataset, lambda derived_key: any(k != key for k in risk_keys(derived_key)))
+        return {"params": params, "pnec": pnec, "rq": conc / pnec, "unmatched": unmatched, "key": key}
+    key = ("risk_quotients", cas_dataset.version, map_version)
+    return dataset_derived(conc_dataset, key, build)
+
+
+def risk_keys(derived_key):
+    """派生对象键中引用的风险商键：风险商本身，或把风险商键作为组成部分的统计表、CSV 等"""
+    if not isinstance(derived_key, tuple):
+        return []
+    return [k for k in (derived_key, *derived_key) if isinstance(k, tuple) and k[:1] == ("risk_quotients",)]
+
+
+def risk_table(conc_dataset, risk):
+    """可下载的风险商表：点位基础信息 + 各物质 RQ"""
+    df = conc_dataset.frame
+    base = df[[col for col in ['分类', '点位', '采样时间', '经度', '纬度'] if col in df.columns]]
+    return pd.concat([base.reset_index(drop=True),
+                      pd.DataFrame(risk["rq"], columns=[f"{p} RQ" for p in risk["params"]])], axis=1)
+
+
+def risk_summary(conc_dataset, risk):
+    """各物质的风险商概要（每个物质一行）：PNEC、有 RQ 的样本数、RQ ≥ 1 的样本数与最大 RQ；按风险商版本缓存"""
+    def build():
+        rq = risk["rq"]
+        return pd.DataFrame({
+            "物质": risk["params"],
+            "PNEC": risk["pnec"],
+            "样本数": (~np.isnan(rq)).sum(axis=0),
+            "RQ ≥ 1 样本数": (rq >= 1).sum(axis=0),
+            "最大 RQ": np.fmax.reduce(rq, axis=0, initial=np.nan),
+        })
+    return dataset_derived(conc_dataset, ("risk_summary", risk["key"]), build)
+
+
+def risk_colors(rq):
+    rq = np.asarray(rq, dtype=float)
+    colors = np.asarray(RQ_LEVEL_COLORS)[np.digitize(np.nan_to_num(rq, nan=0.0), RQ_LEVELS)]
+    return np.where(np.isnan(rq), NO_DATA_COLOR, colors)
+
+
+# -------------------------
+# 统计汇总
+# -------------------------
+# 按 分类 / 点位 分组的分位数、检出率与超标数，以及参数与水文指标的相关矩阵；
+# 每个数据版本只在一次分组计算中对全部参数求出，看板页面直接读取缓存结果
+STATS_QUANTILES = [0.05, 0.25, 0.5, 0.75, 0.95]
+STATS_GROUPS = {"全部": None, "按分类": "分类", "按点位": "点位"}
+STATS_MIN_PAIRS = 5  # 相关系数所需的最少配对样本数
+HYDROLOGY_COLS = EXCLUDE_COLS  # 水深、水温、盐度、pH、溶解氧
+
+
+def group_statistics(conc_dataset, by=None, cas_dataset=None):
+    """按 by 列（分类 / 点位，None 为全部样本）分组，对全部参数一次性计算样本数、检出数与检出率、分位数、
+    均值与最大值；给出毒性数据时另计超过 PNEC（RQ ≥ 1）的样本数。返回 (分组, 参数) 长表，按数据版本缓存。
+    样本数只计有数值或检出限文本（"ND" 等）的格，未检出的格计入样本数但不计入检出数与分位数"""
+    risk = risk_quotients(conc_dataset, cas_dataset) if cas_dataset is not None else None
+
+    def build():
+        params = conc_dataset.meta["all_param_cols"]
+        values = pd.DataFrame(widen_float(concentration_matrix(conc_dataset)), columns=params)
+        if by is None:
+            keys = pd.Series("全部", index=values.index, name="分组")
+        else:
+            keys = conc_dataset.frame[by].reset_index(drop=True).rename("分组")
+        detected = values.notna()
+        measured = detected | pd.DataFrame(detection_mask(conc_dataset), columns=params)
+        grouped = values.groupby(keys, observed=True, sort=True)
+        stats = {
+            "样本数": measured.groupby(keys, observed=True, sort=True).sum(),
+            "检出数": detected.groupby(keys, observed=True, sort=True).sum(),
+            "最小值": grouped.min(),
+        }
+        quantiles = grouped.quantile(STATS_QUANTILES)
+        for q in STATS_QUANTILES:
+            stats[f"P{round(q * 100)}"] = quantiles.xs(q, level=-1)
+        stats["均值"] = grouped.mean()
+        stats["最大值"] = grouped.max()
+        if risk is not None:
+            exceed = pd.DataFrame(np.nan, index=values.index, columns=params)
+            exceed[risk["params"]] = np.where(np.isnan(risk["rq"]), np.nan, risk["rq"] >= 1)
+            stats["超标数"] = exceed.groupby(keys, observed=True, sort=True).sum(min_count=1)
+        table = pd.concat(stats, axis=1).stack(level=1, future_stack=True)
+        table.index.names = [by or "范围", "参数"]
+        table = table[table["样本数"] > 0]
+        with np.errstate(invalid="ignore", divide="ignore"):
+            table.insert(2, "检出率", table["检出数"] / table["样本数"])
+            if "超标数" in table.columns:
+                table["超标率"] = table["超标数"] / table["样本数"]
+        return table.astype({"样本数": int, "检出数": int}).reset_index()
+    key = ("group_statistics", by, risk["key"] if risk is not None else None)
+    return dataset_derived(conc_dataset, key, build)
+
+
+def spearman_columns(matrix, values):
+    """矩阵各列分别与 values 的 Spearman 秩相关：每列只在两者都有值的行上排名（平均秩），再按列求 Pearson 系数"""
+    pairs = ~np.isnan(matrix) & ~np.isnan(values)[:, None]
+    x = pd.DataFrame(np.where(pairs, matrix, np.nan)).rank().to_numpy()
+    y = pd.DataFrame(np.where(pairs, values[:, None], np.nan)).rank().to_numpy()
+    count = pairs.sum(axis=0)
+    with np.errstate(invalid="ignore", divide="ignore"), warnings.catch_warnings():
+        warnings.simplefilter("ignore", RuntimeWarning)
+        x = x - np.nanmean(x, axis=0)
+        y = y - np.nanmean(y, axis=0)
+        corr = np.nansum(x * y, axis=0) / np.sqrt(np.nansum(x * x, axis=0) * np.nansum(y * y, axis=0))
+    return np.where(count >= STATS_MIN_PAIRS, corr, np.nan)
+
+
+def hydrology_correlation(conc_dataset, category=None):
+    """参数 × 水文指标的 Spearman 秩相关矩阵，逐对剔除缺失值，配对样本少于 STATS_MIN_PAIRS 时为空；
+    category 指定时只用该分类的样本"""
+    def build():
+        frame = conc_dataset.frame
+        hydrology = [col for col in HYDROLOGY_COLS if col in frame.columns]
+        params = conc_dataset.meta["all_param_cols"]
+        rows = np.ones(len(frame), dtype=bool) if category is None else (frame['分类'] == category).to_numpy()
+        values = pd.DataFrame(concentration_matrix(conc_dataset)[rows], columns=params)
+        result = pd.DataFrame(np.nan, index=params, columns=hydrology)
+        for col in hydrology:
+            result[col] = spearman_columns(values.to_numpy(dtype=float), frame[col].to_numpy(dtype=float)[rows])
+        result.index.name = "参数"
+        return result
+    return dataset_derived(conc_dataset, ("hydrology_correlation", category), build)
+
+
+# -------------------------
+# 视图导出
+# -------------------------
+# 只导出地图上当前显示的内容（所选参数、可视范围、采样时期与风险商）；点击生成时才分块写出，
+# 同一筛选条件的结果在进程内缓存，文件不随每次重跑下发
+EXPORT_FORMATS = {"CSV": ("csv", "text/csv"), "Parquet": ("parquet", "application/octet-stream"),
+                  "GeoJSON": ("geojson", "application/geo+json")}
+EXPORT_CHUNK_ROWS = 5000
+EXPORT_BASE_COLS = ['分类', '点位', '采样时间']
+
+
+def export_rows(dataset, bounds=None, rows=None):
+    """落在可视范围 (south, west, north, east) 内、且属于时期行号 rows 的样本行号（升序）"""
+    frame = dataset.frame
+    selected = np.ones(len(frame), dtype=bool)
+    if bounds is not None:
+        south, west, north, east = bounds
+        lats, lngs = frame['纬度'].to_numpy(dtype=float), frame['经度'].to_numpy(dtype=float)
+        selected &= (lats >= south) & (lats <= north) & (lngs >= west) & (lngs <= east)
+    if rows is not None:
+        in_rows = np.zeros(len(frame), dtype=bool)
+        in_rows[rows] = True
+        selected &= in_rows
+    return np.flatnonzero(selected)
+
+
+def export_frame(dataset, rows, params, risk=None):
+    """导出表的一个分块：基础列、经纬度、各参数浓度及可选的风险商；有未检出文本的参数另附 原始文本 列。
+    各列类型固定（文本为 string、数值为 float64），分块之间的表结构一致"""
+    frame = dataset.frame
+    out = pd.DataFrame({col: frame[col].take(rows).astype("string").to_numpy()
+                        for col in EXPORT_BASE_COLS if col in frame.columns})
+    out['经度'] = widen_float(frame['经度'].to_numpy()[rows])
+    out['纬度'] = widen_float(frame['纬度'].to_numpy()[rows])
+    for param in params:
+        col = param.lower()
+        out[param] = widen_float(frame[col].to_numpy()[rows])
+        if dataset.meta["text_cells"].get(col):
+            out[f"{param} 原始文本"] = pd.array([cell_text(dataset, col, row) for row in rows], dtype="string")
+        if risk is not None and param in risk["params"]:
+            out[f"{param} RQ"] = risk["rq"][rows, risk["params"].index(param)]
+    return out
+
+
+def export_chunks(dataset, rows, params, risk=None):
+    for start in range(0, max(len(rows), 1), EXPORT_CHUNK_ROWS):
+        yield export_frame(dataset, rows[start:start + EXPORT_CHUNK_ROWS], params, risk)
+
+
+# -------------------------
+# 本地分析库（SQLite）：多工作簿、多批次归档
+# -------------------------
+# 任意数量的工作簿/工作表导入同一个磁盘数据库，页面只按需查询所选参数或 CAS 号对应的行与列
+STORE_FILE = os.environ.get("DALIAN_STORE", "dalian_archive.sqlite")
+STORE_SCHEMA = """
+CREATE TABLE IF NOT EXISTS sources (
+    id INTEGER PRIMARY KEY,
+    path TEXT NOT NULL,
+    sheet TEXT NOT NULL,
+    kind TEXT NOT NULL,
+    size INTEGER,
+    mtime_ns INTEGER,
+    rows INTEGER,
+    imported_at TEXT,
+    UNIQUE (path, sheet)
+);
+CREATE TABLE IF NOT EXISTS parameters (
+    name TEXT PRIMARY KEY,
+    position INTEGER NOT NULL
+);
+CREATE TABLE IF NOT EXISTS samples (
+    id INTEGER PRIMARY KEY,
+    source_id INTEGER NOT NULL REFERENCES sources(id) ON DELETE CASCADE,
+    category TEXT,
+    site TEXT,
+    sample_time TEXT,
+    sample_date TEXT,
+    lng REAL,
+    lat REAL,
+    depth REAL,
+    water_temp REAL,
+    salinity REAL,
+    ph REAL,
+    dissolved_oxygen REAL
+);
+CREATE TABLE IF NOT EXISTS measurements (
+    sample_id INTEGER NOT NULL REFERENCES samples(id) ON DELETE CASCADE,
+    param TEXT NOT NULL,
+    value REAL,
+    text TEXT
+);
+CREATE TABLE IF NOT EXISTS toxicity (
+    id INTEGER PRIMARY KEY,
+    source_id INTEGER NOT NULL REFERENCES sources(id) ON DELETE CASCADE,
+    cas TEXT,
+    cas_digits TEXT,
+    name TEXT,
+    record TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS idx_samples_source ON samples(source_id);
+CREATE INDEX IF NOT EXISTS idx_samples_site ON samples(site);
+CREATE INDEX IF NOT EXISTS idx_samples_date ON samples(sample_date);
+CREATE INDEX IF NOT EXISTS idx_measurements_param ON measurements(param, sample_id);
+CREATE INDEX IF NOT EXISTS idx_measurements_sample ON measurements(sample_id);
+CREATE INDEX IF NOT EXISTS idx_toxicity_source ON toxicity(source_id);
+CREATE INDEX IF NOT EXISTS idx_toxicity_cas ON toxicity(cas);
+CREATE INDEX IF NOT EXISTS idx_toxicity_digits ON toxicity(cas_digits);
+CREATE INDEX IF NOT EXISTS idx_toxicity_name ON toxicity(name);
+"""
+# 浓度表列 → samples 表字段
+STORE_SAMPLE_COLS = {'分类': 'category', '点位': 'site', '采样时间': 'sample_time', DATE_COL: 'sample_date',
+                     '经度': 'lng', '纬度': 'lat', '水深': 'depth', '水温℃': 'water_temp', '盐度': 'salinity',
+                     'ph': 'ph', '溶解氧mg/l': 'dissolved_oxygen'}
+
+
+def store_connect(store=STORE_FILE, readonly=False):
+    """每次操作单独建立连接（各会话在不同线程中重跑，sqlite3 连接不能跨线程共享）"""
+    if readonly:
+        uri = "file:" + urllib.request.pathname2url(os.path.abspath(store)) + "?mode=ro"
+        conn = sqlite3.connect(uri, uri=True, timeout=30)
+    else:
+        conn = sqlite3.connect(store, timeout=30)
+        conn.executescript(STORE_SCHEMA)
+    conn.execute("PRAGMA foreign_keys = ON")
+    return conn
+
+
+def store_version(store=STORE_FILE):
+    """库版本：每次导入提交时递增 user_version；库不存在时返回 None"""
+    if not file_exists(store):
+        return None
+    with closing(store_connect(store, readonly=True)) as conn:
+        return conn.execute("PRAGMA user_version").fetchone()[0]
+
+
+def _sql_value(value):
+    if value is None or (isinstance(value, float) and np.isnan(value)) or value is pd.NaT:
+        return None
+    if isinstance(value, np.generic):
+        return value.item()
+    if isinstance(value, (pd.Timestamp, datetime)):
+        return value.isoformat()
+    return value
+
+
+def _store_concentration(conn, source_id, df, meta):
+    first_id = conn.execute("SELECT COALESCE(MAX(id), 0) + 1 FROM samples").fetchone()[0]
+    ids = np.arange(first_id, first_id + len(df))
+    columns = [col for col in STORE_SAMPLE_COLS if col in df.columns]
+    fields = ["id", "source_id"] + [STORE_SAMPLE_COLS[col] for col in columns]
+    values = [ids.tolist(), [source_id] * len(df)]
+    for col in columns:
+        series = df[col]
+        if col == DATE_COL:
+            values.append([d.date().isoformat() if pd.notna(d) else None for d in series])
+        elif isinstance(series.dtype, pd.CategoricalDtype) or series.dtype == object:
+            values.append([None if pd.isna(v) else str(v) for v in series])
+        else:
+            values.append([_sql_value(v) for v in widen_float(series)])
+    conn.executemany(f"INSERT INTO samples ({', '.join(fields)}) VALUES ({', '.join('?' * len(fields))})",
+                     zip(*values))
+    # 长表只保存有数值或有文本（如 "ND"）的格子
+    for param, col in zip(meta["all_param_cols"], param_columns(meta)):
+        position = conn.execute("SELECT COUNT(*) FROM parameters").fetchone()[0]
+        conn.execute("INSERT OR IGNORE INTO parameters (name, position) VALUES (?, ?)", (param, position))
+        column = widen_float(df[col])
+        present = np.flatnonzero(~np.isnan(column))
+        conn.executemany("INSERT INTO measurements (sample_id, param, value) VALUES (?, ?, ?)",
+                         zip(ids[present].tolist(), [param] * len(present), column[present].tolist()))
+        cells = meta["text_cells"].get(col)
+        if cells:
+            conn.executemany("INSERT INTO measurements (sample_id, param, text) VALUES (?, ?, ?)",
+                             ((int(ids[row]), param, text) for row, text in zip(cells["rows"], cells["text"])))
+
+
+def _store_toxicity(conn, source_id, table):
+    table = table.loc[:, [col for col in table.columns if pd.notna(col)]]
+    columns = [str(col) for col in table.columns]
+    name_col = find_column(columns, ["化合物名称", "名称", "name"])
+    normalized = normalize_cas_series(table['CAS']).tolist()
+    rows = []
+    for key, record in zip(normalized, table.itertuples(index=False, name=None)):
+        record = dict(zip(columns, (_sql_value(v) for v in record)))
+        key = key if isinstance(key, str) else None
+        rows.append((source_id, key, key.replace("-", "") if key else None,
+                     record.get(name_col) if name_col else None, json.dumps(record, ensure_ascii=False, default=str)))
+    conn.executemany("INSERT INTO toxicity (source_id, cas, cas_digits, name, record) VALUES (?, ?, ?, ?, ?)", rows)
+
+
+def ingest_workbook(filepath, store=STORE_FILE, sheets=None):
+    """把工作簿的各工作表导入本地库，按表头识别浓度表（含基础列）或毒性表（首行含 CAS）；
+    源文件未变化的工作表直接跳过，变化时整表替换。返回 {工作表: 导入结果}"""
+    signature = file_signature(filepath)
+    results = {}
+    # 用完即关闭工作簿，Windows 下打开的句柄会锁住文件，使化验室无法覆盖更新
+    with pd.ExcelFile(filepath) as workbook, closing(store_connect(store)) as conn:
+        for sheet in sheets or workbook.sheet_names:
+            known = conn.execute("SELECT id, size, mtime_ns FROM sources WHERE path = ? AND sheet = ?",
+                                 (signature[0], sheet)).fetchone()
+            if known and tuple(known[1:]) == signature[1:]:
+                results[sheet] = "未变化，跳过"
+                continue
+            raw = workbook.parse(sheet)
+            kind, frame, meta = None, None, None
+            try:
+                frame, meta = prepare_concentration_frame(raw.copy())
+                kind = "concentration"
+            except DataSchemaError:
+                if len(raw) and 'CAS' in [str(v).strip() for v in raw.iloc[0].tolist()]:
+                    frame, kind = prepare_cas_frame(raw), "toxicity"
+            if kind is None:
+                results[sheet] = "未识别的表结构，跳过"
+                continue
+            with conn:
+                if known:
+                    conn.execute("DELETE FROM sources WHERE id = ?", (known[0],))
+                source_id = conn.execute(
+                    "INSERT INTO sources (path, sheet, kind, size, mtime_ns, rows, imported_at) "
+                    "VALUES (?, ?, ?, ?, ?, ?, ?)",
+                    (signature[0], sheet, kind, signature[1], signature[2], len(frame),
+                     datetime.now().isoformat(timespec="seconds"))).lastrowid
+                if kind == "concentration":
+                    _store_concentration(conn, source_id, frame, meta)
+                else:
+                    _store_toxicity(conn, source_id, frame)
+                version = conn.execute("PRAGMA user_version").fetchone()[0]
+                conn.execute(f"PRAGMA user_version = {version + 1}")
+            results[sheet] = f"{'浓度' if kind == 'concentration' else '毒性'}表，{len(frame)} 行"
+    return results
+
+
+def _toxicity_frame(rows):
+    return pd.DataFrame([json.loads(record) for (record,) in rows])
+
+
+def store_cas_lookup(store, cas):
+    """精确查询：返回全部匹配记录（各工作表的列取并集）"""
+    key = normalize_cas(cas)
+    if key is None:
+        return pd.DataFrame()
+    with closing(store_connect(store, readonly=True)) as conn:
+        return _toxicity_frame(conn.execute("SELECT record FROM toxicity WHERE cas = ? ORDER BY id", (key,)))
+
+
+def store_cas_complete(store, prefix, limit=8):
+    """前缀补全：在 cas_digits 索引上做范围查询，连字符规则同 CasIndex.complete"""
+    text = re.sub(r"\s+", "", str(prefix)).lstrip("0")
+    digits = re.sub(r"\D", "", text)
+    if not digits:
+        return []
+    with closing(store_connect(store, readonly=True)) as conn:
+        cursor = conn.execute("SELECT DISTINCT cas FROM toxicity WHERE cas_digits >= ? AND cas_digits < ? "
+                              "ORDER BY cas_digits", (digits, digits + "\x7f"))
+        matches = []
+        for (key,) in cursor:
+            if "-" not in text or key.startswith(text):
+                matches.append(key)
+                if len(matches) == limit:
+                    break
+        return matches
+
+
+def store_cas_batch(store, queries):
+    """批量查询：输入写入临时表后与毒性表一次联结，结果列与 batch_cas_lookup 一致"""
+    query_df = pd.DataFrame({"输入CAS": pd.Series(queries, dtype=str)})
+    query_df["规范化CAS"] = normalize_cas_series(query_df["输入CAS"]).to_numpy()
+    with closing(store_connect(store, readonly=True)) as conn:
+        conn.execute("CREATE TEMP TABLE query_cas (cas TEXT PRIMARY KEY)")
+        conn.executemany("INSERT OR IGNORE INTO query_cas VALUES (?)",
+                         ((key,) for key in query_df["规范化CAS"].dropna().unique()))
+        rows = conn.execute("SELECT t.cas, t.record FROM query_cas q JOIN toxicity t ON t.cas = q.cas "
+                            "ORDER BY t.id").fetchall()
+    table = pd.DataFrame([json.loads(record) for _, record in rows])
+    table["规范化CAS"] = [key for key, _ in rows]
+    merged = query_df.merge(table, on="规范化CAS", how="left", indicator="匹配")
+    merged.insert(2, "是否命中", merged.pop("匹配") == "both")
+    return merged
+
+
+# -------------------------
+# 插值浓度面（反距离加权）
+# -------------------------
+SURFACE_BOUNDS = (38.6, 120.9, 40.2, 123.7)  # 大连近岸海域范围 (south, west, north, east)
+SURFACE_RESOLUTIONS = [100, 200, 400]  # 网格列数，行数按墨卡托投影下的长宽比确定
+SURFACE_POWER = 2
+SURFACE_MAX_DISTANCE = 0.15  # 距最近点位超过该距离（度）的网格不着色
+SURFACE_OPACITY = 0.6
+SURFACE_CHUNK_CELLS = 4_000_000  # 单批计算的 网格数×点位数 上限，控制距离矩阵的内存占用
+SEA_MASK_FILE = "海域范围.geojson"  # 可选：海域多边形，提供时只在多边形内着色
+
+
+def mercator_y(lat):
+    return np.log(np.tan(np.pi / 4 + np.radians(lat) / 2))
+
+
+def surface_grid(resolution, bounds=SURFACE_BOUNDS):
+    """网格各行纬度（自北向南）与各列经度；行按墨卡托 y 等距，使图片叠加后不发生纵向拉伸"""
+    south, west, north, east = bounds
+    lngs = west + (np.arange(resolution) + 0.5) * (east - west) / resolution
+    y_south, y_north = mercator_y(south), mercator_y(north)
+    n_rows = max(int(round(resolution * (y_north - y_south) / np.radians(east - west))), 1)
+    ys = y_north - (np.arange(n_rows) + 0.5) * (y_north - y_south) / n_rows
+    lats = np.degrees(2 * np.arctan(np.exp(ys)) - np.pi / 2)
+    return lats, lngs
+
+
+def idw_grid(sample_lats, sample_lngs, values, grid_lats, grid_lngs, power=SURFACE_POWER,
+             max_distance=SURFACE_MAX_DISTANCE):
+    """向量化反距离加权插值：按批计算网格×点位距离矩阵（float32），一次矩阵乘法得到各网格的加权均值；
+    设置 max_distance 时先按点位外接框筛出可能着色的网格，其余网格不参与计算"""
+    grid_lats, grid_lngs = np.asarray(grid_lats, dtype=float), np.asarray(grid_lngs, dtype=float)
+    scale = np.cos(np.radians(grid_lats.mean()))
+    sample_lats, sample_lngs = np.asarray(sample_lats, dtype=float), np.asarray(sample_lngs, dtype=float)
+    px, py = (sample_lngs * scale).astype(np.float32), sample_lats.astype(np.float32)
+    values = np.asarray(values, dtype=np.float32)
+    out = np.full((len(grid_lats), len(grid_lngs)), np.nan)
+    if not len(values):
+        return out
+    if max_distance is None:
+        active = np.ones(out.shape, dtype=bool)
+    else:
+        # 每个点位在 ±max_distance 外接框内的网格计数 +1（二维差分后累加），计数为 0 的网格必然不着色
+        reach_lng = max_distance / scale
+        lat_order, lng_order = -grid_lats, grid_lngs
+        r0 = np.searchsorted(lat_order, -(sample_lats + max_distance))
+        r1 = np.searchsorted(lat_order, -(sample_lats - max_distance), side="right")
+        c0 = np.searchsorted(lng_order, sample_lngs - reach_lng)
+        c1 = np.searchsorted(lng_order, sample_lngs + reach_lng, side="right")
+        diff = np.zeros((out.shape[0] + 1, out.shape[1] + 1), dtype=np.int32)
+        np.add.at(diff, (r0, c0), 1)
+        np.add.at(diff, (r0, c1), -1)
+        np.add.at(diff, (r1, c0), -1)
+        np.add.at(diff, (r1, c1), 1)
+        active = diff.cumsum(axis=0).cumsum(axis=1)[:-1, :-1] > 0
+    rows, cols = np.nonzero(active)
+    gx = (grid_lngs[cols] * scale).astype(np.float32)
+    gy = grid_lats[rows].astype(np.float32)
+    estimate = np.empty(len(rows))
+    chunk = max(SURFACE_CHUNK_CELLS // len(values), 1)
+    for start in range(0, len(rows), chunk):
+        stop = start + chunk
+        d2 = np.square(gx[start:stop, None] - px) + np.square(gy[start:stop, None] - py)
+        np.maximum(d2, np.float32(1e-12), out=d2)
+        weights = 1.0 / d2 if power == 2 else d2 ** np.float32(-power / 2)
+        part = weights @ values / weights.sum(axis=1)
+        if max_distance is not None:
+            part[d2.min(axis=1) > max_distance ** 2] = np.nan
+        estimate[start:stop] = part
+    out[rows, cols] = estimate
+    return out
+
+
+def sea_mask(grid_lats, grid_lngs, filepath=SEA_MASK_FILE, bounds=SURFACE_BOUNDS):
+    """把海域多边形（GeoJSON Polygon/MultiPolygon，含内环）栅格化为与网格同形的布尔掩码；文件不存在时返回 None"""
+    if not file_exists(filepath):
+        return None
+    with open(filepath, encoding="utf-8") as f:
+        geojson = json.load(f)
+    south, west, north, east = bounds
+    n_rows, n_cols = len(grid_lats), len(grid_lngs)
+    y_south, y_north = mercator_y(south), mercator_y(north)
+
+    def to_pixels(ring):
+        ring = np.asarray(ring, dtype=float)[:, :2]
+        x = (ring[:, 0] - west) / (east - west) * n_cols
+        y = (y_north - mercator_y(ring[:, 1])) / (y_north - y_south) * n_rows
+        return list(zip(x.tolist(), y.tolist()))
+
+    features = geojson.get("features", [geojson]) if geojson.get("type") == "FeatureCollection" else [geojson]
+    image = Image.new("L", (n_cols, n_rows), 0)
+    draw = ImageDraw.Draw(image)
+    for feature in features:
+        geometry = feature.get("geometry", feature)
+        polygons = {"Polygon": [geometry.get("coordinates")],
+                    "MultiPolygon": geometry.get("coordinates")}.get(geometry.get("type"), [])
+        for polygon in polygons:
+            for i, ring in enumerate(polygon):
+                if len(ring) >= 3:
+                    draw.polygon(to_pixels(ring), fill=0 if i else 1)
+    return np.asarray(image, dtype=bool)
+
+
+def concentration_surface(dataset, param, resolution, colormap):
+    """所选参数的插值浓度面：同点位多次采样取均值后做 IDW，按色带着色写成 PNG；
+    按 (参数, 数据版本, 分辨率, 海域范围文件版本) 缓存，返回 (PNG data URL, [[south, west], [north, east]])"""
+    mask_version = file_signature(SEA_MASK_FILE) if file_exists(SEA_MASK_FILE) else None
+
+    def build():
+        index = site_index(dataset)
+        values = param_values(dataset, param)
+        site_values = np.array([np.nanmean(values[rows]) if np.isfinite(values[rows]).any() else np.nan
+                                for rows in index.site_rows])
+        valid = ~np.isnan(site_values)
+        grid_lats, grid_lngs = surface_grid(resolution)
+        grid = idw_grid(index.coords[valid, 0], index.coords[valid, 1], site_values[valid], grid_lats, grid_lngs)
+        mask = sea_mask(grid_lats, grid_lngs)
+        if mask is not None:
+            grid[~mask] = np.nan
+        channels, missing = colormap_rgb(colormap, grid.ravel())
+        rgba = np.column_stack([channels, np.where(missing, 0, 255)]).astype(np.uint8)
+        buffer = io.BytesIO()
+        Image.fromarray(rgba.reshape(grid.shape + (4,)), "RGBA").save(buffer, format="PNG", optimize=True)
+        south, west, north, east = SURFACE_BOUNDS
+        url = "data:image/png;base64," + base64.b64encode(buffer.getvalue()).decode("ascii")
+        return url, [[south, west], [north, east]]
+    key = ("surface", param, resolution, mask_version, tuple(colormap.index), tuple(map(tuple, colormap.colors)))
+    return dataset_derived(dataset, key, build)
+
+
+# -------------------------
+# 底图瓦片缓存（MBTiles）
+# -------------------------
+# 设置 DALIAN_TILE_CACHE=1 后地图改从本机瓦片服务取图：命中本地 MBTiles 库直接返回，
+# 未命中时回源上游并写入缓存；DALIAN_TILE_UPSTREAM 置空即完全离线（只用预下载的瓦片）
+TILE_UPSTREAM_URL = "https://webst01.is.autonavi.com/appmaptile?style=6&x={x}&y={y}&z={z}"
+TILE_CACHE_ENABLED = os.environ.get("DALIAN_TILE_CACHE", "0") == "1"
+TILE_CACHE_FILE = os.environ.get("DALIAN_TILE_FILE", "basemap_tiles.mbtiles")
+TILE_CACHE_MAX_BYTES = int(os.environ.get("DALIAN_TILE_MAX_MB", "512")) * 1024 * 1024
+TILE_FALLBACK_URL = os.environ.get("DALIAN_TILE_UPSTREAM", TILE_UPSTREAM_URL)
+# 瓦片服务需被内网其他机器的浏览器直接访问，默认监听全部网卡
+TILE_SERVER_HOST = os.environ.get("DALIAN_TILE_HOST", "0.0.0.0")
+TILE_SERVER_PORT = int(os.environ.get("DALIAN_TILE_PORT", "8765"))
+# 浏览器访问瓦片服务的地址；未设置时取浏览器访问本应用所用的主机名加 DALIAN_TILE_PORT，
+# 经 HTTPS 或反向代理对外提供时必须设置为代理地址
+TILE_PUBLIC_URL = os.environ.get("DALIAN_TILE_URL", "")
+TILE_SEED_BOUNDS = SURFACE_BOUNDS
+TILE_SEED_ZOOMS = (6, 13)
+TILE_USAGE_FLUSH_SECONDS = 30
+TILE_SCHEMA = """
+CREATE TABLE IF NOT EXISTS metadata (name TEXT PRIMARY KEY, value TEXT);
+CREATE TABLE IF NOT EXISTS tiles (
+    zoom_level INTEGER NOT NULL,
+    tile_column INTEGER NOT NULL,
+    tile_row INTEGER NOT NULL,
+    tile_data BLOB NOT NULL,
+    PRIMARY KEY (zoom_level, tile_column, tile_row)
+);
+CREATE TABLE IF NOT EXISTS tile_usage (
+    zoom_level INTEGER NOT NULL,
+    tile_column INTEGER NOT NULL,
+    tile_row INTEGER NOT NULL,
+    last_used REAL NOT NULL,
+    size INTEGER NOT NULL,
+    pinned INTEGER NOT NULL DEFAULT 0,
+    PRIMARY KEY (zoom_level, tile_column, tile_row)
+);
+CREATE INDEX IF NOT EXISTS idx_tile_usage_lru ON tile_usage(pinned, last_used);
+"""
+
+
+def tile_content_type(data):
+    if data[:3] == b"\xff\xd8\xff":
+        return "image/jpeg"
+    if data[:8] == b"\x89PNG\r\n\x1a\n":
+        return "image/png"
+    if data[:4] == b"RIFF" and data[8:12] == b"WEBP":
+        return "image/webp"
+    return "application/octet-stream"
+
+
+def tile_range(bounds, zoom):
+    """覆盖 (south, west, north, east) 的 XYZ 瓦片列号、行号范围（闭区间）"""
+    south, west, north, east = bounds
+    n = 2 ** zoom
+
+    def to_x(lng):
+        return min(max(int((lng + 180) / 360 * n), 0), n - 1)
+
+    def to_y(lat):
+        return min(max(int((1 - mercator_y(lat) / np.pi) / 2 * n), 0), n - 1)
+
+    return (to_x(west), to_x(east)), (to_y(north), to_y(south))
+
+
+class TileCache:
+    """MBTiles 瓦片库：tiles 表按 MBTiles 规范存储（TMS 行号自下而上），tile_usage 表记录最近访问时间，
+    超出容量时按 LRU 淘汰；预下载的瓦片为常驻，不参与淘汰。访问时间先记在内存中，定期批量写回"""
+
+    def __init__(self, path=TILE_CACHE_FILE, max_bytes=TILE_CACHE_MAX_BYTES, upstream=TILE_FALLBACK_URL):
+        self.path, self.max_bytes, self.upstream = path, max_bytes, upstream or None
+        self.lock = threading.Lock()
+        self.pending = {}
+        self.flushed_at = time.monotonic()
+        with closing(self._connect()) as conn, conn:
+            conn.executescript(TILE_SCHEMA)
+            conn.executemany("INSERT OR IGNORE INTO metadata (name, value) VALUES (?, ?)", [
+                ("name", "dalian-basemap"), ("type", "baselayer"), ("version", "1"),
+                ("bounds", ",".join(map(str, [TILE_SEED_BOUNDS[1], TILE_SEED_BOUNDS[0],
+                                              TILE_SEED_BOUNDS[3], TILE_SEED_BOUNDS[2]])))])
+            self.total_bytes = conn.execute("SELECT COALESCE(SUM(size), 0) FROM tile_usage").fetchone()[0]
+
+    def _connect(self):
+        return sqlite3.connect(self.path, timeout=30)
+
+    @staticmethod
+    def _key(z, x, y):
+        return z, x, 2 ** z - 1 - y
+
+    def get(self, z, x, y):
+        key = self._key(z, x, y)
+        with closing(self._connect()) as conn:
+            row = conn.execute("SELECT tile_data FROM tiles WHERE zoom_level = ? AND tile_column = ? AND tile_row = ?",
+                               key).fetchone()
+        if row is None:
+            return None
+        with self.lock:
+            self.pending[key] = time.time()
+            if time.monotonic() - self.flushed_at > TILE_USAGE_FLUSH_SECONDS:
+                self._flush_usage()
+        return row[0]
+
+    def put(self, z, x, y, data, pinned=False):
+        key = self._key(z, x, y)
+        with self.lock, closing(self._connect()) as conn, conn:
+            old = conn.execute("SELECT size FROM tile_usage WHERE zoom_level = ? AND tile_column = ? AND tile_row = ?",
+                               key).fetchone()
+            conn.execute("INSERT OR REPLACE INTO tiles VALUES (?, ?, ?, ?)", key + (sqlite3.Binary(data),))
+            conn.execute("INSERT INTO tile_usage VALUES (?, ?, ?, ?, ?, ?) "
+                         "ON CONFLICT (zoom_level, tile_column, tile_row) DO UPDATE SET "
+                         "last_used = excluded.last_used, size = excluded.size, pinned = MAX(pinned, excluded.pinned)",
+                         key + (time.time(), len(data), int(pinned)))
+            conn.execute("INSERT OR IGNORE INTO metadata (name, value) VALUES ('format', ?)",
+                         (tile_content_type(data).split("/")[-1].replace("jpeg", "jpg"),))
+            self.total_bytes += len(data) - (old[0] if old else 0)
+            if self.total_bytes > self.max_bytes:
+                self._evict(conn)
+
+    def _flush_usage(self):
+        if self.pending:
+            with closing(self._connect()) as conn, conn:
+                conn.executemany("UPDATE tile_usage SET last_used = ? "
+                                 "WHERE zoom_level = ? AND tile_column = ? AND tile_row = ?",
+                                 [(used,) + key for key, used in self.pending.items()])
+            self.pending.clear()
+        self.flushed_at = time.monotonic()
+
+    def _evict(self, conn):
+        """按最近访问时间从旧到新删除非常驻瓦片，直到容量降到上限的 90%"""
+        if self.pending:
+            conn.executemany("UPDATE tile_usage SET last_used = ? "
+                             "WHERE zoom_level = ? AND tile_column = ? AND tile_row = ?",
+                             [(used,) + key for key, used in self.pending.items()])
+            self.pending.clear()
+        target = self.max_bytes * 0.9
+        victims = []
+        for z, x, y, size in conn.execute("SELECT zoom_level, tile_column, tile_row, size FROM tile_usage "
+                                          "WHERE pinned = 0 ORDER BY last_used"):
+            if self.total_bytes <= target:
+                break
+            victims.append((z, x, y))
+            self.total_bytes -= size
+        conn.executemany("DELETE FROM tiles WHERE zoom_level = ? AND tile_column = ? AND tile_row = ?", victims)
+        conn.executemany("DELETE FROM tile_usage WHERE zoom_level = ? AND tile_column = ? AND tile_row = ?", victims)
+
+    def fetch_upstream(self, z, x, y, timeout=10):
+        if not self.upstream:
+            return None
+        request = urllib.request.Request(self.upstream.format(z=z, x=x, y=y),
+                                         headers={"User-Agent": "dalian-tile-cache/1.0"})
+        try:
+            with urllib.request.urlopen(request, timeout=timeout) as response:
+                data = response.read()
+        except (OSError, ValueError):
+            return None
+        return data if tile_content_type(data).startswith("image/") else None
+
+    def tile(self, z, x, y):
+        """本地命中直接返回；未命中时回源并写入缓存；两者都失败时返回 None"""
+        data = self.get(z, x, y)
+        if data is None:
+            data = self.fetch_upstream(z, x, y)
+            if data is not None:
+                self.put(z, x, y, data)
+        return data
+
+    def seed(self, bounds=TILE_SEED_BOUNDS, zooms=TILE_SEED_ZOOMS, workers=8, progress=None):
+        """预下载范围内全部瓦片并标记为常驻；已有的瓦片只补标常驻。返回 (新下载数, 已存在数, 失败数)"""
+        jobs = []
+        for z in range(zooms[0], zooms[1] + 1):
+            (x0, x1), (y0, y1) = tile_range(bounds, z)
+            jobs += [(z, x, y) for x in range(x0, x1 + 1) for y in range(y0, y1 + 1)]
+        with closing(self._connect()) as conn:
+            existing = set(conn.execute("SELECT zoom_level, tile_column, tile_row FROM tiles"))
+        todo = [job for job in jobs if self._key(*job) not in existing]
+        with closing(self._connect()) as conn, conn:
+            conn.executemany("UPDATE tile_usage SET pinned = 1 "
+                             "WHERE zoom_level = ? AND tile_column = ? AND tile_row = ?",
+                             [self._key(*job) for job in jobs if self._key(*job) in existing])
+        fetched = failed = 0
+        with ThreadPoolExecutor(max_workers=workers) as pool:
+            for done, (job, data) in enumerate(zip(todo, pool.map(lambda job: self.fetch_upstream(*job), todo)), 1):
+                if data is None:
+                    failed += 1
+                else:
+                    self.put(*job, data, pinned=True)
+                    fetched += 1
+                if progress is not None:
+                    progress(done, len(todo))
+        with closing(self._connect()) as conn, conn:
+            conn.executemany("INSERT OR REPLACE INTO metadata (name, value) VALUES (?, ?)",
+                             [("minzoom", str(zooms[0])), ("maxzoom", str(zooms[1]))])
+        return fetched, len(jobs) - len(todo), failed
+
+    def stats(self):
+        with self.lock:
+            self._flush_usage()
+        with closing(self._connect()) as conn:
+            count, pinned = conn.execute("SELECT COUNT(*), COALESCE(SUM(pinned), 0) FROM tile_usage").fetchone()
+        return {"tiles": count, "pinned": pinned, "bytes": self.total_bytes, "max_bytes": self.max_bytes}
+
+
+class TileRequestHandler(BaseHTTPRequestHandler):
+    """GET /tiles/{z}/{x}/{y}[.ext]"""
+    cache = None
+
+    def do_GET(self):
+        match = re.fullmatch(r"/tiles/(\d+)/(\d+)/(\d+)(?:\.\w+)?", self.path.split("?", 1)[0])
+        data = self.cache.tile(*map(int, match.groups())) if match else None
+        if data is None:
+            self.send_error(404)
+            return
+        self.send_response(200)
+        self.send_header("Content-Type", tile_content_type(data))
+        self.send_header("Content-Length", str(len(data)))
+        self.send_header("Cache-Control", "public, max-age=86400")
+        self.send_header("Access-Control-Allow-Origin", "*")
+        self.end_headers()
+        self.wfile.write(data)
+
+    def log_message(self, format, *args):
+        pass
+
+
+@st.cache_resource(show_spinner=False)
+def tile_server():
+    """每个进程启动一次本机瓦片服务；端口已被占用时（如同机的其他 Streamlit 进程已启动服务）直接复用"""
+    cache = TileCache()
+    handler = type("DalianTileHandler", (TileRequestHandler,), {"cache": cache})
+    try:
+        server = ThreadingHTTPServer((TILE_SERVER_HOST, TILE_SERVER_PORT), handler)
+    except OSError:
+        return None
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, name="tile-server", daemon=True).start()
+    return server
+
+
+def tile_public_url():
+    """浏览器访问本机瓦片服务的地址。未设置 DALIAN_TILE_URL 时按浏览器访问本应用所用的主机名推导；
+    页面经 HTTPS 提供时 HTTP 瓦片会被浏览器作为混合内容拦截，无法推导，返回 None"""
+    if TILE_PUBLIC_URL:
+        return TILE_PUBLIC_URL
+    try:
+        url = urllib.parse.urlsplit(st.context.url or "")
+    except Exception:
+        return None
+    if url.scheme != "http" or not url.hostname:
+        return None
+    host = f"[{url.hostname}]" if ":" in url.hostname else url.hostname
+    return f"http://{host}:{TILE_SERVER_PORT}/tiles/{{z}}/{{x}}/{{y}}"
+
+
+def basemap_tiles_url():
+    """启用本机瓦片缓存且浏览器能访问瓦片服务时使用本机服务，否则直接使用上游瓦片"""
+    if not TILE_CACHE_ENABLED:
+        return TILE_UPSTREAM_URL
+    public_url = tile_public_url()
+    if public_url is None:
+        return TILE_UPSTREAM_URL
+    tile_server()
+    return public_url
+
+
+# -------------------------
+# 地图图层
+# -------------------------
+MARKER_COLORS = ['blue', 'green', 'yellow', 'orange', 'red']
+NO_DATA_COLOR = "#808080"
+
+
+def colormap_rgb(colormap, values):
+    """对整列数值一次性插值出 0–255 的 RGB 分量（与逐值调用 colormap 结果一致），返回 (分量, 无效值掩码)"""
+    values = np.asarray(values, dtype=float)
+    missing = np.isnan(values)
+    index = np.asarray(colormap.index, dtype=float)
+    rgb = np.asarray(colormap.colors, dtype=float)[:, :3]
+    x = np.where(missing, index[0], values)
+    channels = np.column_stack([np.interp(x, index, rgb[:, i]) for i in range(3)])
+    channels[x <= index[0]] = rgb[0]
+    return np.floor(channels * 255.9999).astype(np.int64), missing
+
+
+def colormap_colors(colormap, values, nan_color=NO_DATA_COLOR):
+    """对整列数值一次性插值出 "#rrggbb" 颜色，无效值为灰色"""
+    channels, missing = colormap_rgb(colormap, values)
+    codes = (channels * [65536, 256, 1]).sum(axis=1)
+    return np.where(missing, nan_color, np.char.mod("#%06x", codes))
+
+
+def text_column(df, col, default="未知"):
+    if col not in df.columns:
+        return [default] * len(df)
+    series = df[col]
+    return series.astype(str).where(series.notna(), default).tolist()
+
+
+def sites_geojson(df, values, colors):
+    """将全部点位打包为一个 FeatureCollection，属性仅保留弹窗与着色所需的字段"""
+    lngs = widen_float(df['经度']).round(6).tolist()
+    lats = widen_float(df['纬度']).round(6).tolist()
+    values = widen_float(values)
+    values = np.where(np.isnan(values), None, values).tolist()
+    features = [
+        {"type": "Feature", "id": i, "geometry": {"type": "Point", "coordinates": [lng, lat]},
+         "properties": {"c": c, "s": site, "t": time, "v": v}}
+        for i, (lng, lat, c, site, time, v) in enumerate(zip(
+            lngs, lats, np.asarray(colors).tolist(), text_column(df, '点位'), text_column(df, '采样时间'), values))
+    ]
+    return {"type": "FeatureCollection", "features": features}
+
+
+def to_js_literal(obj):
+    # 紧凑 JSON，并避免数据中的 "</" 提前结束 <script>
+    return json.dumps(obj, ensure_ascii=False, separators=(",", ":")).replace("</", "<\\/")
+
+
+# 自定义图层的 Leaflet 脚本模板；依赖 folium 的图层类在 map_layers() 中按需定义
+SITE_LAYER_TEMPLATE = """
+    {% macro script(this, kwargs) %}
+    var {{ this.get_name() }} = L.geoJSON({{ this.data }}, {
+        pointToLayer: function (feature, latlng) {
+            var c = feature.properties.c;
+            return L.circleMarker(latlng, {radius: 8, color: c, fillColor: c, fillOpacity: 0.8});
+        },
+        onEachFeature: function (feature, layer) {
+            var p = feature.properties, ll = feature.geometry.coordinates;
+            var esc = function (s) {
+                return String(s).replace(/[&<>"]/g, function (ch) {
+                    return {"&": "&amp;", "<": "&lt;", ">": "&gt;", '"': "&quot;"}[ch];
+                });
+            };
+            var r4 = function (x) { return Math.round(x * 1e4) / 1e4; };
+            layer.bindPopup(
+                '<div style="font-size:14px; width:250px;">' +
+                '<strong>点位：</strong>' + esc(p.s) + '<br>' +
+                '<strong>采样时间：</strong>' + esc(p.t) + '<br>' +
+                '<strong>经纬度：</strong>' + r4(ll[1]) + ', ' + r4(ll[0]) + '<hr>' +
+                '<strong style="color:#0b5bd7;">' + esc({{ this.param }}) + '：</strong>' +
+                (p.v === null ? '无数据' : p.v.toFixed(4)) + '<br></div>',
+                {maxWidth: 300}
+            );
+        }
+    }).addTo({{ this._parent.get_name() }});
+    {% endmacro %}
+"""
+
+
+def param_switch_config(df, meta):
+    """浏览器端切换参数所需的全部数据：点位坐标、点位×参数浓度矩阵、各参数范围与色带"""
+    values = {}
+    ranges = {}
+    for param in meta["all_param_cols"]:
+        column = widen_float(df[param.lower()])
+        values[param] = np.where(np.isnan(column), None, column).tolist()
+        param_range = meta["param_ranges"][param]
+        if param_range["min"] is None:
+            ranges[param] = None
+        else:
+            ranges[param] = [param_range["min"], max(param_range["max"], 1e-9)]
+    return to_js_literal({
+        "lng": widen_float(df['经度']).round(6).tolist(),
+        "lat": widen_float(df['纬度']).round(6).tolist(),
+        "site": text_column(df, '点位'),
+        "time": text_column(df, '采样时间'),
+        "params": list(meta["all_param_cols"]),
+        "values": values,
+        "ranges": ranges,
+        "stops": [list(c[:3]) for c in map_layers().cm.LinearColormap(MARKER_COLORS).colors],
+        "noData": NO_DATA_COLOR,
+    })
+
+
+PARAM_SWITCH_TEMPLATE = """
+    {% macro script(this, kwargs) %}
+    var {{ this.get_name() }} = (function (parent) {
+        var cfg = {{ this.config }};
+        var stops = cfg.stops, current = cfg.params[0];
+        var esc = function (s) {
+            return String(s).replace(/[&<>"]/g, function (ch) {
+                return {"&": "&amp;", "<": "&lt;", ">": "&gt;", '"': "&quot;"}[ch];
+            });
+        };
+        var r4 = function (x) { return Math.round(x * 1e4) / 1e4; };
+        var toRgb = function (c) {
+            return 'rgb(' + c.map(function (u) { return Math.floor(u * 255.9999); }).join(',') + ')';
+        };
+        var colorFor = function (v, range) {
+            if (v === null || range === null) return cfg.noData;
+            var t = range[1] > range[0] ? (v - range[0]) / (range[1] - range[0]) : 0;
+            t = Math.min(Math.max(t, 0), 1) * (stops.length - 1);
+            var i = Math.min(Math.floor(t), stops.length - 2), f = t - i;
+            return toRgb([0, 1, 2].map(function (k) { return stops[i][k] + (stops[i + 1][k] - stops[i][k]) * f; }));
+        };
+        var group = L.featureGroup().addTo(parent);
+        var markers = cfg.lat.map(function (lat, i) {
+            var marker = L.circleMarker([lat, cfg.lng[i]], {radius: 8, fillOpacity: 0.8}).addTo(group);
+            marker.bindPopup(function () {
+                var v = cfg.values[current][i];
+                return '<div style="font-size:14px; width:250px;">' +
+                    '<strong>点位：</strong>' + esc(cfg.site[i]) + '<br>' +
+                    '<strong>采样时间：</strong>' + esc(cfg.time[i]) + '<br>' +
+                    '<strong>经纬度：</strong>' + r4(lat) + ', ' + r4(cfg.lng[i]) + '<hr>' +
+                    '<strong style="color:#0b5bd7;">' + esc(current) + '：</strong>' +
+                    (v === null ? '无数据' : v.toFixed(4)) + '<br></div>';
+            }, {maxWidth: 300});
+            return marker;
+        });
+
+        var legend = L.control({position: 'topright'});
+        legend.onAdd = function () {
+            this.div = L.DomUtil.create('div', 'leaflet-bar');
+            this.div.style.cssText = 'background:white;padding:6px 10px;font-size:13px;min-width:220px;';
+            return this.div;
+        };
+        legend.addTo({{ this.map_name }});
+
+        var selector = L.control({position: 'topleft'});
+        selector.onAdd = function () {
+            var div = L.DomUtil.create('div', 'leaflet-bar');
+            div.style.cssText = 'background:white;padding:4px;';
+            var select = L.DomUtil.create('select', '', div);
+            select.style.cssText = 'font-size:14px;max-width:260px;';
+            cfg.params.forEach(function (p) {
+                var option = L.DomUtil.create('option', '', select);
+                option.value = p;
+                option.textContent = p;
+            });
+            L.DomEvent.disableClickPropagation(div);
+            L.DomEvent.disableScrollPropagation(div);
+            L.DomEvent.on(select, 'change', function () { apply(select.value); });
+            return div;
+        };
+        selector.addTo({{ this.map_name }});
+
+        var apply = function (param) {
+            current = param;
+            var values = cfg.values[param], range = cfg.ranges[param];
+            markers.forEach(function (marker, i) {
+                var c = colorFor(values[i], range);
+                marker.setStyle({color: c, fillColor: c});
+            });
+            if (range === null) {
+                legend.div.innerHTML = '<b>' + esc(param) + ' 浓度</b><br>无有效数值数据';
+            } else {
+                var gradient = stops.map(toRgb).join(',');
+                legend.div.innerHTML = '<b>' + esc(param) + ' 浓度</b>' +
+                    '<div style="height:10px;margin:4px 0;background:linear-gradient(to right,' + gradient + ');"></div>' +
+                    '<span>' + r4(range[0]) + '</span><span style="float:right;">' + r4(range[1]) + '</span>';
+            }
+        };
+        apply(current);
+        return group;
+    })({{ this._parent.get_name() }});
+    {% endmacro %}
+"""
+
+
+def clusters_geojson(aggregates, colors):
+    def nullable(values):
+        values = np.asarray(values, dtype=float)
+        return np.where(np.isnan(values), None, values).tolist()
+
+    features = [
+        {"type": "Feature", "geometry": {"type": "Point", "coordinates": [lng, lat]},
+         "properties": {"c": c, "n": n, "k": k, "m": m, "x": x, "e": e}}
+        for lng, lat, c, n, k, m, x, e in zip(
+            aggregates["lng"].round(6).tolist(), aggregates["lat"].round(6).tolist(), np.asarray(colors).tolist(),
+            aggregates["count"].tolist(), aggregates["n_valid"].tolist(),
+            nullable(aggregates["mean"]), nullable(aggregates["max"]), aggregates["exceed"].tolist())
+    ]
+    return {"type": "FeatureCollection", "features": features}
+
+
+CLUSTER_LAYER_TEMPLATE = """
+    {% macro script(this, kwargs) %}
+    var {{ this.get_name() }} = L.geoJSON({{ this.data }}, {
+        pointToLayer: function (feature, latlng) {
+            var p = feature.properties;
+            return L.circleMarker(latlng, {
+                radius: 8 + 4 * Math.log2(p.n), color: p.e > 0 ? '#8b0000' : p.c,
+                weight: p.e > 0 ? 3 : 1, fillColor: p.c, fillOpacity: 0.8
+            });
+        },
+        onEachFeature: function (feature, layer) {
+            var p = feature.properties;
+            var fmt = function (v) { return v === null ? '无数据' : v.toFixed(4); };
+            if (p.n > 1) {
+                layer.bindTooltip(String(p.n), {permanent: true, direction: 'center', className: 'lod-count'});
+            }
+            layer.bindPopup(
+                '<div style="font-size:14px; width:250px;">' +
+                '<strong>样本数：</strong>' + p.n + '（有效 ' + p.k + '）<hr>' +
+                '<strong style="color:#0b5bd7;">' + {{ this.param }} + '</strong><br>' +
+                '<strong>均值：</strong>' + fmt(p.m) + '<br>' +
+                '<strong>最大值：</strong>' + fmt(p.x) + '<br>' +
+                '<strong>超标数：</strong>' + p.e + '</div>',
+                {maxWidth: 300}
+            );
+        }
+    }).addTo({{ this._parent.get_name() }});
+    {% endmacro %}
+"""
+
+
+@st.cache_resource(show_spinner=False)
+def map_layers():
+    """首次构建地图时才导入 folium / branca 并定义依赖它们的自定义图层，
+    只访问首页或 CAS 页的会话不承担这部分导入开销"""
+    import branca.colormap as cm
+    import folium
+    from folium.template import Template
+    from folium.utilities import get_obj_in_upper_tree
+
+    class SiteLayer(folium.MacroElement):
+        """以单个 GeoJSON 图层渲染全部点位，标记样式与弹窗内容由浏览器端按要素属性生成"""
+        _template = Template(SITE_LAYER_TEMPLATE)
+
+        def __init__(self, df, values, colors, param_name):
+            super().__init__()
+            self._name = "SiteLayer"
+            self.marker_count = len(df)
+            self.data = to_js_literal(sites_geojson(df, values, colors))
+            self.param = to_js_literal(param_name)
+
+    class ParamSwitchLayer(folium.MacroElement):
+        """一次性下发浓度矩阵，参数切换只在浏览器端重设标记颜色、弹窗与图例，无需重建地图"""
+        _template = Template(PARAM_SWITCH_TEMPLATE)
+
+        def __init__(self, config, marker_count=0):
+            super().__init__()
+            self._name = "ParamSwitchLayer"
+            self.config = config
+            self.marker_count = marker_count
+            self.map_name = None
+
+        def render(self, **kwargs):
+            # 图例与下拉框是地图控件，需要直接挂到地图对象上
+            self.map_name = get_obj_in_upper_tree(self, folium.Map).get_name()
+            super().render(**kwargs)
+
+    class ClusterLayer(folium.MacroElement):
+        """聚合单元图层：圆点大小随样本数变化，颜色取单元均值，弹窗显示样本数、均值、最大值与超标数"""
+        _template = Template(CLUSTER_LAYER_TEMPLATE)
+
+        def __init__(self, aggregates, colors, param_name):
+            super().__init__()
+            self._name = "ClusterLayer"
+            self.marker_count = len(aggregates["count"])
+            self.data = to_js_literal(clusters_geojson(aggregates, colors))
+            self.param = to_js_literal(param_name)
+
+    return types.SimpleNamespace(folium=folium, cm=cm, SiteLayer=SiteLayer,
+                                 ParamSwitchLayer=ParamSwitchLayer, ClusterLayer=ClusterLayer)
+
+
+def create_map():
+    # 地图脚本中使用固定初始视野，当前视野通过 st_folium 的 center/zoom 参数恢复，
+    # 这样平移缩放后的重跑不会改变脚本内容，也就不会重新挂载 iframe
+    tiles_url = basemap_tiles_url()
+    m = map_layers().folium.Map(
+        location=MAP_DEFAULT_CENTER,
+        zoom_start=MAP_DEFAULT_ZOOM,
+        tiles=tiles_url,
+        attr="地图",
+        control_scale=True
+    )
+    return m
+
+
+def create_colormap(df, selected_param):
+    param_valid = widen_float(df[selected_param.lower()])
+    param_valid = param_valid[~np.isnan(param_valid)]
+    if not param_valid.size:
+        return None
+    max_val = max(param_valid.max(), 1e-9)
+    colormap = map_layers().cm.LinearColormap(MARKER_COLORS, vmin=param_valid.min(), vmax=max_val)
+    colormap.caption = f"{selected_param} 浓度"
+    return colormap
+
+
+def create_map_with_markers(df, selected_param, surface=None):
+    layers = map_layers()
+    folium = layers.folium
+    m = create_map()
+    param_col_clean = selected_param.lower()
+    colormap = create_colormap(df, selected_param)
+    if colormap is not None:
+        m.add_child(colormap)
+    # 插值浓度面先于点位加入，位于点位下方
+    if surface is not None:
+        url, bounds = surface
+        folium.raster_layers.ImageOverlay(url, bounds=bounds, opacity=SURFACE_OPACITY, name="插值浓度面").add_to(m)
+
+    # 创建一个 FeatureGroup，全部点位以单个 GeoJSON 图层加入
+    feature_group = folium.FeatureGroup(name="浓度点位")
+    values = df[param_col_clean].to_numpy()
+    if colormap is not None:
+        colors = colormap_colors(colormap, values)
+    else:
+        colors = np.full(len(df), NO_DATA_COLOR)
+    layers.SiteLayer(df, values, colors, selected_param).add_to(feature_group)
+    feature_group.add_to(m)
+
+    # 添加点击事件处理的JavaScript
+    click_js = """
+    <script>
+    // 监听地图点击事件
+    document.addEventListener('DOMContentLoaded', function() {
+        const map = document.querySelector('.folium-map');
+        if (map) {
+            map.addEventListener('click', function(e) {
+                // 检查是否点击了标记
+                if (e.target.closest('.leaflet-marker-icon') || e.target.closest('.leaflet-popup-content')) {
+                    // 标记点击已经在popup中处理
+                    return;
+                }
+                // 点击地图空白处，清空选中数据
+                window.parent.postMessage({
+                    type: 'streamlit:setSessionState',
+                    data: { clicked_point_data: null }
+                }, '*');
+            });
+        }
+    });
+    </script>
+    """
+    m.get_root().html.add_child(folium.Element(click_js))
+
+    return m
+
+
+def count_markers(element):
+    """统计图层树中各点位图层声明的标记数"""
+    return getattr(element, "marker_count", 0) + sum(count_markers(child) for child in element._children.values())
+
+
+# -------------------------
+# 后台预热与数据文件监视
+# -------------------------
+# 首次重跑时即在后台线程中并行解析、规范化并索引两份数据，进入页面时通常已就绪；
+# 页面只在数据集尚未加载过时等待预热完成。此后由监视线程轮询源文件签名，只重建发生变化的数据集，
+# 新版本及其派生索引在后台全部就绪后一次性替换，期间各会话继续使用旧版本
+WARMUP_WORKERS = 2
+DATA_WATCH_INTERVAL = float(os.environ.get("DALIAN_WATCH_INTERVAL", "5"))
+CONCENTRATION_FILE = "浓度点位数据.xlsx"
+TOXICITY_FILE = "./毒性数据.xlsx"
+TOXICITY_SHEET = "MM-GCN预测毒性数据集"
+
+
+@st.cache_resource(show_spinner=False)
+def warmup_state():
+    return {"lock": threading.Lock(), "futures": {},
+            "executor": ThreadPoolExecutor(max_workers=WARMUP_WORKERS, thread_name_prefix="warmup")}
+
+
+def prepare_concentration(dataset):
+    site_index(dataset)
+    campaign_index(dataset)
+
+
+def prepare_cas(dataset):
+    if 'CAS' in dataset.frame.columns:
+        cas_index(dataset)
+
+
+WARMUP_TASKS = {
+    "concentration": (CONCENTRATION_FILE, read_concentration_cached, prepare_concentration),
+    "cas": (TOXICITY_FILE, lambda path: parse_cas_workbook(path, TOXICITY_SHEET), prepare_cas),
+}
+
+
+def warm_dataset(kind, filepath, loader, prepare):
+    try:
+        return build_dataset(kind, filepath, loader, prepare)
+    finally:
+        # 提交时登记的重建标记在任务结束（无论成败）时撤销
+        end_refresh(kind, filepath)
+
+
+def start_warmup():
+    """提交预热任务；同一源文件版本只提交一次，文件更新后再次调用会在后台重建对应的数据集"""
+    state = warmup_state()
+    with state["lock"]:
+        for kind, (filepath, loader, prepare) in WARMUP_TASKS.items():
+            if not file_exists(filepath):
+                continue
+            signature = file_signature(filepath)
+            submitted = state["futures"].get(kind)
+            if submitted is not None and submitted[0] == signature:
+                continue
+            begin_refresh(kind, filepath)
+            future = state["executor"].submit(warm_dataset, kind, filepath, loader, prepare)
+            state["futures"][kind] = (signature, future)
+
+
+@st.cache_resource(show_spinner=False)
+def data_watcher():
+    """每个进程一个监视线程，定期检查源文件签名并提交重建；间隔为 0 时不监视，只在重跑时检查"""
+    if DATA_WATCH_INTERVAL <= 0:
+        return None
+
+    def watch():
+        while True:
+            time.sleep(DATA_WATCH_INTERVAL)
+            try:
+                start_warmup()
+            except Exception:
+                # 文件正在被覆盖写入等瞬时错误，下一轮再检查
+                pass
+
+    thread = threading.Thread(target=watch, name="data-watcher", daemon=True)
+    thread.start()
+    return thread
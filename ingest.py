@@ -0,0 +1,41 @@
+"""
+把浓度/毒性工作簿导入本地分析库（默认 dalian_archive.sqlite，可用环境变量 DALIAN_STORE 指定）。
+目录参数会展开为其中的全部 .xlsx 文件；源文件未变化的工作表自动跳过。
+
+    python ingest.py 浓度点位数据.xlsx 毒性数据.xlsx surveys/
+"""
+import argparse
+import glob
+import os
+
+import dalian_core as core
+
+
+def expand_paths(paths):
+    for path in paths:
+        if os.path.isdir(path):
+            yield from sorted(p for p in glob.glob(os.path.join(path, "**", "*.xlsx"), recursive=True)
+                              if not os.path.basename(p).startswith("~$"))
+        else:
+            yield path
+
+
+def main():
+    parser = argparse.ArgumentParser(description="导入工作簿到本地分析库")
+    parser.add_argument("paths", nargs="+", help="工作簿文件或目录")
+    parser.add_argument("--store", default=core.STORE_FILE, help="数据库文件路径")
+    parser.add_argument("--sheet", action="append", help="只导入指定工作表，可重复")
+    args = parser.parse_args()
+
+    for path in expand_paths(args.paths):
+        try:
+            results = core.ingest_workbook(path, store=args.store, sheets=args.sheet)
+        except Exception as e:
+            print(f"{path}: 导入失败：{e}")
+            continue
+        for sheet, result in results.items():
+            print(f"{path} [{sheet}]: {result}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,54 @@
+"""
+预下载大连近岸海域的底图瓦片到本地 MBTiles 库（默认 basemap_tiles.mbtiles，可用环境变量 DALIAN_TILE_FILE 指定），
+供内网或离线部署时由 DALIAN_TILE_CACHE=1 启用的本机瓦片服务使用。预下载的瓦片不参与 LRU 淘汰。
+
+瓦片服务默认监听 0.0.0.0:8765（DALIAN_TILE_HOST / DALIAN_TILE_PORT），浏览器按访问本应用所用的主机名加该端口
+取瓦片，防火墙需放行该端口。应用经 HTTPS 或反向代理对外提供时必须用 DALIAN_TILE_URL 指定代理后的瓦片地址
+（如 https://example.org/tiles/{z}/{x}/{y}），否则浏览器会拦截 HTTP 瓦片，应用将改用在线底图。
+
+    python seed_tiles.py --zoom 6-13
+    python seed_tiles.py --zoom 14-15 --bounds 38.8,121.2,39.2,121.8
+    python seed_tiles.py --stats
+"""
+import argparse
+import sys
+
+import dalian_core as core
+
+
+def parse_zooms(text):
+    low, _, high = text.partition("-")
+    return int(low), int(high or low)
+
+
+def parse_bounds(text):
+    south, west, north, east = (float(v) for v in text.split(","))
+    return south, west, north, east
+
+
+def main():
+    parser = argparse.ArgumentParser(description="预下载底图瓦片")
+    parser.add_argument("--zoom", type=parse_zooms, default=core.TILE_SEED_ZOOMS, help="缩放级别范围，如 6-13")
+    parser.add_argument("--bounds", type=parse_bounds, default=core.TILE_SEED_BOUNDS, help="south,west,north,east")
+    parser.add_argument("--workers", type=int, default=8)
+    parser.add_argument("--stats", action="store_true", help="只显示缓存统计")
+    args = parser.parse_args()
+
+    cache = core.TileCache()
+    if not args.stats:
+        if cache.upstream is None:
+            parser.error("未配置上游瓦片地址（DALIAN_TILE_UPSTREAM 为空），无法预下载")
+
+        def progress(done, total):
+            if done == total or done % 100 == 0:
+                print(f"\r{done}/{total}", end="", file=sys.stderr, flush=True)
+
+        fetched, existing, failed = cache.seed(args.bounds, args.zoom, args.workers, progress)
+        print(f"\n新下载 {fetched} 个，已存在 {existing} 个，失败 {failed} 个", file=sys.stderr)
+    stats = cache.stats()
+    print(f"瓦片 {stats['tiles']} 个（常驻 {stats['pinned']} 个），"
+          f"{stats['bytes'] / 1024 / 1024:.1f} / {stats['max_bytes'] / 1024 / 1024:.0f} MB")
+
+
+if __name__ == "__main__":
+    main()
@@ -1,582 +1,1163 @@
-import streamlit as st
-import pandas as pd
-import folium
-from streamlit_folium import st_folium
-import branca.colormap as cm
-import os
-import warnings
-import numpy as np
-import base64
-import json
-
-st.set_option("client.toolbarMode", "viewer")
-
-
-# --- 定义一个函数来读取图片并转换为base64 ---
-def get_base64_of_bin_file(bin_file):
-    with open(bin_file, 'rb') as f:
-        data = f.read()
-    return base64.b64encode(data).decode()
-
-
-warnings.filterwarnings("ignore")
-
-# -------------------------
-# 页面与样式设置
-# -------------------------
-st.set_page_config(page_title="大连近岸海域抗生素及环境激素风险管控平台", layout="wide", initial_sidebar_state="collapsed")
-
-
-def set_global_font_size(size="16px"):
-    st.markdown(f"""
-    <style>
-    html, body, [class*="css"] {{
-        font-size: {size} !important;
-    }}
-    </style>
-    """, unsafe_allow_html=True)
-
-
-set_global_font_size("30px")
-
-
-def set_background(png_file):
-    bin_str = get_base64_of_bin_file(png_file)
-    page_bg_img = f'''
-    <style>
-    .stApp {{
-        background-image: url("data:image/png;base64,{bin_str}");
-        background-size: cover;
-        background-position: center;
-        background-repeat: no-repeat;
-        background-attachment: fixed;
-    }}
-    </style>
-    '''
-    st.markdown(page_bg_img, unsafe_allow_html=True)
-
-
-# set_background('homepage_image.png')
-
-# 隐藏 Streamlit 默认侧边栏与顶部菜单
-st.markdown("""
-    <style>
-        /* 隐藏侧边栏 */
-        [data-testid="stSidebar"] { display: none; }
-        [data-testid="collapsedControl"] { display: none; }
-
-        div[data-testid="stToolbar"] {
-            display: none !important;
-        }
-        div[data-testid="stDecoration"] {
-            display: none !important;
-        }
-        div[data-testid="stStatusWidget"] {
-            visibility: hidden !important;
-        }
-
-        /* 卡片与按钮样式 */
-        .func-card {
-            border-radius: 12px;
-            padding: 18px;
-            margin-bottom: 16px;
-            border: 1px solid #E6EEF8;
-            background: linear-gradient(180deg,#ffffff,#f6fbff);
-            box-shadow: 0 6px 18px rgba(38,78,119,0.06);
-        }
-        .func-title { 
-            font-size: 20px; 
-            font-weight:500; 
-            margin-bottom:6px; 
-            color:#003366; 
-        }
-        .func-desc { 
-            font-size:14px; 
-            color:#333; 
-            margin-bottom:8px; 
-        }
-        .func-btn {
-            background-color:#0b5bd7;
-            color:white;
-            padding:8px 14px;
-            border-radius:8px;
-            border: none;
-            font-weight:600;
-        }
-        .func-btn:hover { 
-            opacity: 0.9; 
-            cursor: pointer; 
-        }
-
-        /* 改变输入框的字体大小和高度 */
-        div.stTextInput>div>div>input {
-            font-size: 30px;   /* 字体大小 */
-            line-height: 50px;      /* 输入框高度 */
-        }
-
-        /* --- 1. 全局Streamlit按钮样式 (背景、尺寸等) --- */
-        div.stButton > button:first-child {
-            background: linear-gradient(135deg, #0723f2, #1375f9) !important;
-            color: white !important;
-            padding: 0.5rem 1.25rem !important;
-            border-radius: 0.25rem !important;
-            border: none !important;
-            cursor: pointer !important;
-            width: 400px !important;
-            height: 50px !important;
-            transition: all 0.3s ease !important;
-        }
-
-        /* --- 3. 按钮悬停效果 --- */
-        div.stButton > button:first-child:hover {
-            opacity: 0.9 !important;
-            background: linear-gradient(135deg, #0723f2, #1375f9) !important;
-            transform: translateY(-2px) !important;
-            box-shadow: 0 4px 8px rgba(0,0,0,0.2) !important;
-        }
-
-        /* 自定义数据面板样式 */
-        .data-panel {
-            border: 3px solid #0b5bd7;
-            border-radius: 15px;
-            padding: 25px;
-            background-color: #f0f8ff;
-            height: 100%; /* 让面板占满列的高度 */
-            overflow-y: auto; /* 如果内容太多，显示滚动条 */
-            box-shadow: 0 6px 18px rgba(11, 91, 215, 0.1);
-        }
-        .data-panel h4 {
-            color: #0b5bd7;
-            border-bottom: 2px solid #0b5bd7;
-            padding-bottom: 10px;
-            margin-top: 0;
-        }
-    </style>
-""", unsafe_allow_html=True)
-
-# -------------------------
-# session_state 初始化
-# -------------------------
-if 'page' not in st.session_state:
-    st.session_state.page = "home"  # 'home', 'map', 'cas'
-
-# 新增：用于存储点击的点位数据
-if 'clicked_point_data' not in st.session_state:
-    st.session_state.clicked_point_data = None
-
-# 地图与数据状态
-if 'map_center' not in st.session_state:
-    st.session_state.map_center = [39.618, 122.228]
-    st.session_state.map_zoom = 8
-    st.session_state.last_map_key = 0
-    st.session_state.all_param_cols = []
-    st.session_state.param_ranges = {}
-    st.session_state.cas_data_loaded = False
-    st.session_state.cas_data = None
-    st.session_state.excel_columns = []
-
-
-# -------------------------
-# 共享辅助函数
-# -------------------------
-def file_exists(file_path):
-    return os.path.exists(file_path)
-
-
-def load_concentration_data(filepath="浓度点位数据.xlsx"):
-    try:
-        df = pd.read_excel(filepath)
-        df.columns = df.columns.astype(str).str.strip().str.replace('\n', '').str.lower()
-        st.session_state.excel_columns = df.columns.tolist()
-        base_cols_clean = ['分类', '序号', '点位', '采样时间', '经度', '纬度']
-        missing_base_cols = [col for col in base_cols_clean if col not in df.columns]
-        if missing_base_cols:
-            st.error(f"Excel 缺少基础列（小写匹配后）：{', '.join(missing_base_cols)}")
-            return pd.DataFrame()
-        df = df.dropna(subset=['经度', '纬度']).reset_index(drop=True)
-        exclude_cols = ['水深', '水温℃', '盐度', 'ph', '溶解氧mg/l']
-        param_cols = [col for col in df.columns if col not in base_cols_clean and col not in exclude_cols]
-        param_cols_original = [col.capitalize() if col not in ['经度', '纬度'] else col for col in param_cols]
-        st.session_state.all_param_cols = param_cols_original
-
-        param_ranges = {}
-        for col in param_cols_original:
-            lower = col.lower()
-            if lower not in df.columns:
-                param_ranges[col] = {"min": None, "max": None}
-                continue
-            numeric_series = pd.to_numeric(df[lower], errors='coerce').dropna()
-            if not numeric_series.empty:
-                param_ranges[col] = {"min": float(numeric_series.min()), "max": float(numeric_series.max())}
-            else:
-                param_ranges[col] = {"min": None, "max": None}
-        st.session_state.param_ranges = param_ranges
-        return df
-    except FileNotFoundError:
-        st.error(f"未找到文件：{filepath}")
-        return pd.DataFrame()
-    except Exception as e:
-        st.error(f"读取浓度数据出错：{e}")
-        return pd.DataFrame()
-
-
-def load_cas_data(filepath="./毒性数据.xlsx", sheet="MM-GCN预测毒性数据集"):
-    try:
-        temp_data = pd.read_excel(filepath, sheet_name=sheet)
-        temp_data.columns = temp_data.iloc[0]
-        temp_data = temp_data.drop(temp_data.index[0]).reset_index(drop=True)
-        if 'CAS' in temp_data.columns:
-            temp_data['CAS'] = temp_data['CAS'].astype(str)
-        st.session_state.cas_data = temp_data
-        st.session_state.cas_data_loaded = True
-        return temp_data
-    except FileNotFoundError:
-        st.error(f"未找到文件：{filepath}")
-        return pd.DataFrame()
-    except Exception as e:
-        st.error(f"读取毒性数据出错：{e}")
-        return pd.DataFrame()
-
-
-# -------------------------
-# 路由函数
-# -------------------------
-def goto(page_name):
-    st.session_state.page = page_name
-    # 切换页面时清空点击数据
-    st.session_state.clicked_point_data = None
-    try:
-        st.rerun()
-    except AttributeError:
-        try:
-            st.experimental_rerun()
-        except Exception as e:
-            st.warning(f"页面跳转需要Streamlit 1.18.0+版本。错误：{e}")
-
-
-# -------------------------
-# 首页
-# -------------------------
-def page_home():
-    st.markdown(
-        "<h1 style='text-align:center;margin-top:-100px;font-size: 65px;'>大连近岸海域抗生素及环境激素风险管控平台</h1>",
-        unsafe_allow_html=True)
-
-    # 页面布局：左图 (宽) , 右功能卡 (窄)
-    col1, col2 = st.columns([2, 1], gap="large")
-
-    with col1:
-        img_path = "homepage_image.png"
-        st.image(img_path, width='stretch')
-
-    with col2:
-        with st.container():
-            st.markdown("<div class='func-title' style='font-size: 60px;'>浓度数据</div>",
-                        unsafe_allow_html=True)
-
-            if st.button("进入浓度地图", key="btn_map", type="primary"):
-                goto("map")
-
-        with st.container():
-
-            st.markdown("<div style='height:20px;'></div>", unsafe_allow_html=True)
-
-            # 功能卡2：CAS查询
-            st.markdown("<div class='func-title' style='font-size: 60px;'>毒性数据</div>",
-                        unsafe_allow_html=True)
-
-            if st.button("进入CAS查询", key="btn_cas", type="primary"):
-                goto("cas")
-
-    st.markdown("---")
-    # 平台说明
-    st.markdown("""
-    <div style="color:#444;font-size:40px;">
-        本平台由 <b>大连理工大学环境学院</b> 开发
-    </div>
-    """, unsafe_allow_html=True)
-
-
-# -------------------------
-# 浓度地图页面 (修复版本)
-# -------------------------
-def page_map():
-    st.header("大连近岸海域抗生素及环境激素浓度地图")
-
-    # 页面布局：左侧地图，右侧数据面板
-    df = load_concentration_data("浓度点位数据.xlsx")
-    if df.empty:
-        st.warning("未加载到有效浓度数据，返回首页查看帮助或检查文件。")
-        return
-
-    if st.session_state.all_param_cols:
-        selected_param = st.selectbox("", st.session_state.all_param_cols)
-    else:
-        st.warning("未识别到参数列。请检查 Excel 列名。")
-        return
-
-    def create_map():
-        tiles_url = "https://webst01.is.autonavi.com/appmaptile?style=6&x={x}&y={y}&z={z}"
-        m = folium.Map(
-            location=st.session_state.map_center,
-            zoom_start=st.session_state.map_zoom,
-            tiles=tiles_url,
-            attr="地图",
-            control_scale=True
-        )
-        return m
-
-    def create_map_with_markers(selected_param):
-        m = create_map()
-        param_col_clean = selected_param.lower()
-        param_valid = pd.to_numeric(df[param_col_clean], errors='coerce').dropna()
-        if param_valid.empty:
-            st.warning(f"当前选择的参数【{selected_param}】无有效数值数据，标记将显示灰色。")
-            colormap = None
-        else:
-            max_val = max(param_valid.max(), 1e-9)
-            colormap = cm.LinearColormap(['blue', 'green', 'yellow', 'orange', 'red'], vmin=param_valid.min(),
-                                         vmax=max_val)
-            colormap.caption = f"{selected_param} 浓度"
-            m.add_child(colormap)
-
-        # 创建一个 FeatureGroup 来存储所有标记
-        feature_group = folium.FeatureGroup(name="浓度点位")
-
-        for idx, row in df.iterrows():
-            lat, lng = row['纬度'], row['经度']
-
-            # 准备基础水文数据（必显示）
-            base_data = {
-                '点位': row.get('点位', '未知'),
-                # '分类': row.get('分类', '未知'),
-                '采样时间': row.get('采样时间', '未知'),
-                '纬度': round(lat, 4),
-                '经度': round(lng, 4),
-            }
-            # 只获取当前选中参数的浓度
-            selected_val = row.get(param_col_clean, np.nan)
-            base_data[selected_param] = f"{float(selected_val):.4f}" if pd.notna(selected_val) else "无数据"
-
-            # 创建弹窗内容：仅显示基础水文信息 + 当前选中参数浓度
-            popup_html = f"""
-                <div style="font-size:14px; width:250px;">
-                <strong>点位：</strong>{base_data['点位']}<br>
-                <strong>采样时间：</strong>{base_data['采样时间']}<br>
-                <strong>经纬度：</strong>{base_data['纬度']}, {base_data['经度']}<hr>
-                <strong style="color:#0b5bd7;">{selected_param}：</strong>{base_data[selected_param]}<br>
-                </div>
-            """
-
-            # 决定标记点颜色
-            color = "#808080"
-            if not pd.isna(row[param_col_clean]) and colormap:
-                try:
-                    color = colormap(float(row[param_col_clean]))
-                except:
-                    pass
-
-            # 创建标记点
-            marker = folium.CircleMarker(
-                location=[lat, lng],
-                radius=8,
-                color=color,
-                fill=True,
-                fill_color=color,
-                fill_opacity=0.8,
-                popup=folium.Popup(popup_html, max_width=300)
-            )
-
-            marker.add_to(feature_group)
-
-        feature_group.add_to(m)
-
-        # 添加点击事件处理的JavaScript
-        click_js = """
-        <script>
-        // 监听地图点击事件
-        document.addEventListener('DOMContentLoaded', function() {
-            const map = document.querySelector('.folium-map');
-            if (map) {
-                map.addEventListener('click', function(e) {
-                    // 检查是否点击了标记
-                    if (e.target.closest('.leaflet-marker-icon') || e.target.closest('.leaflet-popup-content')) {
-                        // 标记点击已经在popup中处理
-                        return;
-                    }
-                    // 点击地图空白处，清空选中数据
-                    window.parent.postMessage({
-                        type: 'streamlit:setSessionState',
-                        data: { clicked_point_data: null }
-                    }, '*');
-                });
-            }
-        });
-        </script>
-        """
-        m.get_root().html.add_child(folium.Element(click_js))
-
-        return m
-
-    # 在左侧列中显示地图
-    map_key = f"map_{st.session_state.last_map_key}_{selected_param}"
-    map_data = st_folium(create_map_with_markers(selected_param), width=1200, height=800, key=map_key,
-                         returned_objects=["center", "zoom", "last_object_clicked"])
-
-    if map_data and map_data.get("center") and map_data.get("zoom"):
-        st.session_state.map_center = [map_data["center"]["lat"], map_data["center"]["lng"]]
-        st.session_state.map_zoom = map_data["zoom"]
-
-    # 处理通过last_object_clicked传递的数据：仅存储基础信息+当前选中参数
-    if map_data and map_data.get("last_object_clicked"):
-        clicked_lat = map_data["last_object_clicked"]["lat"]
-        clicked_lng = map_data["last_object_clicked"]["lng"]
-
-        # 查找对应的数据点
-        tolerance = 0.01  # 容差范围
-        matched_rows = df[
-            (abs(df['纬度'] - clicked_lat) < tolerance) &
-            (abs(df['经度'] - clicked_lng) < tolerance)
-            ]
-
-        if not matched_rows.empty:
-            row = matched_rows.iloc[0]
-            # 仅存储基础水文信息和当前选中参数
-            point_data = {
-                '点位': row.get('点位', '未知'),
-                # '分类': row.get('分类', '未知'),
-                '采样时间': row.get('采样时间', '未知'),
-                '纬度': round(row['纬度'], 4),
-                '经度': round(row['经度'], 4),
-                selected_param: f"{float(row.get(selected_param.lower(), np.nan)):.4f}"
-                                if pd.notna(row.get(selected_param.lower(), np.nan)) else "无数据"
-            }
-            st.session_state.clicked_point_data = point_data
-
-            # 显示点击后的详情面板（仅基础信息+选中参数）
-            # st.markdown("---")
-            # st.markdown(f"<h3>点位详情 - {point_data['点位']}</h3>", unsafe_allow_html=True)
-            # with st.container(class_="data-panel"):
-            #     col1, col2 = st.columns(2)
-            #     with col1:
-            #         # st.markdown(f"<strong>分类：</strong>{point_data['分类']}", unsafe_allow_html=True)
-            #         st.markdown(f"<strong>采样时间：</strong>{point_data['采样时间']}", unsafe_allow_html=True)
-            #         st.markdown(f"<strong>纬度：</strong>{point_data['纬度']}", unsafe_allow_html=True)
-            #         st.markdown(f"<strong>经度：</strong>{point_data['经度']}", unsafe_allow_html=True)
-            #     with col2:
-            #         st.markdown(f"<strong style='color:#0b5bd7; font-size:28px;'>{selected_param}：</strong>{point_data[selected_param]}",
-            #                    unsafe_allow_html=True)
-
-    # 返回首页按钮和下载按钮
-    st.markdown("---")
-    conc_file = "浓度点位数据.xlsx"
-    if file_exists(conc_file):
-        with open(conc_file, "rb") as f:
-            st.download_button("下载浓度点位数据", data=f, file_name=conc_file)
-    back_col, _ = st.columns([1, 9])
-    with back_col:
-        if st.button("← 返回首页"):
-            goto("home")
-
-# -------------------------
-# CAS 查询页面
-# -------------------------
-def page_cas():
-    st.markdown(
-        "<div class='func-title' style='font-size: 60px; font-weight: 700;'>CAS 号查询</div>",
-        unsafe_allow_html=True
-    )
-
-    if not st.session_state.cas_data_loaded:
-        temp = load_cas_data("./毒性数据.xlsx")
-        if temp.empty:
-            st.warning("毒性数据未加载，请检查文件。")
-            return
-
-    if st.session_state.cas_data is None or st.session_state.cas_data.empty:
-        st.warning("毒性数据为空，请检查源文件。")
-        return
-
-    cas_input = st.text_input("查询", placeholder="例如：1912-24-9", label_visibility='hidden')
-    if st.button("查询"):
-        if not cas_input:
-            st.warning("请输入 CAS 号")
-        else:
-            cas_input_str = str(cas_input).strip()
-            result = st.session_state.cas_data[st.session_state.cas_data['CAS'] == cas_input_str]
-            if not result.empty:
-                st.markdown(
-                    f"""
-                    <div style="background-color:#f0f8ff; padding:10px; border-radius:4px; margin-bottom:12px;font-size:30px">
-                        ✅ 找到CAS号为 {cas_input_str} 的记录
-                    </div>
-                    """,
-                    unsafe_allow_html=True
-                )
-                result_row = result.iloc[0]
-                test_fields = ['AD 检验', 'KS 检验', 'JB 检验']
-                other_fields = [field for field in result.columns if field not in test_fields]
-
-                for field_name in other_fields:
-                    field_value = result_row[field_name]
-                    display_value = str(field_value) if pd.notna(field_value) else "无数据"
-                    col_left, col_right = st.columns([2, 3])
-                    with col_left:
-                        st.markdown(
-                            f"<div style='background-color:#f0f8ff;padding:10px; border-radius:4px; margin-bottom:8px; text-align:right;font-size:25px;'><strong>{field_name}：</strong></div>",
-                            unsafe_allow_html=True)
-                    with col_right:
-                        st.markdown(
-                            f"<div style='padding:10px; border-radius:4px; margin-bottom:8px; text-align:left;font-size:25px;'>{display_value}</div>",
-                            unsafe_allow_html=True)
-
-                test_cols = st.columns(3)
-                for i, field_name in enumerate(test_fields):
-                    field_value = result_row[field_name]
-                    display_value = str(field_value) if pd.notna(field_value) else "无数据"
-                    color = "#28a745" if str(field_value).lower() == "true" else "#dc3545"
-                    icon = "✅" if str(field_value).lower() == "true" else "❌"
-                    with test_cols[i]:
-                        st.markdown(
-                            f"""
-                            <div style="padding:10px; border-radius:4px; margin-bottom:8px; text-align:center;font-size:25px;">
-                                <strong>{field_name}</strong>
-                                <div style="color:{color}; font-size:25px; margin-top:5px;">{icon} {display_value}</div>
-                            </div>
-                            """,
-                            unsafe_allow_html=True
-                        )
-            else:
-                st.markdown(
-                    f"""
-                    <div style="background-color:#f0f8ff; padding:10px; border-radius:0px; margin-bottom:25px;font-size:30px">
-                        未找到CAS号为 {cas_input_str} 的记录
-                    </div>
-                    """,
-                    unsafe_allow_html=True
-                )
-    st.markdown("---")
-    conc_file = "毒性数据.xlsx"
-    if file_exists(conc_file):
-        with open(conc_file, "rb") as f:
-            st.download_button("下载毒性数据", data=f, file_name=conc_file)
-    back_col, _ = st.columns([1, 9])
-    with back_col:
-        if st.button("← 返回首页"):
-            goto("home")
-
-
-# -------------------------
-# 主控制
-# -------------------------
-if st.session_state.page == "home":
-    page_home()
-elif st.session_state.page == "map":
-    page_map()
-elif st.session_state.page == "cas":
-    page_cas()
-else:
-    page_home()
-
-
-
+import streamlit as st
+import pandas as pd
+import os
+import warnings
+import numpy as np
+import base64
+import io
+import json
+import html
+import time
+from concurrent.futures import wait
+from contextlib import closing
+import pyarrow as pa
+import pyarrow.parquet as pq
+from PIL import Image
+from dalian_core import (
+    PERF_LOG_FILE, perf_begin, perf_active, perf_metric, timed, perf_end, MAP_DEFAULT_CENTER, MAP_DEFAULT_ZOOM,
+    MAP_WIDTH, MAP_HEIGHT, TILE_CACHE_ENABLED, tile_public_url, file_exists, DataSchemaError, file_signature,
+    widen_float, read_concentration_cached, parse_cas_workbook, get_dataset, failed_refresh, published_dataset,
+    dataset_derived, cell_text, CLICK_TOLERANCE, SiteIndex, site_index, view_bounds, returned_bounds,
+    lod_aggregates, visible_aggregates, TIME_PLAYBACK_INTERVAL, TIME_FREQS, campaign_index, cas_checksum_valid,
+    cas_index, parse_cas_list, split_cas_query, read_cas_upload, batch_cas_lookup, frame_to_parquet_bytes,
+    CONCENTRATION_UNIT, RQ_LEVELS, RQ_LEVEL_COLORS, RQ_LEVEL_NAMES, risk_quotients, risk_table, risk_summary,
+    risk_colors, STATS_GROUPS, STATS_MIN_PAIRS, group_statistics, hydrology_correlation, EXPORT_FORMATS,
+    export_rows, export_chunks, STORE_FILE, store_connect, store_version, store_cas_lookup, store_cas_complete,
+    store_cas_batch, SURFACE_RESOLUTIONS, concentration_surface, NO_DATA_COLOR, colormap_colors,
+    param_switch_config, map_layers, create_map, create_colormap, create_map_with_markers, count_markers,
+    CONCENTRATION_FILE, TOXICITY_FILE, TOXICITY_SHEET, warmup_state, start_warmup, data_watcher,
+)
+
+st.set_option("client.toolbarMode", "viewer")
+# 共享数据集在各会话间只读复用：应用进程开启 pandas 写时复制，避免任何会话内的修改波及共享数据。
+# 只在应用入口设置，dalian_core 被命令行工具与基准测试导入时不改变其 pandas 配置
+pd.set_option("mode.copy_on_write", True)
+
+
+# --- 定义一个函数来读取图片并转换为base64 ---
+@st.cache_resource(show_spinner=False)
+def base64_payload(path, size, mtime_ns):
+    with open(path, 'rb') as f:
+        data = f.read()
+    return base64.b64encode(data).decode()
+
+
+def get_base64_of_bin_file(bin_file):
+    # 按源文件签名缓存，同一版本的文件每个进程只读取编码一次
+    return base64_payload(*file_signature(bin_file))
+
+
+warnings.filterwarnings("ignore")
+
+# -------------------------
+# 性能计时（计时工具在 dalian_core 中，每次重跑从此处开始计时）
+# -------------------------
+def diagnostics_enabled():
+    # 通过地址参数 ?debug=1 打开诊断面板
+    return st.query_params.get("debug") == "1"
+
+
+perf_begin()
+
+# -------------------------
+# 页面与样式设置
+# -------------------------
+st.set_page_config(page_title="大连近岸海域抗生素及环境激素风险管控平台", layout="wide", initial_sidebar_state="collapsed")
+
+
+def global_font_css(size="16px"):
+    return f"""
+    <style>
+    html, body, [class*="css"] {{
+        font-size: {size} !important;
+    }}
+    </style>
+    """
+
+
+def set_background(png_file):
+    bin_str = get_base64_of_bin_file(png_file)
+    page_bg_img = f'''
+    <style>
+    .stApp {{
+        background-image: url("data:image/png;base64,{bin_str}");
+        background-size: cover;
+        background-position: center;
+        background-repeat: no-repeat;
+        background-attachment: fixed;
+    }}
+    </style>
+    '''
+    st.markdown(page_bg_img, unsafe_allow_html=True)
+
+
+# set_background('homepage_image.png')
+
+# 隐藏 Streamlit 默认侧边栏与顶部菜单
+PAGE_CSS = """
+    <style>
+        /* 隐藏侧边栏 */
+        [data-testid="stSidebar"] { display: none; }
+        [data-testid="collapsedControl"] { display: none; }
+
+        div[data-testid="stToolbar"] {
+            display: none !important;
+        }
+        div[data-testid="stDecoration"] {
+            display: none !important;
+        }
+        div[data-testid="stStatusWidget"] {
+            visibility: hidden !important;
+        }
+
+        /* 卡片与按钮样式 */
+        .func-card {
+            border-radius: 12px;
+            padding: 18px;
+            margin-bottom: 16px;
+            border: 1px solid #E6EEF8;
+            background: linear-gradient(180deg,#ffffff,#f6fbff);
+            box-shadow: 0 6px 18px rgba(38,78,119,0.06);
+        }
+        .func-title { 
+            font-size: 20px; 
+            font-weight:500; 
+            margin-bottom:6px; 
+            color:#003366; 
+        }
+        .func-desc { 
+            font-size:14px; 
+            color:#333; 
+            margin-bottom:8px; 
+        }
+        .func-btn {
+            background-color:#0b5bd7;
+            color:white;
+            padding:8px 14px;
+            border-radius:8px;
+            border: none;
+            font-weight:600;
+        }
+        .func-btn:hover { 
+            opacity: 0.9; 
+            cursor: pointer; 
+        }
+
+        /* 改变输入框的字体大小和高度 */
+        div.stTextInput>div>div>input {
+            font-size: 30px;   /* 字体大小 */
+            line-height: 50px;      /* 输入框高度 */
+        }
+
+        /* --- 1. 全局Streamlit按钮样式 (背景、尺寸等) --- */
+        div.stButton > button:first-child {
+            background: linear-gradient(135deg, #0723f2, #1375f9) !important;
+            color: white !important;
+            padding: 0.5rem 1.25rem !important;
+            border-radius: 0.25rem !important;
+            border: none !important;
+            cursor: pointer !important;
+            width: 400px !important;
+            height: 50px !important;
+            transition: all 0.3s ease !important;
+        }
+
+        /* --- 3. 按钮悬停效果 --- */
+        div.stButton > button:first-child:hover {
+            opacity: 0.9 !important;
+            background: linear-gradient(135deg, #0723f2, #1375f9) !important;
+            transform: translateY(-2px) !important;
+            box-shadow: 0 4px 8px rgba(0,0,0,0.2) !important;
+        }
+
+        /* 自定义数据面板样式 */
+        .data-panel {
+            border: 3px solid #0b5bd7;
+            border-radius: 15px;
+            padding: 25px;
+            background-color: #f0f8ff;
+            height: 100%; /* 让面板占满列的高度 */
+            overflow-y: auto; /* 如果内容太多，显示滚动条 */
+            box-shadow: 0 6px 18px rgba(11, 91, 215, 0.1);
+        }
+        .data-panel h4 {
+            color: #0b5bd7;
+            border-bottom: 2px solid #0b5bd7;
+            padding-bottom: 10px;
+            margin-top: 0;
+        }
+
+        /* CAS 查询结果表：字段为行，记录为列 */
+        .cas-result { overflow-x: auto; }
+        .cas-result table { border-collapse: collapse; }
+        .cas-result th, .cas-result td {
+            padding: 10px;
+            border-bottom: 1px solid #E6EEF8;
+            font-size: 25px;
+        }
+        .cas-result th.field {
+            background-color: #f0f8ff;
+            text-align: right;
+            white-space: nowrap;
+        }
+        .cas-result th.record { text-align: left; color: #0b5bd7; }
+        .cas-result .pass { color: #28a745; }
+        .cas-result .fail { color: #dc3545; }
+    </style>
+"""
+
+
+@st.cache_resource(show_spinner=False)
+def page_css():
+    """全局样式在进程内只拼接一次；样式元素属于每次重跑的页面，仍需每次下发"""
+    return global_font_css("30px") + PAGE_CSS
+
+
+st.markdown(page_css(), unsafe_allow_html=True)
+
+# -------------------------
+# session_state 初始化
+# -------------------------
+if 'page' not in st.session_state:
+    st.session_state.page = "home"  # 'home', 'map', 'cas', 'stats'
+
+# 新增：用于存储点击的点位数据
+if 'clicked_point_data' not in st.session_state:
+    st.session_state.clicked_point_data = None
+if 'map_center' not in st.session_state:
+    st.session_state.map_center = list(MAP_DEFAULT_CENTER)
+    st.session_state.map_zoom = MAP_DEFAULT_ZOOM
+    st.session_state.last_map_key = 0
+if 'time_playing' not in st.session_state:
+    st.session_state.time_playing = False
+
+
+# -------------------------
+# 数据集加载（读取失败时在页面上提示）
+# -------------------------
+def warn_failed_refresh(kind, filepath):
+    """源文件更新后读取失败时提示仍在使用旧版本；文件再次变化后才会重新读取"""
+    error = failed_refresh(kind, filepath)
+    if error is not None:
+        st.warning(f"数据文件 {os.path.basename(filepath)} 已更新但读取失败（{error}），当前仍显示上一版本数据。")
+
+
+def load_concentration_dataset(filepath="浓度点位数据.xlsx"):
+    try:
+        dataset = get_dataset("concentration", filepath, read_concentration_cached)
+        warn_failed_refresh("concentration", filepath)
+        return dataset
+    except FileNotFoundError:
+        st.error(f"未找到文件：{filepath}")
+    except DataSchemaError as e:
+        st.error(str(e))
+    except Exception as e:
+        st.error(f"读取浓度数据出错：{e}")
+    return None
+
+
+def load_cas_dataset(filepath="./毒性数据.xlsx", sheet="MM-GCN预测毒性数据集"):
+    try:
+        dataset = get_dataset("cas", filepath, lambda path: parse_cas_workbook(path, sheet))
+        warn_failed_refresh("cas", filepath)
+        return dataset
+    except FileNotFoundError:
+        st.error(f"未找到文件：{filepath}")
+    except Exception as e:
+        st.error(f"读取毒性数据出错：{e}")
+    return None
+
+
+# -------------------------
+# CAS 查询结果与风险商说明
+# -------------------------
+CAS_TEST_FIELDS = ['AD 检验', 'KS 检验', 'JB 检验']
+
+
+def cas_result_html(result):
+    """把查询结果渲染为一个 HTML 表格：字段为行、记录为列，同一 CAS 的多条记录或多个化合物并排对比；
+    检验字段按是否为 true 整块着色，整个结果只需一条消息下发到浏览器"""
+    tests = [name for name in CAS_TEST_FIELDS if name in result.columns]
+    fields = [name for name in result.columns if name not in tests] + tests
+    table = result[fields].reset_index(drop=True)
+    # 单元格内的换行转为 <br>，避免空行提前结束 Markdown 中的 HTML 块
+    text = table.astype(str).where(table.notna(), "无数据").map(lambda v: html.escape(v).replace("\n", "<br>"))
+    if tests:
+        passed = table[tests].astype(str).apply(lambda column: column.str.lower()) == "true"
+        prefixes = np.where(passed, "<span class='pass'>✅ ", "<span class='fail'>❌ ")
+        text[tests] = np.char.add(np.char.add(prefixes.astype(str), text[tests].to_numpy().astype(str)), "</span>")
+    header = ""
+    if len(table) > 1:
+        labels = text['CAS'] if 'CAS' in text.columns else range(1, len(table) + 1)
+        header = "<tr><th></th>" + "".join(f"<th class='record'>记录 {i + 1}：{label}</th>"
+                                           for i, label in enumerate(labels)) + "</tr>"
+    rows = "".join(
+        f"<tr><th class='field'>{html.escape(str(name))}：</th>" + "".join(f"<td>{value}</td>" for value in text[name])
+        + "</tr>"
+        for name in fields)
+    return f"<div class='cas-result'><table>{header}{rows}</table></div>"
+
+
+def risk_unit_note():
+    return (f"RQ 按浓度单位 {CONCENTRATION_UNIT} 计算（浓度表列名未标注单位时的假定，"
+            "可通过环境变量 DALIAN_CONCENTRATION_UNIT 修改）")
+
+
+# -------------------------
+# 视图导出与本地分析库查询（按数据或库版本缓存）
+# -------------------------
+@st.cache_data(show_spinner=False, max_entries=8)
+def export_view(_dataset, version, fmt, params, bounds, period, risk_key, _rows, _risk=None):
+    """按筛选条件签名（数据版本、格式、参数、范围、时期、风险商版本）缓存的导出文件；逐块写出，不构建整张导出表"""
+    buffer = io.BytesIO()
+    chunks = export_chunks(_dataset, _rows, params, _risk)
+    if fmt == "CSV":
+        for i, chunk in enumerate(chunks):
+            buffer.write(chunk.to_csv(index=False, header=i == 0).encode("utf-8-sig" if i == 0 else "utf-8"))
+    elif fmt == "Parquet":
+        writer = None
+        for chunk in chunks:
+            table = pa.Table.from_pandas(chunk, preserve_index=False)
+            if writer is None:
+                writer = pq.ParquetWriter(buffer, table.schema)
+            writer.write_table(table)
+        writer.close()
+    else:
+        buffer.write(b'{"type":"FeatureCollection","features":[')
+        first = True
+        for chunk in chunks:
+            coords = chunk[['经度', '纬度']].round(6).to_numpy().tolist()
+            props = chunk.drop(columns=['经度', '纬度']).astype(object)
+            records = props.where(props.notna(), None).to_dict("records")
+            for (lng, lat), record in zip(coords, records):
+                feature = {"type": "Feature", "geometry": {"type": "Point", "coordinates": [lng, lat]},
+                           "properties": record}
+                buffer.write((b"" if first else b",") + json.dumps(feature, ensure_ascii=False).encode("utf-8"))
+                first = False
+        buffer.write(b"]}")
+    return buffer.getvalue()
+
+
+@st.cache_data(show_spinner=False, max_entries=64)
+def store_sources(store, version, kind):
+    """已导入的工作表列表"""
+    with closing(store_connect(store, readonly=True)) as conn:
+        return pd.read_sql_query("SELECT id, path, sheet, rows, imported_at FROM sources WHERE kind = ? ORDER BY id",
+                                 conn, params=(kind,))
+
+
+@st.cache_data(show_spinner=False, max_entries=64)
+def store_params(store, version):
+    with closing(store_connect(store, readonly=True)) as conn:
+        return [row[0] for row in conn.execute("SELECT name FROM parameters ORDER BY position")]
+
+
+def _source_filter(source_ids, column="s.source_id"):
+    if source_ids is None:
+        return "", []
+    return f" WHERE {column} IN ({', '.join('?' * len(source_ids))})", list(source_ids)
+
+
+@st.cache_data(show_spinner=False, max_entries=16)
+def store_param_frame(store, version, param, source_ids=None):
+    """单个参数的窄表：点位、采样时间、经纬度与该参数浓度（列名同浓度表），未检出文本放在 原始文本 列"""
+    where, params = _source_filter(source_ids)
+    sql = ("SELECT s.id AS 样本编号, s.site AS 点位, s.sample_time AS 采样时间, s.lng AS 经度, s.lat AS 纬度, "
+           "m.value AS value, m.text AS 原始文本 FROM samples s "
+           "LEFT JOIN measurements m ON m.sample_id = s.id AND m.param = ?" + where + " ORDER BY s.id")
+    with closing(store_connect(store, readonly=True)) as conn:
+        frame = pd.read_sql_query(sql, conn, params=[param] + params)
+    frame = frame.rename(columns={"value": param.lower()})
+    return frame.astype({"经度": np.float32, "纬度": np.float32, param.lower(): np.float32,
+                         "点位": "category", "采样时间": "category"})
+
+
+@st.cache_resource(show_spinner=False, max_entries=8)
+def store_site_index(store, version, source_ids=None):
+    """库中样本坐标的空间索引，行顺序与 store_param_frame 一致（按样本编号）"""
+    where, params = _source_filter(source_ids, "source_id")
+    with closing(store_connect(store, readonly=True)) as conn:
+        coords = np.array(conn.execute(f"SELECT lat, lng FROM samples{where} ORDER BY id", params).fetchall(),
+                          dtype=float).reshape(-1, 2)
+    return SiteIndex(widen_float(coords[:, 0].astype(np.float32)), widen_float(coords[:, 1].astype(np.float32)))
+
+
+# -------------------------
+# 预热等待与数据更新提示
+# -------------------------
+def await_warmup(kind):
+    """数据集尚未加载过且预热仍在进行时等待其完成；已有旧版本时不等待后台重建。
+    预热中的异常不在此处理，页面随后自行加载时会照常报告"""
+    submitted = warmup_state()["futures"].get(kind)
+    if submitted is None or submitted[1].done() or published_dataset(kind, submitted[0][0]) is not None:
+        return
+    with st.spinner("正在加载数据…"), timed("等待预热"):
+        wait([submitted[1]])
+
+
+def notify_dataset_update(kind, dataset):
+    """本会话上次使用的是旧版本时提示数据已更新"""
+    seen = st.session_state.setdefault("dataset_versions", {})
+    previous, seen[kind] = seen.get(kind), dataset.version
+    if previous is not None and previous != dataset.version:
+        st.toast("数据文件已更新，已切换到新版本")
+
+
+# -------------------------
+# 路由函数
+# -------------------------
+def goto(page_name):
+    st.session_state.page = page_name
+    # 切换页面时清空点击数据
+    st.session_state.clicked_point_data = None
+    try:
+        st.rerun()
+    except AttributeError:
+        try:
+            st.experimental_rerun()
+        except Exception as e:
+            st.warning(f"页面跳转需要Streamlit 1.18.0+版本。错误：{e}")
+
+
+# -------------------------
+# 首页
+# -------------------------
+HOME_IMAGE_FILE = "homepage_image.png"
+HOME_IMAGE_WIDTH = 1200  # 不超过 Streamlit 图片的最大显示宽度（1460 px），下发时不再被缩放重编码
+HOME_IMAGE_QUALITY = 85
+
+
+@st.cache_resource(show_spinner=False)
+def home_image(path, size, mtime_ns):
+    """首页配图：缩放到显示宽度并编码为渐进式 JPEG，按源文件签名在进程内缓存。
+    直接传入原图路径时 Streamlit 每次重跑都会重新读取、缩放并编码为 PNG"""
+    with Image.open(path) as image:
+        image = image.convert("RGB")
+        if image.width > HOME_IMAGE_WIDTH:
+            image = image.resize((HOME_IMAGE_WIDTH, round(image.height * HOME_IMAGE_WIDTH / image.width)),
+                                 Image.LANCZOS)
+        buffer = io.BytesIO()
+        image.save(buffer, "JPEG", quality=HOME_IMAGE_QUALITY, optimize=True, progressive=True)
+    return buffer.getvalue()
+
+
+def page_home():
+    st.markdown(
+        "<h1 style='text-align:center;margin-top:-100px;font-size: 65px;'>大连近岸海域抗生素及环境激素风险管控平台</h1>",
+        unsafe_allow_html=True)
+
+    # 页面布局：左图 (宽) , 右功能卡 (窄)
+    col1, col2 = st.columns([2, 1], gap="large")
+
+    with col1:
+        with timed("首页配图"):
+            st.image(home_image(*file_signature(HOME_IMAGE_FILE)), width='stretch')
+
+    with col2:
+        with st.container():
+            st.markdown("<div class='func-title' style='font-size: 60px;'>浓度数据</div>",
+                        unsafe_allow_html=True)
+
+            if st.button("进入浓度地图", key="btn_map", type="primary"):
+                goto("map")
+            if st.button("进入统计看板", key="btn_stats", type="primary"):
+                goto("stats")
+
+        with st.container():
+
+            st.markdown("<div style='height:20px;'></div>", unsafe_allow_html=True)
+
+            # 功能卡2：CAS查询
+            st.markdown("<div class='func-title' style='font-size: 60px;'>毒性数据</div>",
+                        unsafe_allow_html=True)
+
+            if st.button("进入CAS查询", key="btn_cas", type="primary"):
+                goto("cas")
+
+    st.markdown("---")
+    # 平台说明
+    st.markdown("""
+    <div style="color:#444;font-size:40px;">
+        本平台由 <b>大连理工大学环境学院</b> 开发
+    </div>
+    """, unsafe_allow_html=True)
+
+
+# -------------------------
+# 浓度地图页面 (修复版本)
+# -------------------------
+def warn_no_values(df, selected_param):
+    if np.isnan(widen_float(df[selected_param.lower()])).all():
+        st.warning(f"当前选择的参数【{selected_param}】无有效数值数据，标记将显示灰色。")
+
+
+def page_map():
+    st.header("大连近岸海域抗生素及环境激素浓度地图")
+    if TILE_CACHE_ENABLED and tile_public_url() is None:
+        st.warning("已启用本地底图瓦片缓存，但页面经 HTTPS 提供且未设置 DALIAN_TILE_URL，浏览器无法访问本机瓦片服务，"
+                   "当前改用在线底图。")
+
+    # 已建立本地数据库时可切换为按需查询全部已导入工作表
+    version = store_version()
+    archive_sources = store_sources(STORE_FILE, version, "concentration") if version is not None else None
+    if archive_sources is not None and not archive_sources.empty:
+        source_names = {"workbook": "浓度点位数据.xlsx", "store": f"本地数据库（{len(archive_sources)} 个工作表）"}
+        source = st.radio("数据来源", list(source_names), format_func=source_names.get, horizontal=True,
+                          key="map_source")
+        if source == "store":
+            page_map_archive(version, archive_sources)
+            return
+
+    # 页面布局：左侧地图，右侧数据面板
+    await_warmup("concentration")
+    dataset = load_concentration_dataset(CONCENTRATION_FILE)
+    if dataset is None or dataset.frame.empty:
+        st.warning("未加载到有效浓度数据，返回首页查看帮助或检查文件。")
+        return
+    notify_dataset_update("concentration", dataset)
+    df = dataset.frame
+    # 地图库在进程内首次进入地图页时才导入
+    with timed("导入地图库"):
+        layers = map_layers()
+        from streamlit_folium import st_folium
+    folium, cm = layers.folium, layers.cm
+
+    param_cols = dataset.meta["all_param_cols"]
+    if not param_cols:
+        st.warning("未识别到参数列。请检查 Excel 列名。")
+        return
+    # 浏览器端切换：地图只构建一次，参数在地图左上角的下拉框中切换
+    client_side = st.toggle("在地图内切换参数（不重新加载地图）", key="client_param_switch")
+    selected_param = None if client_side else st.selectbox("", param_cols)
+    if selected_param is not None:
+        warn_no_values(df, selected_param)
+    # 分级聚合：按当前缩放级别把点位合并为网格单元，只下发可视范围内的单元
+    clustered = st.toggle("按缩放级别聚合点位", key="lod_cluster", disabled=client_side) and not client_side
+    # 时间筛选：按采样时期逐期显示，可自动播放；各期行号与范围已在时间索引中预先算好
+    time_filtered = st.toggle("按采样时间逐期显示", key="time_filter",
+                              disabled=client_side or clustered) and not (client_side or clustered)
+    # 风险商图层：需要毒性数据，静默加载，缺失时仅禁用该选项
+    try:
+        cas_dataset = get_dataset("cas", TOXICITY_FILE, parse_cas_workbook)
+    except Exception:
+        cas_dataset = None
+    risk = risk_quotients(dataset, cas_dataset) if cas_dataset is not None and 'CAS' in cas_dataset.frame else None
+    risk_allowed = risk is not None and not (client_side or clustered)
+    show_risk = st.toggle("显示风险商（RQ = 浓度 / PNEC）", key="risk_layer", disabled=not risk_allowed,
+                          help=None if risk is not None else "未加载到毒性数据") and risk_allowed
+    if show_risk and selected_param not in risk["params"]:
+        st.info(f"参数【{selected_param}】未匹配到毒性数据，显示浓度。")
+        show_risk = False
+    if show_risk:
+        st.caption(risk_unit_note())
+    campaigns = period = None
+    if time_filtered:
+        freq_label = st.radio("时期划分", list(TIME_FREQS), horizontal=True, key="time_freq")
+        campaigns = campaign_index(dataset, TIME_FREQS[freq_label])
+        if not len(campaigns):
+            st.info("数据中没有可解析的采样时间，显示全部样本。")
+            time_filtered = False
+    if time_filtered:
+        if st.session_state.get("time_period") not in campaigns.labels:
+            st.session_state.time_period = campaigns.labels[0]
+
+        def toggle_playback():
+            st.session_state.time_playing = not st.session_state.time_playing
+            st.session_state.time_shown_at = time.monotonic()
+
+        # 播放与暂停需要整页重跑，以便按新状态设置下方片段的定时重跑
+        st.button("⏸ 暂停" if st.session_state.time_playing else "▶ 播放", key="time_play",
+                  on_click=toggle_playback)
+        if len(campaigns.undated):
+            st.caption(f"另有 {len(campaigns.undated)} 个样本缺少采样时间，未参与逐期显示。")
+
+        def period_controls():
+            # 播放中由片段的定时重跑切到下一期；播放期间操作地图同样会重跑片段，距上次切换不足半个间隔时不前进
+            now = time.monotonic()
+            if (st.session_state.time_playing
+                    and now - st.session_state.get("time_shown_at", 0.0) >= TIME_PLAYBACK_INTERVAL / 2):
+                next_period = (campaigns.period(st.session_state.time_period) + 1) % len(campaigns)
+                st.session_state.time_period = campaigns.labels[next_period]
+                st.session_state.time_shown_at = now
+            label = st.select_slider("采样时期", options=campaigns.labels, key="time_period",
+                                     disabled=st.session_state.time_playing)
+            period = campaigns.period(label)
+            j = param_cols.index(selected_param)
+            low, high = campaigns.param_min[period, j], campaigns.param_max[period, j]
+            value_range = (f"{float(widen_float(low)):.4f} ~ {float(widen_float(high)):.4f}"
+                           if not np.isnan(low) else "无有效数据")
+            st.caption(f"{label}：{len(campaigns.rows_in(period))} 个样本；"
+                       f"{selected_param} 本期范围 {value_range}（色带按全部时期的范围，便于逐期比较）")
+            return label, period
+    # 插值浓度面：仅在逐点显示浓度时可用
+    surface_allowed = not (client_side or clustered or time_filtered or show_risk)
+    show_surface = st.toggle("显示插值浓度面（反距离加权）", key="surface_layer",
+                             disabled=not surface_allowed) and surface_allowed
+    if show_surface:
+        surface_resolution = st.select_slider("插值网格列数", options=SURFACE_RESOLUTIONS,
+                                              value=SURFACE_RESOLUTIONS[1], key="surface_resolution")
+    threshold = None
+    if clustered:
+        param_valid = widen_float(df[selected_param.lower()])
+        param_valid = param_valid[~np.isnan(param_valid)]
+        default_threshold = float(np.quantile(param_valid, 0.9)) if param_valid.size else 0.0
+        threshold = st.number_input("超标阈值（默认取该参数 90% 分位数）", value=default_threshold,
+                                    key=f"lod_threshold_{selected_param}", format="%.4f")
+
+    def create_map_with_param_switch():
+        m = create_map()
+        feature_group = folium.FeatureGroup(name="浓度点位")
+        config = dataset_derived(dataset, "param_switch_config", lambda: param_switch_config(df, dataset.meta))
+        layers.ParamSwitchLayer(config, marker_count=len(df)).add_to(feature_group)
+        feature_group.add_to(m)
+        return m
+
+    def sync_view(map_data):
+        # 记录组件回传的地图中心与缩放级别，下次构建地图时沿用
+        if map_data and map_data.get("center") and map_data.get("zoom"):
+            st.session_state.map_center = [map_data["center"]["lat"], map_data["center"]["lng"]]
+            st.session_state.map_zoom = map_data["zoom"]
+
+    def create_clustered_map(selected_param, bounds=None):
+        # 底图与图例只随参数变化；聚合图层通过 feature_group_to_add 单独下发，平移缩放时不重建底图
+        m = create_map()
+        colormap = create_colormap(df, selected_param)
+        if colormap is not None:
+            m.add_child(colormap)
+        aggregates = visible_aggregates(
+            lod_aggregates(dataset, st.session_state.map_zoom, selected_param, threshold),
+            bounds or view_bounds(st.session_state.map_center, st.session_state.map_zoom))
+        if colormap is not None:
+            colors = colormap_colors(colormap, aggregates["mean"])
+        else:
+            colors = np.full(len(aggregates["mean"]), NO_DATA_COLOR)
+        feature_group = folium.FeatureGroup(name="聚合点位")
+        layers.ClusterLayer(aggregates, colors, selected_param).add_to(feature_group)
+        return m, feature_group
+
+    def risk_legend(selected_param, rq):
+        finite = rq[np.isfinite(rq)]
+        rq_max = max(10.0, float(finite.max())) if finite.size else 10.0
+        legend = cm.StepColormap(RQ_LEVEL_COLORS, index=[0] + RQ_LEVELS + [rq_max], vmin=0, vmax=rq_max)
+        legend.caption = f"{selected_param} 风险商 RQ（" + " / ".join(RQ_LEVEL_NAMES) + "）"
+        return legend
+
+    def create_risk_map(selected_param):
+        m = create_map()
+        rq = risk["rq"][:, risk["params"].index(selected_param)]
+        m.add_child(risk_legend(selected_param, rq))
+        feature_group = folium.FeatureGroup(name="风险商")
+        layers.SiteLayer(df, rq, risk_colors(rq), f"{selected_param} RQ").add_to(feature_group)
+        feature_group.add_to(m)
+        return m
+
+    def create_time_map(selected_param, rows):
+        # 底图与图例在各期之间不变；各期点位通过 feature_group_to_add 单独下发，切换时期不重建底图
+        m = create_map()
+        if show_risk:
+            values = risk["rq"][:, risk["params"].index(selected_param)]
+            m.add_child(risk_legend(selected_param, values))
+            colors, name = risk_colors(values), f"{selected_param} RQ"
+        else:
+            values = df[selected_param.lower()].to_numpy()
+            colormap = create_colormap(df, selected_param)
+            if colormap is not None:
+                m.add_child(colormap)
+                colors = dataset_derived(dataset, ("marker_colors", selected_param),
+                                         lambda: colormap_colors(colormap, values))
+            else:
+                colors = np.full(len(df), NO_DATA_COLOR)
+            name = selected_param
+        feature_group = folium.FeatureGroup(name="浓度点位")
+        layers.SiteLayer(df.iloc[rows], values[rows], colors[rows], name).add_to(feature_group)
+        return m, feature_group
+
+    def show_map(period):
+        # 在左侧列中显示地图
+        dynamic_layer = None
+        with timed("地图构建"):
+            if client_side:
+                map_key = f"map_{st.session_state.last_map_key}_client"
+                folium_map = create_map_with_param_switch()
+            elif clustered:
+                map_key = f"map_{st.session_state.last_map_key}_{selected_param}_lod"
+                # 平移缩放后组件回传的视野在本次重跑开始前已由回调写入 session_state[map_key]，
+                # 先按它更新视野再构建聚合图层，每次视野变化只重跑一次
+                pending_view = st.session_state.get(map_key)
+                sync_view(pending_view)
+                folium_map, dynamic_layer = create_clustered_map(selected_param, returned_bounds(pending_view))
+            elif time_filtered:
+                map_key = f"map_{st.session_state.last_map_key}_{selected_param}_time" + ("_rq" if show_risk else "")
+                folium_map, dynamic_layer = create_time_map(selected_param, campaigns.rows_in(period))
+            elif show_risk:
+                map_key = f"map_{st.session_state.last_map_key}_{selected_param}_rq"
+                folium_map = create_risk_map(selected_param)
+            else:
+                map_key = f"map_{st.session_state.last_map_key}_{selected_param}"
+                surface = None
+                if show_surface:
+                    colormap = create_colormap(df, selected_param)
+                    if colormap is not None:
+                        with timed("插值浓度面"):
+                            surface = concentration_surface(dataset, selected_param, surface_resolution, colormap)
+                    map_key += f"_surface{surface_resolution}"
+                folium_map = create_map_with_markers(df, selected_param, surface)
+        perf_metric("标记数", count_markers(folium_map) + (count_markers(dynamic_layer) if dynamic_layer else 0))
+        if diagnostics_enabled():
+            # 单独序列化一次以测量 HTML 体积（st_folium 内部会再渲染一次，仅在诊断模式下付出该开销）
+            with timed("HTML 序列化"):
+                perf_metric("地图 HTML 字节数", len(folium_map.get_root().render().encode("utf-8")))
+        with timed("st_folium 渲染与下发"):
+            map_data = st_folium(folium_map, width=MAP_WIDTH, height=MAP_HEIGHT, key=map_key,
+                                 center=st.session_state.map_center, zoom=st.session_state.map_zoom,
+                                 feature_group_to_add=dynamic_layer,
+                                 returned_objects=["center", "zoom", "bounds", "last_object_clicked"])
+        sync_view(map_data)
+
+        # 处理通过last_object_clicked传递的数据：仅存储基础信息+当前选中参数
+        if map_data and map_data.get("last_object_clicked"):
+            clicked_lat = map_data["last_object_clicked"]["lat"]
+            clicked_lng = map_data["last_object_clicked"]["lng"]
+
+            # 通过空间索引查找最近点位及其全部同点位样本
+            with timed("点击定位"):
+                index = site_index(dataset)
+                site, _ = index.nearest(clicked_lat, clicked_lng, max_distance=CLICK_TOLERANCE)
+
+            if site is not None:
+                matched_rows = df.iloc[index.rows_at(site)]
+                row = matched_rows.iloc[0]
+                shown_params = [selected_param] if selected_param else param_cols
+
+                def format_params(sample):
+                    values = {}
+                    for param in shown_params:
+                        value = sample.get(param.lower(), np.nan)
+                        if pd.notna(value):
+                            values[param] = f"{float(value):.4f}"
+                        else:
+                            # 原表中的 "ND"、"<LOD" 等文本原样显示
+                            values[param] = cell_text(dataset, param.lower(), sample.name) or "无数据"
+                    return values
+
+                # 存储基础水文信息和当前选中参数；地图内切换模式下服务端不知道当前参数，存储全部参数
+                point_data = {
+                    '点位': row.get('点位', '未知'),
+                    # '分类': row.get('分类', '未知'),
+                    '采样时间': row.get('采样时间', '未知'),
+                    '纬度': round(float(row['纬度']), 4),
+                    '经度': round(float(row['经度']), 4),
+                    **format_params(row),
+                }
+                if len(matched_rows) > 1:
+                    point_data['同点位样本'] = [
+                        {'采样时间': sample.get('采样时间', '未知'), **format_params(sample)}
+                        for _, sample in matched_rows.iterrows()
+                    ]
+                st.session_state.clicked_point_data = point_data
+
+                # 显示点击后的详情面板（仅基础信息+选中参数）
+                # st.markdown("---")
+                # st.markdown(f"<h3>点位详情 - {point_data['点位']}</h3>", unsafe_allow_html=True)
+                # with st.container(class_="data-panel"):
+                #     col1, col2 = st.columns(2)
+                #     with col1:
+                #         # st.markdown(f"<strong>分类：</strong>{point_data['分类']}", unsafe_allow_html=True)
+                #         st.markdown(f"<strong>采样时间：</strong>{point_data['采样时间']}", unsafe_allow_html=True)
+                #         st.markdown(f"<strong>纬度：</strong>{point_data['纬度']}", unsafe_allow_html=True)
+                #         st.markdown(f"<strong>经度：</strong>{point_data['经度']}", unsafe_allow_html=True)
+                #     with col2:
+                #         st.markdown(f"<strong style='color:#0b5bd7; font-size:28px;'>{selected_param}：</strong>{point_data[selected_param]}",
+                #                    unsafe_allow_html=True)
+        return map_key
+
+    if time_filtered:
+        # 逐期显示时滑块与地图放在片段中：播放时只按间隔重跑该片段，不阻塞会话，也不重跑整页
+        @st.fragment(run_every=TIME_PLAYBACK_INTERVAL if st.session_state.time_playing else None)
+        def time_view():
+            # 片段的定时重跑不经过脚本主流程，单独计时；整页重跑中调用时计入整页的记录
+            fragment_run = not perf_active()
+            if fragment_run:
+                perf_begin()
+            try:
+                label, period = period_controls()
+                return label, period, show_map(period)
+            finally:
+                if fragment_run:
+                    perf_end("map", log=diagnostics_enabled() or "DALIAN_PERF_LOG" in os.environ)
+
+        label, period, map_key = time_view()
+    else:
+        map_key = show_map(None)
+
+    if risk is not None and risk["params"]:
+        with st.expander("风险商矩阵（点位 × 物质）"):
+            # 折叠的 expander 内容同样随每次重跑下发，完整矩阵（样本 × 物质）只在打开开关时生成与下发
+            st.dataframe(risk_summary(dataset, risk), hide_index=True)
+            st.caption(risk_unit_note())
+            if risk["unmatched"]:
+                st.caption("未匹配到毒性数据的参数：" + "、".join(risk["unmatched"]))
+            if st.toggle("显示完整矩阵并下载", key="risk_full_table"):
+                table = risk_table(dataset, risk)
+                st.dataframe(table, hide_index=True)
+                csv_bytes = dataset_derived(dataset, ("risk_csv", risk["key"]),
+                                            lambda: table.to_csv(index=False).encode("utf-8-sig"))
+                st.download_button("下载风险商矩阵（CSV）", data=csv_bytes, file_name="风险商矩阵.csv",
+                                   mime="text/csv", key="dl_risk_csv")
+
+    # 导出当前视图：点击生成时才按筛选条件写出文件，条件变化后需重新生成
+    with st.expander("导出当前视图"):
+        export_params = st.multiselect("导出参数", param_cols,
+                                       default=[selected_param] if selected_param else list(param_cols),
+                                       key=f"export_params_{selected_param}")
+        scope_col, format_col = st.columns(2)
+        with scope_col:
+            whole = st.radio("范围", ["当前视野", "全部点位"], horizontal=True, key="export_scope") == "全部点位"
+        with format_col:
+            export_format = st.radio("格式", list(EXPORT_FORMATS), horizontal=True, key="export_format")
+        # 取组件回传的实际可视范围（随浏览器中地图的实际尺寸）；st_folium 在前端回传前以数据范围作为默认值，
+        # 因此读取 session_state 中组件自身的回传值，尚未回传时才按中心与缩放级别估算
+        view = returned_bounds(st.session_state.get(map_key)) or view_bounds(st.session_state.map_center,
+                                                                             st.session_state.map_zoom)
+        bounds = None if whole else tuple(round(v, 6) for v in view)
+        period_rows = campaigns.rows_in(period) if time_filtered else None
+        period_key = (TIME_FREQS[freq_label], label) if time_filtered else None
+        export_risk = risk if show_risk else None
+        rows = export_rows(dataset, bounds, period_rows)
+        filters = [f"{len(rows)} 个样本", "全部点位" if whole else "当前视野"]
+        if time_filtered:
+            filters.append(f"时期 {label}")
+        if export_risk is not None:
+            filters.append("含风险商")
+        st.caption("导出内容：" + "，".join(filters))
+        signature = (dataset.version, export_format, tuple(export_params), bounds, period_key,
+                     export_risk["key"] if export_risk is not None else None)
+        if st.button("生成导出文件", key="btn_export", disabled=not export_params):
+            with st.spinner("正在生成导出文件…"), timed("视图导出"):
+                st.session_state.export_result = (signature, export_view(dataset, *signature, rows, export_risk))
+        export_result = st.session_state.get("export_result")
+        if export_result is not None and export_result[0] == signature:
+            extension, mime = EXPORT_FORMATS[export_format]
+            st.download_button(f"下载（{export_format}，{len(export_result[1]) / 1024:.0f} KB）",
+                               data=export_result[1], file_name=f"浓度视图导出.{extension}", mime=mime,
+                               key="dl_export", on_click="ignore")
+        elif export_result is not None:
+            st.caption("视野或筛选条件已变化，请重新生成。")
+
+    # 返回首页按钮
+    st.markdown("---")
+    back_col, _ = st.columns([1, 9])
+    with back_col:
+        if st.button("← 返回首页"):
+            goto("home")
+
+
+def page_map_archive(version, sources):
+    """本地数据库模式：每次只查询所选参数与工作表的窄表，不在内存中保留整库"""
+    params = store_params(STORE_FILE, version)
+    if not params:
+        st.warning("本地数据库中没有浓度参数。")
+        return
+    labels = {row.id: f"{os.path.basename(row.path)} [{row.sheet}]（{row.rows} 行）" for row in sources.itertuples()}
+    chosen = st.multiselect("工作表", list(labels), default=list(labels), format_func=labels.get,
+                            key="archive_sources")
+    if not chosen:
+        st.info("请至少选择一个工作表。")
+        return
+    source_ids = None if len(chosen) == len(labels) else tuple(sorted(chosen))
+    selected_param = st.selectbox("参数", params, key="archive_param")
+
+    with timed("数据库查询"):
+        df = store_param_frame(STORE_FILE, version, selected_param, source_ids)
+    perf_metric("查询行数", len(df))
+    warn_no_values(df, selected_param)
+    with timed("地图构建"):
+        folium_map = create_map_with_markers(df, selected_param)
+    perf_metric("标记数", count_markers(folium_map))
+    from streamlit_folium import st_folium
+    with timed("st_folium 渲染与下发"):
+        map_data = st_folium(folium_map, width=MAP_WIDTH, height=MAP_HEIGHT,
+                             key=f"map_{st.session_state.last_map_key}_{selected_param}_archive",
+                             center=st.session_state.map_center, zoom=st.session_state.map_zoom,
+                             returned_objects=["center", "zoom", "last_object_clicked"])
+
+    if map_data and map_data.get("center") and map_data.get("zoom"):
+        st.session_state.map_center = [map_data["center"]["lat"], map_data["center"]["lng"]]
+        st.session_state.map_zoom = map_data["zoom"]
+
+    if map_data and map_data.get("last_object_clicked"):
+        with timed("点击定位"):
+            index = store_site_index(STORE_FILE, version, source_ids)
+            site, _ = index.nearest(map_data["last_object_clicked"]["lat"], map_data["last_object_clicked"]["lng"],
+                                    max_distance=CLICK_TOLERANCE)
+        if site is not None:
+            matched_rows = df.iloc[index.rows_at(site)]
+
+            def format_value(sample):
+                value = sample[selected_param.lower()]
+                if pd.notna(value):
+                    return f"{float(value):.4f}"
+                return sample['原始文本'] if pd.notna(sample['原始文本']) else "无数据"
+
+            row = matched_rows.iloc[0]
+            point_data = {
+                '点位': row['点位'],
+                '采样时间': row['采样时间'],
+                '纬度': round(float(row['纬度']), 4),
+                '经度': round(float(row['经度']), 4),
+                selected_param: format_value(row),
+            }
+            if len(matched_rows) > 1:
+                point_data['同点位样本'] = [{'采样时间': sample['采样时间'], selected_param: format_value(sample)}
+                                        for _, sample in matched_rows.iterrows()]
+            st.session_state.clicked_point_data = point_data
+
+    st.markdown("---")
+    back_col, _ = st.columns([1, 9])
+    with back_col:
+        if st.button("← 返回首页"):
+            goto("home")
+
+
+# -------------------------
+# CAS 查询页面
+# -------------------------
+def page_cas():
+    st.markdown(
+        "<div class='func-title' style='font-size: 60px; font-weight: 700;'>CAS 号查询</div>",
+        unsafe_allow_html=True
+    )
+
+    # 已建立本地数据库时默认直接在库中按 CAS 索引查询，不再加载整张毒性表
+    version = store_version()
+    archive_sources = store_sources(STORE_FILE, version, "toxicity") if version is not None else None
+    use_store = False
+    if archive_sources is not None and not archive_sources.empty:
+        source_names = {"store": f"本地数据库（{len(archive_sources)} 个工作表）", "workbook": "毒性数据.xlsx"}
+        use_store = st.radio("数据来源", list(source_names), format_func=source_names.get, horizontal=True,
+                             key="cas_source") == "store"
+
+    if use_store:
+        def lookup(cas):
+            return store_cas_lookup(STORE_FILE, cas)
+
+        def complete(prefix):
+            return store_cas_complete(STORE_FILE, prefix)
+
+        def batch_lookup(queries):
+            return store_cas_batch(STORE_FILE, queries)
+    else:
+        await_warmup("cas")
+        dataset = load_cas_dataset(TOXICITY_FILE, TOXICITY_SHEET)
+        if dataset is None:
+            st.warning("毒性数据未加载，请检查文件。")
+            return
+        notify_dataset_update("cas", dataset)
+        if dataset.frame.empty:
+            st.warning("毒性数据为空，请检查源文件。")
+            return
+        cas_data = dataset.frame
+        if 'CAS' not in cas_data.columns:
+            st.warning("毒性数据缺少 CAS 列，请检查源文件。")
+            return
+        index = cas_index(dataset)
+
+        def lookup(cas):
+            return cas_data.iloc[index.lookup(cas)]
+
+        complete = index.complete
+
+        def batch_lookup(queries):
+            return batch_cas_lookup(dataset, queries)
+
+    def pick_suggestion():
+        # 选中候选项后写回输入框并直接执行查询
+        st.session_state.cas_query = st.session_state.cas_suggestion
+        st.session_state.cas_suggestion_picked = True
+
+    cas_input = st.text_input("查询", placeholder="例如：1912-24-9（多个 CAS 号以逗号分隔可并排对比）",
+                              label_visibility='hidden', key="cas_query")
+    queries = split_cas_query(str(cas_input or ""))
+    if len(queries) == 1 and lookup(queries[0]).empty:
+        suggestions = complete(queries[0])
+        if suggestions:
+            st.pills("候选 CAS 号", suggestions, key="cas_suggestion", on_change=pick_suggestion)
+    if st.button("查询") or st.session_state.pop("cas_suggestion_picked", False):
+        if not queries:
+            st.warning("请输入 CAS 号")
+        else:
+            with timed("CAS 查询"):
+                results = [lookup(cas) for cas in queries]
+            hits = [cas for cas, result in zip(queries, results) if not result.empty]
+            missing = [cas for cas, result in zip(queries, results) if result.empty]
+            if hits:
+                result = pd.concat([result for result in results if not result.empty], ignore_index=True)
+                summary = f"✅ 找到CAS号为 {html.escape('、'.join(hits))} 的 {len(result)} 条记录"
+                if missing:
+                    summary += f"；未找到 {html.escape('、'.join(missing))}"
+                with timed("CAS 结果渲染"):
+                    st.markdown(
+                        f"""
+                        <div style="background-color:#f0f8ff; padding:10px; border-radius:4px; margin-bottom:12px;font-size:30px">
+                            {summary}
+                        </div>
+                        {cas_result_html(result)}
+                        """,
+                        unsafe_allow_html=True
+                    )
+            else:
+                st.markdown(
+                    f"""
+                    <div style="background-color:#f0f8ff; padding:10px; border-radius:0px; margin-bottom:25px;font-size:30px">
+                        未找到CAS号为 {html.escape('、'.join(queries))} 的记录
+                    </div>
+                    """,
+                    unsafe_allow_html=True
+                )
+            # 未命中的输入多为录入错误，校验位不符时直接提示
+            mistyped = [cas for cas in missing if not cas_checksum_valid(cas)]
+            if mistyped:
+                st.caption(f"CAS 号 {'、'.join(mistyped)} 的校验位不正确，请检查输入。")
+    # 批量查询：粘贴列表或上传文件，一次合并得到全部结果
+    with st.expander("批量查询"):
+        pasted = st.text_area("粘贴 CAS 号（换行、空格或逗号分隔）", key="cas_batch_text")
+        uploaded = st.file_uploader("或上传 CAS 列表（CSV/XLSX，优先读取 CAS 列）", type=["csv", "xlsx"],
+                                    key="cas_batch_file")
+        if st.button("批量查询", key="btn_cas_batch"):
+            queries = parse_cas_list(pasted or "")
+            if uploaded is not None:
+                try:
+                    queries += read_cas_upload(uploaded)
+                except Exception as e:
+                    st.error(f"读取上传文件出错：{e}")
+            if queries:
+                with timed("CAS 批量查询"):
+                    st.session_state.cas_batch_result = batch_lookup(queries)
+            else:
+                st.warning("请粘贴或上传 CAS 号")
+                st.session_state.cas_batch_result = None
+
+        batch_result = st.session_state.get("cas_batch_result")
+        if batch_result is not None:
+            hits = batch_result.drop_duplicates("输入CAS")
+            n_hit = int(hits["是否命中"].sum())
+            misses = hits.loc[~hits["是否命中"], "输入CAS"].tolist()
+            st.markdown(f"共 {len(hits)} 个 CAS 号：命中 {n_hit} 个，未命中 {len(misses)} 个，"
+                        f"结果共 {len(batch_result)} 行")
+            if misses:
+                st.markdown("未命中：" + "、".join(misses))
+            st.dataframe(batch_result, hide_index=True)
+            csv_col, parquet_col = st.columns(2)
+            with csv_col:
+                st.download_button("下载结果（CSV）", data=batch_result.to_csv(index=False).encode("utf-8-sig"),
+                                   file_name="CAS批量查询结果.csv", mime="text/csv", key="dl_cas_batch_csv")
+            with parquet_col:
+                st.download_button("下载结果（Parquet）", data=frame_to_parquet_bytes(batch_result),
+                                   file_name="CAS批量查询结果.parquet", mime="application/octet-stream",
+                                   key="dl_cas_batch_parquet")
+
+    st.markdown("---")
+    conc_file = "毒性数据.xlsx"
+    if file_exists(conc_file):
+        with open(conc_file, "rb") as f:
+            st.download_button("下载毒性数据", data=f, file_name=conc_file)
+    back_col, _ = st.columns([1, 9])
+    with back_col:
+        if st.button("← 返回首页"):
+            goto("home")
+
+
+# -------------------------
+# 统计看板
+# -------------------------
+def page_stats():
+    st.header("浓度统计看板")
+    await_warmup("concentration")
+    dataset = load_concentration_dataset(CONCENTRATION_FILE)
+    if dataset is None or dataset.frame.empty:
+        st.warning("未加载到有效浓度数据，返回首页查看帮助或检查文件。")
+        return
+    notify_dataset_update("concentration", dataset)
+    cas_dataset = None
+    if file_exists(TOXICITY_FILE):
+        await_warmup("cas")
+        cas_dataset = load_cas_dataset(TOXICITY_FILE, TOXICITY_SHEET)
+        if cas_dataset is not None and ('CAS' not in cas_dataset.frame.columns or cas_dataset.frame.empty):
+            cas_dataset = None
+
+    group_name = st.radio("统计范围", list(STATS_GROUPS), horizontal=True, key="stats_group")
+    by = STATS_GROUPS[group_name]
+    if by is not None and by not in dataset.frame.columns:
+        st.warning(f"浓度数据缺少 {by} 列。")
+        return
+    with st.spinner("正在计算统计量…"), timed("分组统计"):
+        table = group_statistics(dataset, by, cas_dataset)
+    params = st.multiselect("参数（留空为全部）", dataset.meta["all_param_cols"], key="stats_params")
+    shown = table[table["参数"].isin(params)] if params else table
+    st.caption(f"共 {len(shown)} 行；样本数含未检出（ND 等）的样本，分位数、均值与最值只统计检出值"
+               + (f"；超标指浓度超过 PNEC（RQ ≥ 1）。{risk_unit_note()}" if "超标数" in table.columns
+                  else "；未加载毒性数据，不计超标"))
+    percent = st.column_config.NumberColumn(format="%.1f%%")
+    st.dataframe(shown.assign(**{col: shown[col] * 100 for col in ("检出率", "超标率") if col in shown.columns}),
+                 hide_index=True, column_config={"检出率": percent, "超标率": percent})
+    risk_key = risk_quotients(dataset, cas_dataset)["key"] if cas_dataset is not None else None
+    csv_bytes = dataset_derived(dataset, ("stats_csv", by, risk_key), lambda: table.to_csv(index=False).encode("utf-8-sig"))
+    st.download_button("下载统计表（CSV）", data=csv_bytes, file_name=f"浓度统计_{group_name}.csv",
+                       mime="text/csv", key="dl_stats_csv")
+
+    st.subheader("参数与水文指标的相关性（Spearman）")
+    categories = list(dataset.frame['分类'].cat.categories) if '分类' in dataset.frame.columns else []
+    category = st.selectbox("样本范围", [None] + categories, format_func=lambda c: "全部样本" if c is None else c,
+                            key="stats_category")
+    with timed("相关矩阵"):
+        corr = hydrology_correlation(dataset, category)
+    if corr.empty or corr.columns.empty:
+        st.info("浓度数据中没有水文指标列。")
+    else:
+        if params:
+            corr = corr.loc[params]
+        st.caption(f"配对样本少于 {STATS_MIN_PAIRS} 个的组合不计算相关系数")
+        st.dataframe(corr, column_config={col: st.column_config.NumberColumn(format="%.2f") for col in corr.columns})
+
+    st.markdown("---")
+    back_col, _ = st.columns([1, 9])
+    with back_col:
+        if st.button("← 返回首页"):
+            goto("home")
+
+
+# -------------------------
+# 主控制
+# -------------------------
+def show_diagnostics(entry):
+    with st.expander("性能诊断", expanded=True):
+        phases = pd.DataFrame(list(entry["phases"].items()), columns=["阶段", "耗时 (ms)"])
+        st.markdown(f"本次重跑总耗时 **{entry['total_ms']:.1f} ms**（页面：{entry['page']}）")
+        st.dataframe(phases, hide_index=True)
+        for name, value in entry["metrics"].items():
+            st.markdown(f"{name}：{value}")
+        st.caption(f"每次重跑的计时记录追加写入 {PERF_LOG_FILE}")
+
+
+# streamlit run 以 __main__ 执行本脚本；被基准测试等脚本导入时只提供函数，不渲染页面
+if __name__ == "__main__":
+    start_warmup()
+    data_watcher()
+    page = st.session_state.page
+    try:
+        if page == "home":
+            page_home()
+        elif page == "map":
+            page_map()
+        elif page == "cas":
+            page_cas()
+        elif page == "stats":
+            page_stats()
+        else:
+            page_home()
+    finally:
+        # 以 st.rerun() 结束的重跑（页面跳转、聚合视图变化、逐期播放）同样计时并记录
+        diagnostics = diagnostics_enabled()
+        perf_entry = perf_end(page, log=diagnostics or "DALIAN_PERF_LOG" in os.environ)
+    if diagnostics and perf_entry is not None:
+        show_diagnostics(perf_entry)
@@ -0,0 +1,80 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+from dalian_core import (CasIndex, cas_checksum_valid, normalize_cas, normalize_cas_series, parse_cas_list,
+                         split_cas_query)
+
+
+@pytest.mark.parametrize("value, expected", [
+    ("1912-24-9", "1912-24-9"),
+    ("1912249", "1912-24-9"),
+    ("0001912 249", "1912-24-9"),
+    ("1912－24－9", "1912-24-9"),
+    (" 50-00-0 ", "50-00-0"),
+    ("50000", "50-00-0"),
+])
+def test_normalize_cas(value, expected):
+    assert normalize_cas(value) == expected
+
+
+@pytest.mark.parametrize("value", ["", "abc", "1912-24-x", "1234", "000249", np.nan, None])
+def test_normalize_cas_invalid(value):
+    assert normalize_cas(value) is None
+
+
+def test_normalize_cas_series_matches_scalar():
+    values = ["1912-24-9", "0001912 249", "abc", "1234", "50000", np.nan]
+    result = normalize_cas_series(values)
+    assert result.where(result.notna(), None).tolist() == [normalize_cas(v) for v in values]
+
+
+@pytest.mark.parametrize("cas", ["1912-24-9", "50-00-0", "7732-18-5", "0001912 249"])
+def test_cas_checksum_valid(cas):
+    assert cas_checksum_valid(cas)
+
+
+@pytest.mark.parametrize("cas", ["1912-24-8", "50-00-1", "7732-18-4", "abc"])
+def test_cas_checksum_invalid(cas):
+    assert not cas_checksum_valid(cas)
+
+
+@pytest.fixture
+def index():
+    return CasIndex(pd.Series(["1912-24-9", "191-22-1", "19122-41-3", "50-00-0", "1912249", None, "bad"]))
+
+
+def test_lookup_returns_all_rows(index):
+    assert index.lookup("1912-24-9") == [0, 4]
+    assert index.lookup("0001912 249") == [0, 4]
+    assert index.lookup("50-00-0") == [3]
+    assert index.lookup("7732-18-5") == []
+    assert index.lookup("bad") == []
+
+
+def test_complete_digit_prefix(index):
+    # 不带连字符时按纯数字前缀匹配，结果按去掉连字符后的数字串排序
+    assert index.complete("191") == ["191-22-1", "19122-41-3", "1912-24-9"]
+    assert index.complete("0191") == ["191-22-1", "19122-41-3", "1912-24-9"]
+    assert index.complete("191", limit=2) == ["191-22-1", "19122-41-3"]
+    assert index.complete("999") == []
+    assert index.complete("") == []
+
+
+def test_complete_respects_hyphen_position(index):
+    assert index.complete("1912-") == ["1912-24-9"]
+    assert index.complete("191-") == ["191-22-1"]
+    assert index.complete("1912-24") == ["1912-24-9"]
+
+
+def test_split_cas_query_keeps_inner_spaces():
+    # 空格属于单个 CAS 号内部，不作为分隔符
+    assert split_cas_query("0001912 249") == ["0001912 249"]
+    assert split_cas_query("1912-24-9, 50-00-0；7732-18-5\n 0001912 249 ") == \
+        ["1912-24-9", "50-00-0", "7732-18-5", "0001912 249"]
+    assert split_cas_query(" ,\n") == []
+
+
+def test_parse_cas_list_splits_on_whitespace():
+    assert parse_cas_list("1912-24-9 50-00-0\n7732-18-5,1912-24-9、50-00-0") == \
+        ["1912-24-9", "50-00-0", "7732-18-5", "1912-24-9", "50-00-0"]
@@ -0,0 +1,66 @@
+import types
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from dalian_core import LOD_MAX_ZOOM, Dataset, lod_aggregates, lod_grid, visible_aggregates
+
+
+@pytest.fixture(scope="module")
+def dataset():
+    rng = np.random.default_rng(0)
+    n = 2000
+    values = rng.lognormal(0, 1, n)
+    values[rng.random(n) < 0.2] = np.nan
+    frame = pd.DataFrame({"纬度": rng.uniform(38.7, 39.2, n).astype(np.float32),
+                          "经度": rng.uniform(121.2, 122.0, n).astype(np.float32),
+                          "西马津": values.astype(np.float32)})
+    return Dataset(frame=frame, meta=types.MappingProxyType({"all_param_cols": ("西马津",)}), version=("lod",))
+
+
+@pytest.mark.parametrize("zoom", [3, 8, 11, 14])
+def test_aggregates_match_groupby(dataset, zoom):
+    aggregates = lod_aggregates(dataset, zoom, "西马津", threshold=1.5)
+    frame = dataset.frame.assign(cell=aggregates["inverse"]).astype({"西马津": float})
+    groups = frame.groupby("cell")
+    assert aggregates["count"].sum() == len(frame)
+    np.testing.assert_array_equal(aggregates["count"], groups.size())
+    np.testing.assert_array_equal(aggregates["n_valid"], groups["西马津"].count())
+    np.testing.assert_allclose(aggregates["mean"], groups["西马津"].mean(), rtol=1e-6)
+    np.testing.assert_allclose(aggregates["max"], groups["西马津"].max(), rtol=1e-6)
+    np.testing.assert_array_equal(aggregates["exceed"], groups["西马津"].apply(lambda v: (v > 1.5).sum()))
+    np.testing.assert_allclose(aggregates["lat"], groups["纬度"].mean(), rtol=1e-6)
+
+
+def test_grid_cells_nest_across_zooms(dataset):
+    for zoom in range(3, 15):
+        coarse, fine = lod_grid(dataset, zoom)["inverse"], lod_grid(dataset, zoom + 1)["inverse"]
+        parents = pd.Series(coarse).groupby(fine).nunique()
+        assert (parents == 1).all()
+        assert len(np.unique(fine)) >= len(np.unique(coarse))
+
+
+def test_threshold_does_not_rebuild_cached_part(dataset):
+    first = lod_aggregates(dataset, 10, "西马津", threshold=None)
+    second = lod_aggregates(dataset, 10, "西马津", threshold=0.5)
+    assert not first["exceed"].any()
+    assert second["exceed"].sum() == np.sum(dataset.frame["西马津"].to_numpy() > 0.5)
+    assert first["mean"] is second["mean"]
+
+
+def test_zoom_is_clamped(dataset):
+    assert lod_aggregates(dataset, LOD_MAX_ZOOM + 5, "西马津", None)["mean"] is \
+        lod_aggregates(dataset, LOD_MAX_ZOOM, "西马津", None)["mean"]
+
+
+def test_visible_aggregates_pads_bounds(dataset):
+    aggregates = lod_aggregates(dataset, 10, "西马津", None)
+    bounds = (38.9, 121.5, 39.0, 121.7)
+    visible = visible_aggregates(aggregates, bounds, pad=0.25)
+    assert "inverse" not in visible
+    assert ((visible["lat"] >= 38.875) & (visible["lat"] <= 39.025)).all()
+    assert ((visible["lng"] >= 121.45) & (visible["lng"] <= 121.75)).all()
+    inside = ((aggregates["lat"] >= 38.9) & (aggregates["lat"] <= 39.0) &
+              (aggregates["lng"] >= 121.5) & (aggregates["lng"] <= 121.7))
+    assert len(visible["count"]) >= inside.sum() > 0
@@ -0,0 +1,89 @@
+import os
+
+import pandas as pd
+import pytest
+
+from dalian_core import (begin_refresh, failed_refresh, get_dataset, invalidate_dataset, published_dataset,
+                         warm_dataset)
+
+
+class Loader:
+    """按文件内容返回数据帧；内容为 "broken" 时模拟读取到复制了一半的工作簿"""
+
+    def __init__(self):
+        self.calls = 0
+
+    def __call__(self, path):
+        self.calls += 1
+        with open(path) as f:
+            text = f.read()
+        if text == "broken":
+            raise ValueError("File is not a zip file")
+        return pd.DataFrame({"value": [text]}), {}
+
+
+def rewrite(path, text, mtime_ns):
+    with open(path, "w") as f:
+        f.write(text)
+    os.utime(path, ns=(mtime_ns, mtime_ns))
+
+
+@pytest.fixture
+def source(tmp_path):
+    path = str(tmp_path / "data.xlsx")
+    rewrite(path, "v1", 1_000_000_000_000)
+    yield path
+    invalidate_dataset("test")
+
+
+def test_failed_rebuild_keeps_published_version(source):
+    loader = Loader()
+    good = get_dataset("test", source, loader)
+    assert loader.calls == 1 and failed_refresh("test", source) is None
+
+    rewrite(source, "broken", 2_000_000_000_000)
+    with pytest.raises(ValueError):
+        get_dataset("test", source, loader)
+    assert loader.calls == 2
+
+    # 同一签名不再重复解析，各次访问都得到上一版本
+    for _ in range(3):
+        assert get_dataset("test", source, loader) is good
+    assert loader.calls == 2
+    assert isinstance(failed_refresh("test", source), ValueError)
+
+    # 文件再次变化后重试
+    rewrite(source, "v2", 3_000_000_000_000)
+    assert failed_refresh("test", source) is None
+    fresh = get_dataset("test", source, loader)
+    assert loader.calls == 3 and fresh.frame["value"][0] == "v2"
+    assert published_dataset("test", source) is fresh
+
+
+def test_failed_background_rebuild_keeps_published_version(source):
+    loader = Loader()
+    good = get_dataset("test", source, loader)
+
+    rewrite(source, "broken", 2_000_000_000_000)
+    begin_refresh("test", source)
+    with pytest.raises(ValueError):
+        warm_dataset("test", source, loader, None)
+    for _ in range(3):
+        assert get_dataset("test", source, loader) is good
+    assert loader.calls == 2
+
+
+def test_failed_first_load_is_not_reparsed(source):
+    loader = Loader()
+    rewrite(source, "broken", 2_000_000_000_000)
+    for _ in range(3):
+        with pytest.raises(ValueError):
+            get_dataset("test", source, loader)
+    assert loader.calls == 1
+    assert published_dataset("test", source) is None
+
+    # 显式失效同时清除失败记录
+    invalidate_dataset("test")
+    with pytest.raises(ValueError):
+        get_dataset("test", source, loader)
+    assert loader.calls == 2
@@ -0,0 +1,53 @@
+import types
+
+import numpy as np
+import pandas as pd
+import pytest
+
+import dalian_core
+from dalian_core import Dataset, risk_quotients, split_unit, unit_factor
+
+
+@pytest.mark.parametrize("column, expected", [
+    ("西马津(μg/L)", ("西马津", "μg/l")),
+    ("西马津（µg/L）", ("西马津", "µg/l")),
+    ("阿特拉津 [mg/L]", ("阿特拉津", "mg/l")),
+    ("阿特拉津 ng/L", ("阿特拉津", "ng/l")),
+    ("PNEC (ug/L)", ("pnec", "ug/l")),
+    ("HC5(g/L)", ("hc5", "g/l")),
+    ("吡虫啉", ("吡虫啉", None)),
+])
+def test_split_unit(column, expected):
+    assert split_unit(column) == expected
+
+
+def test_unit_factor_prefers_the_column_label(monkeypatch):
+    assert unit_factor("西马津(ng/L)") == 1.0
+    assert unit_factor("西马津(μg/L)") == 1e3
+    assert unit_factor("西马津(mg/L)") == 1e6
+    # 列名未标注单位时按 CONCENTRATION_UNIT
+    assert unit_factor("西马津") == 1.0
+    monkeypatch.setattr(dalian_core, "CONCENTRATION_UNIT", "μg/L")
+    assert unit_factor("西马津") == 1e3
+    assert unit_factor("西马津(ng/L)") == 1.0
+
+
+def dataset(frame, **meta):
+    return Dataset(frame=frame, meta=types.MappingProxyType(meta), version=(id(frame),))
+
+
+def test_risk_quotients_convert_units(monkeypatch, tmp_path):
+    monkeypatch.chdir(tmp_path)  # 不读取工作目录中的参数 CAS 对照表
+    params = ["西马津(μg/L)", "阿特拉津", "吡虫啉"]
+    conc = dataset(pd.DataFrame({"西马津(μg/l)": np.array([2.0, np.nan], dtype=np.float32),
+                                 "阿特拉津": np.array([50.0, 400.0], dtype=np.float32),
+                                 "吡虫啉": np.array([1.0, 1.0], dtype=np.float32)}),
+                   all_param_cols=params)
+    tox = dataset(pd.DataFrame({"CAS": ["122-34-9", "1912-24-9"], "中文名": ["西马津", "阿特拉津"],
+                                "PNEC (μg/L)": [1.0, 0.2]}))
+    risk = risk_quotients(conc, tox)
+    assert risk["params"] == ["西马津(μg/L)", "阿特拉津"]
+    assert risk["unmatched"] == ["吡虫啉"]
+    np.testing.assert_allclose(risk["pnec"], [1000.0, 200.0])
+    # 西马津 2 μg/L / 1 μg/L；阿特拉津按默认 ng/L：50 ng/L / 200 ng/L
+    np.testing.assert_allclose(risk["rq"], [[2.0, 0.25], [np.nan, 2.0]])
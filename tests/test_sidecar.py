@@ -0,0 +1,74 @@
+import os
+import shutil
+
+import pandas as pd
+import pytest
+
+import dalian_core
+from dalian_core import CACHE_DIR, read_concentration_cached
+
+WORKBOOK = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "浓度点位数据.xlsx")
+
+
+@pytest.fixture
+def workbook(tmp_path, monkeypatch):
+    path = str(tmp_path / "浓度点位数据.xlsx")
+    shutil.copyfile(WORKBOOK, path)
+    parse = dalian_core.parse_concentration_workbook
+    calls = []
+
+    def counting_parse(filepath):
+        calls.append(filepath)
+        return parse(filepath)
+    monkeypatch.setattr(dalian_core, "parse_concentration_workbook", counting_parse)
+    return path, calls
+
+
+def sidecars(path):
+    return sorted(os.listdir(os.path.join(os.path.dirname(path), CACHE_DIR)))
+
+
+def test_sidecar_hit_returns_same_frame(workbook):
+    path, calls = workbook
+    parsed, meta = read_concentration_cached(path)
+    cached, cached_meta = read_concentration_cached(path)
+    assert len(calls) == 1
+    assert len(sidecars(path)) == 1
+    pd.testing.assert_frame_equal(cached, parsed)
+    assert cached_meta == meta
+
+
+def test_sidecar_invalidated_when_source_changes(workbook):
+    path, calls = workbook
+    read_concentration_cached(path)
+    old = sidecars(path)
+    stat = os.stat(path)
+    os.utime(path, ns=(stat.st_atime_ns, stat.st_mtime_ns + 1_000_000_000))
+    read_concentration_cached(path)
+    assert len(calls) == 2
+    # 新版本写入后旧版本缓存被清理
+    assert len(sidecars(path)) == 1 and sidecars(path) != old
+    read_concentration_cached(path)
+    assert len(calls) == 2
+
+
+def test_sidecar_invalidated_by_format_version(workbook, monkeypatch):
+    path, calls = workbook
+    read_concentration_cached(path)
+    monkeypatch.setattr(dalian_core, "CACHE_FORMAT_VERSION", dalian_core.CACHE_FORMAT_VERSION + 1)
+    read_concentration_cached(path)
+    assert len(calls) == 2
+
+
+def test_corrupt_sidecar_falls_back_to_workbook(workbook):
+    path, calls = workbook
+    parsed, _ = read_concentration_cached(path)
+    sidecar = os.path.join(os.path.dirname(path), CACHE_DIR, sidecars(path)[0])
+    with open(sidecar, "wb") as f:
+        f.write(b"not an arrow file")
+    recovered, _ = read_concentration_cached(path)
+    assert len(calls) == 2
+    pd.testing.assert_frame_equal(recovered, parsed)
+    # 重新解析后缓存被重写，之后再次命中
+    read_concentration_cached(path)
+    assert len(calls) == 2
@@ -0,0 +1,45 @@
+import numpy as np
+import pytest
+
+from dalian_core import CLICK_TOLERANCE, SiteIndex
+
+
+def brute_nearest(index, lat, lng):
+    dists = np.hypot(index.xy[:, 0] - lat, index.xy[:, 1] - lng * index.lng_scale)
+    return int(np.argmin(dists)), float(dists.min())
+
+
+def test_colocated_samples_share_a_site():
+    index = SiteIndex([38.9, 38.9, 39.0, 38.9000001], [121.6, 121.6, 121.7, 121.6])
+    assert len(index.coords) == 2
+    site, dist = index.nearest(38.9, 121.6)
+    assert dist == pytest.approx(0.0)
+    assert sorted(index.rows_at(site).tolist()) == [0, 1, 3]
+    other, _ = index.nearest(39.0, 121.7)
+    assert index.rows_at(other).tolist() == [2]
+
+
+def test_nearest_matches_brute_force():
+    rng = np.random.default_rng(0)
+    lats = rng.uniform(38.7, 39.2, 500)
+    lngs = rng.uniform(121.2, 122.0, 500)
+    index = SiteIndex(lats, lngs)
+    # 查询点既包括点位范围内，也包括远离全部点位的位置
+    queries = np.column_stack([rng.uniform(38.0, 40.0, 200), rng.uniform(120.5, 122.7, 200)])
+    for lat, lng in queries:
+        site, dist = index.nearest(lat, lng)
+        expected_site, expected_dist = brute_nearest(index, lat, lng)
+        assert dist == pytest.approx(expected_dist)
+        assert site == expected_site or dist == pytest.approx(expected_dist)
+
+
+def test_nearest_respects_max_distance():
+    index = SiteIndex([38.9, 39.0], [121.6, 121.7])
+    site, dist = index.nearest(38.905, 121.6, max_distance=CLICK_TOLERANCE)
+    assert site is not None and dist == pytest.approx(0.005)
+    assert index.nearest(38.95, 121.65, max_distance=CLICK_TOLERANCE) == (None, float("inf"))
+
+
+def test_empty_index():
+    index = SiteIndex([], [])
+    assert index.nearest(38.9, 121.6) == (None, float("inf"))
@@ -0,0 +1,38 @@
+import types
+
+import pytest
+
+import dalian_core
+
+
+@pytest.fixture
+def page_url(monkeypatch):
+    monkeypatch.setattr(dalian_core, "TILE_CACHE_ENABLED", True)
+    monkeypatch.setattr(dalian_core, "TILE_PUBLIC_URL", "")
+    monkeypatch.setattr(dalian_core, "tile_server", lambda: None)
+
+    def set_url(url):
+        monkeypatch.setattr(dalian_core.st, "context", types.SimpleNamespace(url=url))
+    return set_url
+
+
+def test_public_url_follows_browser_host(page_url):
+    page_url("http://10.0.0.5:8501/")
+    port = dalian_core.TILE_SERVER_PORT
+    assert dalian_core.basemap_tiles_url() == f"http://10.0.0.5:{port}/tiles/{{z}}/{{x}}/{{y}}"
+    page_url("http://[fe80::1]:8501/")
+    assert dalian_core.tile_public_url() == f"http://[fe80::1]:{port}/tiles/{{z}}/{{x}}/{{y}}"
+
+
+def test_https_page_without_public_url_uses_upstream(page_url, monkeypatch):
+    page_url("https://monitor.example.org/")
+    assert dalian_core.tile_public_url() is None
+    assert dalian_core.basemap_tiles_url() == dalian_core.TILE_UPSTREAM_URL
+    monkeypatch.setattr(dalian_core, "TILE_PUBLIC_URL", "https://monitor.example.org/tiles/{z}/{x}/{y}")
+    assert dalian_core.basemap_tiles_url() == "https://monitor.example.org/tiles/{z}/{x}/{y}"
+
+
+def test_cache_disabled_uses_upstream(page_url, monkeypatch):
+    monkeypatch.setattr(dalian_core, "TILE_CACHE_ENABLED", False)
+    page_url("http://10.0.0.5:8501/")
+    assert dalian_core.basemap_tiles_url() == dalian_core.TILE_UPSTREAM_URL
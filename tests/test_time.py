@@ -0,0 +1,55 @@
+import numpy as np
+import pandas as pd
+
+from dalian_core import CampaignIndex, period_labels
+
+
+def campaigns():
+    labels = ["2019年5月", "2018", "2019年5月", None, "2018", "2018年9月"]
+    dates = ["2019-05-10", "2018-01-01", "2019-05-10", "2019-05-10", "2018-01-01", "2018-09-03"]
+    matrix = np.array([[1.0, np.nan],
+                       [2.0, 5.0],
+                       [3.0, np.nan],
+                       [9.0, 9.0],
+                       [np.nan, 4.0],
+                       [6.0, 7.0]], dtype=np.float32)
+    return CampaignIndex(labels, dates, matrix)
+
+
+def test_periods_sorted_by_date():
+    index = campaigns()
+    assert len(index) == 3
+    assert index.labels == ["2018", "2018年9月", "2019年5月"]
+    assert [d.strftime("%Y-%m-%d") for d in index.dates] == ["2018-01-01", "2018-09-03", "2019-05-10"]
+    assert index.period("2018年9月") == 1
+    assert index.period("2020") is None
+
+
+def test_rows_per_period():
+    index = campaigns()
+    assert [index.rows_in(p).tolist() for p in range(len(index))] == [[1, 4], [5], [0, 2]]
+    # 无标签或无日期的样本不归入任何时期
+    assert index.undated.tolist() == [3]
+
+
+def test_param_ranges_ignore_missing_values():
+    index = campaigns()
+    np.testing.assert_array_equal(index.param_min, [[2.0, 4.0], [6.0, 7.0], [1.0, np.nan]])
+    np.testing.assert_array_equal(index.param_max, [[2.0, 5.0], [6.0, 7.0], [3.0, np.nan]])
+    assert index.param_min.dtype == np.float32
+
+
+def test_no_dated_samples():
+    index = CampaignIndex([None, "x"], [None, None], np.ones((2, 1), dtype=np.float32))
+    assert len(index) == 0
+    assert index.undated.tolist() == [0, 1]
+    assert index.param_min.shape == (0, 1)
+
+
+def test_period_labels_merge_by_month_and_year():
+    text = pd.Series(["2019-05-10", "2019-05-21", "2018", None])
+    dates = pd.Series(["2019-05-10", "2019-05-21", "2018-01-01", None])
+    assert period_labels(text, dates).tolist() == text.tolist()
+    # 只有年份的样本按月合并时单独成期，不归入 1 月
+    assert period_labels(text, dates, "M").tolist() == ["2019-05", "2019-05", "2018", None]
+    assert period_labels(text, dates, "Y").tolist() == ["2019", "2019", "2018", None]
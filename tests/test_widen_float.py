@@ -0,0 +1,21 @@
+import numpy as np
+
+from dalian_core import widen_float
+
+
+def test_widen_float_matches_shortest_repr():
+    rng = np.random.default_rng(0)
+    values = np.concatenate([rng.uniform(0, 1000, 2000), rng.lognormal(0, 8, 2000), rng.uniform(38, 40, 2000),
+                             rng.uniform(1e15, 1e21, 500), rng.uniform(1e-15, 1e-10, 500), -rng.uniform(0, 1, 500),
+                             [0.0, -0.0, np.nan, np.inf, -np.inf, 0.1234, 121.123456]]).astype(np.float32)
+    expected = np.array([float(str(v)) for v in values])
+    result = widen_float(values)
+    assert result.dtype == np.float64
+    np.testing.assert_array_equal(result, expected)
+    assert widen_float(np.float32(0.1234)).tolist() == 0.1234
+
+
+def test_widen_float_keeps_shape_and_other_dtypes():
+    matrix = np.array([[0.1, np.nan], [2.5, 3.3]], dtype=np.float32)
+    np.testing.assert_array_equal(widen_float(matrix), [[0.1, np.nan], [2.5, 3.3]])
+    np.testing.assert_array_equal(widen_float([1, 2]), [1.0, 2.0])